@@ -0,0 +1,98 @@
+"""
+Code generation benchmark: generate_spark_code on a synthetic warehouse spec.
+
+    python benchmarks/codegen.py [--tables 500] [--joins 1000] [--repeat 20]
+
+Times generation into a string, into a list of fragments and straight into a file.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from spark_code_generator import generate_spark_code  # noqa: E402
+
+JOIN_TYPES = ["inner", "inner", "left"]
+
+
+def synthetic_spec(num_tables, num_joins, num_transformations=None):
+    """
+    A fact table joined to dimensions that are themselves joined to further
+    dimensions, with sizes, row counts, table predicates and a global predicate.
+    Defaults to one transformation per 10 tables.
+    """
+    tables = [{
+        "name": f"Table_{i}",
+        "schema": "Sales_DW",
+        "alias": f"t{i}",
+        "predicate": f"t{i}.Active = 1" if i % 5 == 0 else "",
+        "size_gb": (i % 50) * 0.5 + 0.01,
+        "rows": (i % 50 + 1) * 100000,
+    } for i in range(num_tables)]
+    joins = []
+    for j in range(num_joins if num_tables > 1 else 0):
+        right = 1 + j % (num_tables - 1)
+        left = right // 2
+        joins.append({
+            "left_table": f"t{left}",
+            "type": JOIN_TYPES[j % len(JOIN_TYPES)],
+            "right_table": f"t{right}",
+            "conditions": f"col('t{left}.Key_{right}') == col('t{right}.Key_{right}')",
+        })
+    if num_transformations is None:
+        num_transformations = (num_tables + 9) // 10
+    transformations = [{"output_column": f"Value_{i}", "expression": f"t{i % num_tables}.Amount * 2"} for i in range(num_transformations)]
+    return dict(
+        tables_json=json.dumps(tables),
+        joins_json=json.dumps(joins),
+        predicates="t0.Quantity > 0 AND t1.Region = 'EU'",
+        spark_configs=None,
+        output_table="Fact_Benchmark",
+        output_schema="Sales_DW",
+        transformations_json=json.dumps(transformations),
+        write_mode="overwrite",
+        partition_columns="",
+        partition_values="",
+    )
+
+
+def time_call(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tables", type=int, default=500)
+    parser.add_argument("--joins", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    spec = synthetic_spec(args.tables, args.joins)
+    size = len(generate_spark_code(**spec))
+
+    with tempfile.TemporaryFile("w") as f:
+        cases = [
+            ("string", lambda: generate_spark_code(**spec)),
+            ("list of fragments", lambda: generate_spark_code(**spec, out=[])),
+            ("file", lambda: (f.seek(0), generate_spark_code(**spec, out=f))),
+        ]
+        print(f"{args.tables} tables, {args.joins} joins, {size:,} characters of code")
+        print(f"{'output':<20}{'median (ms)':>12}{'min (ms)':>12}")
+        for name, func in cases:
+            timings = time_call(func, args.repeat)
+            print(f"{name:<20}{statistics.median(timings) * 1000:>12.1f}{min(timings) * 1000:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Load test for the JSON HTTP API: latency percentiles and throughput per endpoint.
+
+    python benchmarks/load_test.py [--clients 100] [--requests 2000] [--workers 4] [--url http://host:8001]
+
+Without --url the API is started in this process on a free port. Each client
+thread keeps one connection open and sends requests back to back.
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+from urllib.parse import urlparse
+
+import numpy as np
+from codegen import synthetic_spec
+
+from serving import DEFAULT_WORKERS, WorkerPool, start_api_server
+
+JOB_SPEC = {
+    "num_tables": 3,
+    "table_sizes": "120,40,5",
+    "join_complexities": "6,4",
+    "transformation_complexities": "5",
+    "data_skews": "8,2,1",
+    "use_spot_instances": True,
+    "sla_requirements": "Medium",
+    "workload_type": "General",
+    "enable_auto_termination": True,
+    "recency": 5,
+    "frequency": 7,
+}
+
+
+def request_bodies(tables):
+    spec = synthetic_spec(tables, tables * 2)
+    params = {
+        "tables": json.loads(spec["tables_json"]),
+        "joins": json.loads(spec["joins_json"]),
+        "transformations": json.loads(spec["transformations_json"]),
+        **{key: spec[key] for key in ("predicates", "output_table", "output_schema", "write_mode", "partition_columns", "partition_values")},
+    }
+    return {
+        "/recommend": JOB_SPEC,
+        "/batch": {"jobs": [dict(JOB_SPEC, frequency=i % 10) for i in range(50)]},
+        "/generate": {"params": params, "spec": JOB_SPEC},
+    }
+
+
+def run_clients(host, port, path, body, clients, total):
+    """
+    ``total`` POSTs of ``body`` to ``path`` spread over ``clients`` threads.
+    Returns (latencies in seconds, error count, wall time).
+    """
+    payload = json.dumps(body).encode()
+    headers = {"Content-Type": "application/json"}
+    latencies, errors = [], []
+    remaining = iter(range(total))
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(clients + 1)
+
+    def client():
+        connection = http.client.HTTPConnection(host, port, timeout=120)
+        start_barrier.wait()
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    break
+            start = time.perf_counter()
+            try:
+                connection.request("POST", path, payload, headers)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection(host, port, timeout=120)
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                (latencies if ok else errors).append(elapsed)
+        connection.close()
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    start_barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return latencies, len(errors), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", help="API to test (default: start one in this process)")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per endpoint")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Worker processes of the in-process API")
+    parser.add_argument("--tables", type=int, default=20, help="Tables in the /generate job")
+    parser.add_argument("--endpoints", default="/recommend,/batch,/generate")
+    args = parser.parse_args()
+
+    server = pool = None
+    if args.url:
+        url = urlparse(args.url)
+        host, port = url.hostname, url.port or 80
+    else:
+        pool = WorkerPool(args.workers)
+        server = start_api_server("127.0.0.1", 0, pool, max_pending=max(args.clients, 1))
+        host, port = server.server_address
+
+    bodies = request_bodies(args.tables)
+    print(f"{args.clients} clients, {args.requests} requests per endpoint against {host}:{port}")
+    print(f"{'endpoint':<12}{'p50 (ms)':>10}{'p99 (ms)':>10}{'max (ms)':>10}{'req/s':>10}{'errors':>8}")
+    try:
+        for path in args.endpoints.split(","):
+            # One untimed round so worker start-up is not counted
+            run_clients(host, port, path, bodies[path], min(args.clients, 4), 4)
+            latencies, errors, wall = run_clients(host, port, path, bodies[path], args.clients, args.requests)
+            p50, p99, worst = np.percentile(latencies, [50, 99, 100]) * 1000 if latencies else (np.nan,) * 3
+            print(f"{path:<12}{p50:>10.1f}{p99:>10.1f}{worst:>10.1f}{len(latencies) / wall:>10.1f}{errors:>8}")
+    finally:
+        if server is not None:
+            server.shutdown()
+            pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Startup-time benchmark: headless CLI vs. importing the Gradio UI module.
+
+    python benchmarks/startup_time.py [--repeat 5]
+
+Each case runs in a fresh interpreter so import caches do not leak between runs.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SPEC = '{"num_tables": 3, "table_sizes": "10,20,30", "join_complexities": "5", "transformation_complexities": "5", "data_skews": "5"}'
+
+CASES = [
+    ("import cli", [sys.executable, "-c", "import cli"]),
+    ("import visial_code_gen", [sys.executable, "-c", "import visial_code_gen"]),
+    ("cli recommend", [sys.executable, "-m", "cli", "recommend", "--spec", "{spec}"]),
+    ("gradio UI build", [sys.executable, "-c", "import visial_code_gen; visial_code_gen.create_interface()"]),
+]
+
+
+def time_command(command, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(command, cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=False)
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            return None, result.stderr.strip().splitlines()[-1]
+        timings.append(elapsed)
+    return timings, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        f.write(SPEC)
+        spec_path = f.name
+
+    try:
+        print(f"{'case':<26}{'median (ms)':>12}{'min (ms)':>12}")
+        for name, command in CASES:
+            command = [part.replace("{spec}", spec_path) for part in command]
+            timings, error = time_command(command, args.repeat)
+            if timings is None:
+                print(f"{name:<26}{'unavailable':>12}  ({error})")
+                continue
+            print(f"{name:<26}{statistics.median(timings) * 1000:>12.1f}{min(timings) * 1000:>12.1f}")
+    finally:
+        os.unlink(spec_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Benchmark suite for the recommender and code generator hot paths.
+
+    python benchmarks/suite.py                          # run and print
+    python benchmarks/suite.py --save main              # also save benchmarks/baselines/main.json
+    python benchmarks/suite.py --compare main           # exit 1 on a regression past --threshold
+    python benchmarks/suite.py --filter generate_spark_code --quick
+
+Every case runs on synthetic inputs at 1, 20, 200 and 2,000 tables (0 to 1,000
+joins and transformations), built from a fixed seed. Time is the median of
+several rounds (regressions are judged on the fastest round); peak memory is
+measured separately with tracemalloc, since tracing slows the code down. Baselines are only comparable on the machine and
+Python version that produced them.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from codegen import REPO_DIR, synthetic_spec
+
+from resource_recommender import (
+    determine_workload_type,
+    recommend_resources,
+    recommend_resources_batch,
+)
+from spark_code_generator import generate_spark_code
+from utils import parse_list_input
+
+BASELINE_DIR = os.path.join(REPO_DIR, "benchmarks", "baselines")
+
+# (tables, joins, transformations)
+SCALES = [(1, 0, 0), (20, 20, 20), (200, 200, 200), (2000, 1000, 1000)]
+
+# Jobs in the batch recommender case, per scale (about 20,000 list values at the larger scales)
+BATCH_JOBS = {1: 1000, 20: 1000, 200: 100, 2000: 10}
+
+# Jobs in the mixed batch case (1 to 8 tables each, half on spot): enough distinct fleets and layouts
+# that the cluster optimizer and the per-job Spark configs show up next to the list parsing
+MIXED_BATCH_JOBS = 50000
+
+DEFAULT_THRESHOLD = 0.25
+
+SEED = 20240601
+
+
+def _values(rng, count, low, high):
+    return ",".join(str(rng.randint(low, high)) for _ in range(max(1, count)))
+
+
+def synthetic_job_spec(num_tables, num_joins, num_transformations, rng):
+    """
+    Recommender inputs with one comma-separated value per table, join and transformation.
+    """
+    return {
+        "num_tables": num_tables,
+        "table_sizes": _values(rng, num_tables, 1, 2000),
+        "join_complexities": _values(rng, num_joins, 1, 10),
+        "transformation_complexities": _values(rng, num_transformations, 1, 10),
+        "data_skews": _values(rng, num_tables, 1, 10),
+        "recency": rng.randint(0, 10),
+        "frequency": rng.randint(0, 10),
+    }
+
+
+def build_cases():
+    """
+    ``(name, func)`` for every benchmark case; inputs are built up front.
+    """
+    rng = random.Random(SEED)
+    cases = []
+    for num_tables, num_joins, num_transformations in SCALES:
+        label = f"t{num_tables}_j{num_joins}_x{num_transformations}"
+        job = synthetic_job_spec(num_tables, num_joins, num_transformations, rng)
+        workload_args = (job["num_tables"], job["table_sizes"], job["join_complexities"], job["transformation_complexities"],
+                         job["data_skews"], job["recency"], job["frequency"])
+        recommend_args = (job["num_tables"], job["table_sizes"], job["join_complexities"], job["transformation_complexities"],
+                          job["data_skews"], True, True, "General", True, job["recency"], job["frequency"])
+        batch = [synthetic_job_spec(num_tables, num_joins, num_transformations, rng) for _ in range(BATCH_JOBS[num_tables])]
+        batch_columns = {name: [spec[name] for spec in batch] for name in batch[0]}
+        spec = synthetic_spec(num_tables, num_joins, num_transformations)
+
+        cases.extend([
+            (f"parse_list_input[{label}]", lambda text=job["table_sizes"]: parse_list_input(text)),
+            (f"determine_workload_type[{label}]", lambda args=workload_args: determine_workload_type(*args)),
+            (f"recommend_resources[{label}]", lambda args=recommend_args: recommend_resources(*args)),
+            (f"recommend_resources_batch[{label}x{len(batch)}]", lambda columns=batch_columns: recommend_resources_batch(columns)),
+            (f"generate_spark_code[{label}]", lambda spec=spec: generate_spark_code(**spec)),
+        ])
+
+    batch = [synthetic_job_spec(rng.randint(1, 8), 3, 3, rng) for _ in range(MIXED_BATCH_JOBS)]
+    batch_columns = {name: [spec[name] for spec in batch] for name in batch[0]}
+    batch_columns["use_spot_instances"] = [rng.random() < 0.5 for _ in batch]
+    cases.append((f"recommend_resources_batch[mixed_x{MIXED_BATCH_JOBS}]",
+                  lambda columns=batch_columns: recommend_resources_batch(columns)))
+    return cases
+
+
+def measure_time(func, min_rounds=5, min_seconds=0.2):
+    """
+    Median and minimum seconds per call over at least ``min_rounds`` rounds and
+    ``min_seconds`` of total time.
+    """
+    func()  # Warm-up: imports, caches, lazily compiled regexes
+    timings = []
+    start = time.perf_counter()
+    while len(timings) < min_rounds or time.perf_counter() - start < min_seconds:
+        begin = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - begin)
+        if len(timings) >= 1000:
+            break
+    return statistics.median(timings), min(timings), len(timings)
+
+
+def measure_peak_memory(func):
+    """
+    Peak bytes allocated by one call, as seen by tracemalloc.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(cases, quick=False):
+    results = {}
+    for name, func in cases:
+        median, best, rounds = measure_time(func, min_rounds=3 if quick else 5, min_seconds=0.05 if quick else 0.2)
+        peak = measure_peak_memory(func)
+        results[name] = {"median_s": median, "min_s": best, "rounds": rounds, "peak_bytes": peak}
+        print(f"{name:<62}{median * 1000:>11.3f}{best * 1000:>11.3f}{peak / 1024:>13,.0f}", flush=True)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Regressions of more than ``threshold`` (a fraction) in time or peak memory
+    against the baseline, as printable lines.
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline["results"].get(name)
+        if reference is None:
+            continue
+        # The fastest round is the least noisy time to compare
+        for metric, unit, scale in (("min_s", "ms", 1000), ("peak_bytes", "KiB", 1 / 1024)):
+            if reference[metric] and result[metric] > reference[metric] * (1 + threshold):
+                change = result[metric] / reference[metric] - 1
+                regressions.append(f"{name} {metric}: {reference[metric] * scale:,.3f} -> {result[metric] * scale:,.3f} {unit} (+{change:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--save", metavar="NAME", help="Save the results as benchmarks/baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="Compare with benchmarks/baselines/NAME.json")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown / memory growth as a fraction (default: %(default)s)")
+    parser.add_argument("--filter", default="", help="Only run cases whose name contains this text")
+    parser.add_argument("--quick", action="store_true", help="Fewer rounds, for a smoke run")
+    args = parser.parse_args()
+
+    cases = [(name, func) for name, func in build_cases() if args.filter in name]
+    print(f"{'case':<62}{'median ms':>11}{'min ms':>11}{'peak KiB':>13}")
+    results = run(cases, args.quick)
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save}.json")
+        with open(path, "w") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(), "results": results}, f, indent=2)
+        print(f"Baseline saved to {path}")
+
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json"), "r") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%} against {args.compare}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%} against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
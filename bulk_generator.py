@@ -0,0 +1,255 @@
+"""
+Bulk generation: turn a directory tree of saved parameter files into Spark jobs.
+
+    python -m cli bulk --input saved_jobs/ --output generated/ [--workers 8]
+
+Every parameter file (``*_job.json`` or ``saved_parameters_*.json``) gets a
+``<name>.py`` job and a ``<name>.recommendation.json`` next to it in the output
+tree. The recommendations for all files are computed in one vectorized batch;
+code generation runs in a process pool and each worker streams its job straight
+to disk. A manifest records the content hash of every input; files whose hash
+(including the generator sources and options) is unchanged since the last run
+are skipped.
+"""
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime
+
+from resource_recommender import recommend_resources_batch, recommendations_from_batch
+from spark_code_generator import generate_spark_code
+from utils import is_parameter_file
+from workload_model import load_workload_model
+
+MANIFEST_NAME = "manifest.json"
+
+# Files that are part of every content hash, so template or price changes regenerate everything
+GENERATOR_MODULES = ("spark_code_generator.py", "query_planner.py", "resource_recommender.py", "cluster_optimizer.py",
+                     "executor_sizing.py", "instance_catalog.json", "workload_model.py", "bulk_generator.py")
+
+# Recommender inputs used when a parameter file has no "job_spec" (the UI defaults)
+DEFAULT_JOB_SPEC = {
+    "table_sizes": "10",
+    "join_complexities": "5",
+    "transformation_complexities": "5",
+    "data_skews": "5",
+    "use_spot_instances": False,
+    "sla_requirements": False,
+    "workload_type": "General",
+    "enable_auto_termination": False,
+    "recency": 5,
+    "frequency": 5,
+}
+
+
+def json_text(value, default="[]"):
+    """
+    Saved parameters hold the raw gr.JSON values, which are either JSON strings
+    or already decoded lists.
+    """
+    if value is None or value == "":
+        return default
+    if isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+
+def generate_from_parameters(params, recommendation=None, out=None, **kwargs):
+    """
+    Generate the Spark job for a saved parameter dict (see ``utils.save_parameters``).
+    """
+    return generate_spark_code(
+        json_text(params.get("tables")),
+        json_text(params.get("joins")),
+        params.get("predicates", ""),
+        recommendation,
+        params.get("output_table", ""),
+        params.get("output_schema", ""),
+        json_text(params.get("transformations")),
+        params.get("write_mode", "overwrite"),
+        params.get("partition_columns", ""),
+        params.get("partition_values", ""),
+        out=out,
+        **kwargs,
+    )
+
+
+def job_spec_from_parameters(params):
+    """
+    Recommender inputs for a saved job: its "job_spec" entry when present,
+    otherwise the table count plus the tables' size and skew estimates when every
+    table has one, with the UI defaults for the rest.
+    """
+    tables = json.loads(json_text(params.get("tables")))
+    spec = dict(DEFAULT_JOB_SPEC, num_tables=max(1, len(tables)))
+    for key, column in (("size_gb", "table_sizes"), ("skew", "data_skews")):
+        values = [table.get(key) for table in tables]
+        if values and all(value not in (None, "") for value in values):
+            spec[column] = ",".join(str(value) for value in values)
+    spec.update(params.get("job_spec") or {})
+    return spec
+
+
+def find_parameter_files(root):
+    """
+    Parameter files under ``root``, as sorted paths relative to it.
+    """
+    found = []
+    for directory, _, files in os.walk(root):
+        for name in files:
+            if is_parameter_file(name):
+                found.append(os.path.relpath(os.path.join(directory, name), root))
+    return sorted(found)
+
+
+def generator_fingerprint(options=None):
+    """
+    Hash of the generator sources and the generation options.
+    """
+    digest = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for module in GENERATOR_MODULES:
+        with open(os.path.join(here, module), "rb") as f:
+            digest.update(f.read())
+    # The workload model file is optional, so its loaded rules are hashed rather than the file
+    digest.update(json.dumps(load_workload_model().to_dict(), sort_keys=True).encode())
+    digest.update(json.dumps(options or {}, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def _load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {"jobs": {}}
+
+
+def _output_paths(output_dir, relative_path):
+    stem = os.path.splitext(relative_path)[0]
+    return os.path.join(output_dir, stem + ".py"), os.path.join(output_dir, stem + ".recommendation.json")
+
+
+def _generate_job(task):
+    """
+    Worker: generate one job and its recommendation file. Runs in the process pool.
+    """
+    relative_path, params, recommendation, code_path, recommendation_path, options = task
+    start = time.perf_counter()
+    try:
+        os.makedirs(os.path.dirname(code_path) or ".", exist_ok=True)
+        with open(code_path, "w") as f:
+            generate_from_parameters(params, recommendation, out=f, **options)
+        with open(recommendation_path, "w") as f:
+            json.dump(recommendation._asdict(), f, indent=2)
+        return relative_path, None, time.perf_counter() - start
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError) as e:
+        return relative_path, f"{type(e).__name__}: {e}", time.perf_counter() - start
+
+
+def _recommend(pending, jobs):
+    """
+    Recommendations for the pending jobs in one vectorized batch. If the batch
+    rejects an input, each job is recommended on its own so that only the bad
+    ones are reported (in ``jobs``) and skipped.
+    """
+    specs = [spec for *_, spec in pending]
+    names = set().union(*specs)
+    try:
+        columns = {name: [spec.get(name, DEFAULT_JOB_SPEC.get(name)) for spec in specs] for name in names}
+        recommendations = recommendations_from_batch(recommend_resources_batch(columns))
+        return {relative_path: recommendation for (relative_path, *_), recommendation in zip(pending, recommendations)}
+    except ValueError:
+        pass
+
+    recommendations = {}
+    for (relative_path, *_), spec in zip(pending, specs):
+        try:
+            columns = {name: [value] for name, value in spec.items()}
+            recommendations[relative_path] = recommendations_from_batch(recommend_resources_batch(columns))[0]
+        except ValueError as e:
+            jobs[relative_path] = {"status": "error", "error": f"Invalid recommender inputs: {e}"}
+    return recommendations
+
+
+def bulk_generate(input_dir, output_dir, workers=None, force=False, options=None, chunksize=8):
+    """
+    Generate code and recommendations for every parameter file under ``input_dir``.
+
+    ``options`` are keyword arguments for ``generate_spark_code``. Files whose
+    content hash matches the previous manifest (and whose outputs still exist)
+    are skipped unless ``force`` is set. Writes ``manifest.json`` to
+    ``output_dir`` and returns it.
+    """
+    options = options or {}
+    fingerprint = generator_fingerprint(options)
+    previous = _load_manifest(output_dir)["jobs"]
+    jobs = {}
+
+    pending = []
+    for relative_path in find_parameter_files(input_dir):
+        with open(os.path.join(input_dir, relative_path), "rb") as f:
+            content = f.read()
+        content_hash = hashlib.sha256(content + fingerprint.encode()).hexdigest()
+        code_path, recommendation_path = _output_paths(output_dir, relative_path)
+        entry = previous.get(relative_path)
+        if (not force and entry and entry["hash"] == content_hash and entry["status"] != "error"
+                and os.path.exists(code_path) and os.path.exists(recommendation_path)):
+            jobs[relative_path] = dict(entry, status="unchanged")
+            continue
+        try:
+            params = json.loads(content)
+        except ValueError as e:
+            jobs[relative_path] = {"hash": content_hash, "status": "error", "error": f"Invalid JSON: {e}"}
+            continue
+        try:
+            spec = job_spec_from_parameters(params)
+        except (AttributeError, TypeError, ValueError) as e:
+            # Valid JSON that is not a parameter object, or a malformed "tables" string
+            jobs[relative_path] = {"hash": content_hash, "status": "error", "error": f"Invalid parameters: {type(e).__name__}: {e}"}
+            continue
+        pending.append((relative_path, params, content_hash, code_path, recommendation_path, spec))
+
+    if pending:
+        recommendations = _recommend(pending, jobs)
+        tasks = [(relative_path, params, recommendations[relative_path], code_path, recommendation_path, options)
+                 for relative_path, params, _, code_path, recommendation_path, _ in pending if relative_path in recommendations]
+        hashes = {relative_path: content_hash for relative_path, _, content_hash, *_ in pending}
+        for relative_path in hashes.keys() & jobs.keys():
+            jobs[relative_path]["hash"] = hashes[relative_path]
+
+        # workers=1 runs in this process, which avoids the pool start-up for small runs
+        with (nullcontext() if workers == 1 else ProcessPoolExecutor(max_workers=workers)) as executor:
+            results = map(_generate_job, tasks) if executor is None else executor.map(_generate_job, tasks, chunksize=chunksize)
+            for (relative_path, error, seconds), task in zip(results, tasks):
+                jobs[relative_path] = {
+                    "hash": hashes[relative_path],
+                    "status": "error" if error else "generated",
+                    "code": os.path.relpath(task[3], output_dir),
+                    "recommendation": os.path.relpath(task[4], output_dir),
+                    "workload_type": task[2].workload_type,
+                    "instance_type": task[2].instance_type,
+                    "workers": task[2].workers,
+                    "hourly_cost": task[2].hourly_cost,
+                    "seconds": round(seconds, 4),
+                }
+                if error:
+                    jobs[relative_path]["error"] = error
+
+    counts = {}
+    for entry in jobs.values():
+        counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+    manifest = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "generator": fingerprint,
+        "input_dir": os.path.abspath(input_dir),
+        "counts": counts,
+        "jobs": dict(sorted(jobs.items())),
+    }
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
@@ -0,0 +1,400 @@
+"""
+Headless command line entry point.
+
+    python -m cli recommend --spec spec.json
+    python -m cli generate --params my_job.json --spec spec.json --output job.py
+    python -m cli simulate --params my_job.json --spec spec.json
+    python -m cli calibrate --jobs runs.csv
+    python -m cli advise --params my_job.json --event-log eventlog --spec spec.json
+    python -m cli stats --params my_job.json --warehouse /data/warehouse --output-params my_job.json
+    python -m cli bulk --input saved_jobs/ --output generated/
+    python -m cli import-parameters --directory .
+    python -m cli serve --workers 4 --api-port 8001
+    python -m cli api --port 8001
+
+Only ``serve`` imports the Gradio UI, so the other commands start
+without paying for gradio and the widget construction.
+"""
+import argparse
+import json
+import os
+import sys
+
+import pandas as pd
+
+from bulk_generator import (
+    MANIFEST_NAME,
+    bulk_generate,
+    generate_from_parameters,
+    job_spec_from_parameters,
+    json_text,
+)
+from job_simulator import (
+    DEFAULT_INTERRUPTION_RATES,
+    DEFAULT_SPOT_FRACTIONS,
+    DEFAULT_TRIALS,
+    simulate_parameters,
+)
+from parameter_store import DEFAULT_STORE_PATH, ParameterStore
+from resource_recommender import recommend_resources_batch, recommendations_from_batch
+from serving import (
+    DEFAULT_CONCURRENCY,
+    DEFAULT_MAX_PENDING,
+    DEFAULT_QUEUE_SIZE,
+    DEFAULT_WORKERS,
+    ApiServer,
+    WorkerPool,
+    start_api_server,
+)
+from spark_code_generator import (
+    DEFAULT_BROADCAST_THRESHOLD_MB,
+    DEFAULT_SHUFFLE_PARTITION_MB,
+    DEFAULT_SKEW_THRESHOLD,
+    DEFAULT_TARGET_FILE_SIZE_MB,
+    DEFAULT_TRIGGER_INTERVAL,
+    LOAD_MODES,
+    STORAGE_LEVELS,
+    STREAM_SOURCES,
+    STREAMING_MODES,
+)
+from table_stats import (
+    DEFAULT_STATS_WORKERS,
+    DEFAULT_WAREHOUSE_PATH,
+    collect_table_stats,
+    fill_table_stats,
+    render_table_stats,
+    table_sizes_input,
+)
+from workload_model import DEFAULT_MODEL_PATH
+
+
+def read_job_specs(path):
+    """
+    Read recommender job specs from a JSON file (one object or a list of objects)
+    or a CSV file with one job per row.
+    """
+    if path.endswith(".csv"):
+        return pd.read_csv(path, dtype={"table_sizes": str, "join_complexities": str,
+                                        "transformation_complexities": str, "data_skews": str})
+    with open(path, "r") as f:
+        specs = json.load(f)
+    if isinstance(specs, dict):
+        specs = [specs]
+    return pd.DataFrame(specs)
+
+
+def recommend(args):
+    specs = read_job_specs(args.spec)
+    recommendations = recommend_resources_batch(specs)
+    if args.format == "text":
+        for recommendation in recommendations_from_batch(recommendations):
+            print(recommendation.render())
+    elif args.format == "json":
+        print(recommendations.to_json(orient="records", indent=2))
+    else:
+        recommendations.to_csv(sys.stdout, index=False)
+    return 0
+
+
+def _generate_options(args):
+    """
+    generate_spark_code keyword arguments shared by ``generate`` and ``bulk``.
+    """
+    return dict(
+        broadcast_threshold_mb=args.broadcast_threshold_mb,
+        target_file_size_mb=args.target_file_size_mb or None,
+        max_records_per_file=args.max_records_per_file,
+        production=args.production,
+        storage_level=args.storage_level,
+        skew_threshold=args.skew_threshold,
+        salt_buckets=args.salt_buckets,
+        shuffle_partition_mb=args.shuffle_partition_mb,
+        incremental=LOAD_MODES[args.load_mode],
+        merge_keys=args.merge_keys,
+        watermark_table=args.watermark_table,
+        streaming=STREAMING_MODES[args.streaming],
+        trigger_interval=args.trigger_interval or None,
+        checkpoint_location=args.checkpoint_location,
+        stream_source=args.stream_source,
+    )
+
+
+def _fill_from_warehouse(params, warehouse, workers=DEFAULT_STATS_WORKERS):
+    """
+    Replace the parameter file's table size and row estimates with the stats
+    collected under ``warehouse``; returns the stats.
+    """
+    tables = json.loads(json_text(params.get("tables")))
+    stats = collect_table_stats(tables, warehouse, workers)
+    params["tables"] = fill_table_stats(tables, stats)
+    return stats
+
+
+def generate(args):
+    with open(args.params, "r") as f:
+        params = json.load(f)
+
+    sizes = None
+    if args.warehouse:
+        _fill_from_warehouse(params, args.warehouse)
+        sizes = table_sizes_input(params["tables"])
+
+    recommendation = None
+    if args.spec:
+        specs = read_job_specs(args.spec)
+        if sizes:
+            specs["num_tables"], specs["table_sizes"] = sizes.count(",") + 1, sizes
+        recommendation = recommendations_from_batch(recommend_resources_batch(specs))[0]
+
+    if args.output:
+        with open(args.output, "w") as f:
+            generate_from_parameters(params, recommendation, out=f, **_generate_options(args))
+    else:
+        generate_from_parameters(params, recommendation, out=sys.stdout, **_generate_options(args))
+    return 0
+
+
+def simulate(args):
+    with open(args.params, "r") as f:
+        params = json.load(f)
+    specs = read_job_specs(args.spec) if args.spec else pd.DataFrame([job_spec_from_parameters(params)])
+    recommendation = recommendations_from_batch(recommend_resources_batch(specs))[0]
+    result = simulate_parameters(params, recommendation, spot_fractions=args.spot_fractions,
+                                 interruption_rates=args.interruption_rates, trials=args.trials, seed=args.seed)
+    summary = result.summary()
+    if args.format == "text":
+        for stage in result.stages:
+            print(f"{stage.name}: {stage.size_mb:,.0f} MB, {stage.seconds / 60:.1f} min")
+        print(summary.round(3).to_string(index=False))
+    elif args.format == "json":
+        print(summary.to_json(orient="records", indent=2))
+    else:
+        summary.to_csv(sys.stdout, index=False)
+    return 0
+
+
+def calibrate(args):
+    # Deferred import: only this command reads event logs
+    from workload_calibration import calibrate as calibrate_workload_model
+
+    model, report = calibrate_workload_model(read_job_specs(args.jobs), os.path.dirname(os.path.abspath(args.jobs)),
+                                             args.output, args.workers)
+    labels = ", ".join(f"{count} {label}" for label, count in sorted(report["labels"].items()))
+    print(f"Calibrated on {model.metadata['training_runs']} runs ({labels})")
+    print(f"Training accuracy {report['previous_accuracy']:.1%} -> {report['training_accuracy']:.1%}; "
+          f"model version {model.version} written to {args.output}")
+    return 0
+
+
+def advise(args):
+    # Deferred import: only this command reads event logs
+    from tuning_advisor import advise as advise_run
+
+    with open(args.params, "r") as f:
+        params = json.load(f)
+    recommendation = None
+    if args.spec:
+        recommendation = recommendations_from_batch(recommend_resources_batch(read_job_specs(args.spec)))[0]
+    options = _generate_options(args)
+    advice = advise_run(args.event_log, params, recommendation, broadcast_threshold_mb=options["broadcast_threshold_mb"],
+                        shuffle_partition_mb=options["shuffle_partition_mb"], skew_threshold=options["skew_threshold"])
+    print(advice.render())
+
+    if args.output_params:
+        with open(args.output_params, "w") as f:
+            json.dump(advice.params, f, indent=2)
+    if args.output:
+        options.update(advice.generate_options)
+        with open(args.output, "w") as f:
+            generate_from_parameters(advice.params, advice.spark_configs, out=f, **options)
+    return 0
+
+
+def _float_list(text):
+    return [float(value) for value in text.split(",") if value.strip()]
+
+
+def bulk(args):
+    manifest = bulk_generate(args.input, args.output, workers=args.workers, force=args.force, options=_generate_options(args))
+    counts = ", ".join(f"{count} {status}" for status, count in sorted(manifest["counts"].items())) or "no parameter files"
+    print(f"{counts}; manifest written to {os.path.join(args.output, MANIFEST_NAME)}")
+    for path, entry in manifest["jobs"].items():
+        if entry["status"] == "error":
+            print(f"  {path}: {entry['error']}", file=sys.stderr)
+    return 1 if manifest["counts"].get("error") else 0
+
+
+def stats(args):
+    with open(args.params, "r") as f:
+        params = json.load(f)
+    table_stats = _fill_from_warehouse(params, args.warehouse, args.workers)
+    if args.format == "json":
+        print(json.dumps({alias: dict(table._asdict(), size_gb=table.size_gb) for alias, table in table_stats.items()}, indent=2))
+    else:
+        print(render_table_stats(table_stats) or f"No Parquet or ORC data found for these tables under {args.warehouse}")
+    if args.output_params:
+        with open(args.output_params, "w") as f:
+            json.dump(params, f, indent=2)
+    return 0 if table_stats else 1
+
+
+def import_parameters(args):
+    imported, unchanged, failed = ParameterStore(args.store).import_json_files(args.directory)
+    print(f"Imported {imported} parameter files into {args.store} ({unchanged} unchanged, {failed} unreadable)")
+    return 1 if failed else 0
+
+
+def serve(args):
+    # Deferred import: this is the only command that needs gradio
+    from visial_code_gen import create_interface
+
+    pool = WorkerPool(args.workers)
+    if args.api_port:
+        start_api_server(args.host or "127.0.0.1", args.api_port, pool, args.max_pending)
+    iface = create_interface(ParameterStore(args.store), pool)
+    iface.queue(concurrency_count=args.concurrency, max_size=args.queue_size)
+    iface.launch(server_name=args.host, server_port=args.port, share=args.share)
+    return 0
+
+
+def api(args):
+    pool = WorkerPool(args.workers)
+    server = ApiServer((args.host, args.port), pool, args.max_pending)
+    print(f"Serving the JSON API on http://{args.host}:{server.server_address[1]} with {pool.workers} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.shutdown()
+    return 0
+
+
+def _add_generate_options(parser):
+    parser.add_argument("--broadcast-threshold-mb", type=float, default=DEFAULT_BROADCAST_THRESHOLD_MB,
+                        help="Broadcast tables whose size_gb estimate is at or below this size")
+    parser.add_argument("--target-file-size-mb", type=float, default=DEFAULT_TARGET_FILE_SIZE_MB,
+                        help="Repartition the output towards files of this size (0 disables)")
+    parser.add_argument("--max-records-per-file", type=int, help="Set spark.sql.files.maxRecordsPerFile")
+    parser.add_argument("--production", action="store_true",
+                        help="Drop debug actions and persist DataFrames that are evaluated more than once")
+    parser.add_argument("--storage-level", choices=STORAGE_LEVELS, default="MEMORY_AND_DISK")
+    parser.add_argument("--skew-threshold", type=float, default=DEFAULT_SKEW_THRESHOLD,
+                        help="Salt joins on tables whose skew score is above this value")
+    parser.add_argument("--salt-buckets", type=int, help="Salt bucket count (default: from skew score and cores)")
+    parser.add_argument("--shuffle-partition-mb", type=float, default=DEFAULT_SHUFFLE_PARTITION_MB,
+                        help="Size shuffle partitions towards this many MB each")
+    parser.add_argument("--load-mode", choices=list(LOAD_MODES), default="auto",
+                        help="Read tables with a watermark_column incrementally (auto: when the recommendation says so)")
+    parser.add_argument("--merge-keys", help="Comma-separated keys to upsert incremental loads on with MERGE")
+    parser.add_argument("--watermark-table", help="State table for incremental watermarks (default: <output schema>.incremental_watermarks)")
+    parser.add_argument("--streaming", choices=list(STREAMING_MODES), default="auto",
+                        help="Generate a Structured Streaming query (auto: for Streaming/ELT workloads with tables marked as streams)")
+    parser.add_argument("--trigger-interval", default=DEFAULT_TRIGGER_INTERVAL,
+                        help="Micro-batch interval of streaming queries (empty: process the available data once)")
+    parser.add_argument("--checkpoint-location", help="Streaming checkpoint directory (default: checkpoints/<output table>)")
+    parser.add_argument("--stream-source", choices=STREAM_SOURCES, default="table",
+                        help="Read streams from the catalog, from new files under WAREHOUSE_PATH, or from the rate source")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="EMR resource recommender and Spark code generator")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    recommend_parser = subparsers.add_parser("recommend", help="Recommend EMR resources for one or more jobs")
+    recommend_parser.add_argument("--spec", required=True, help="Job spec file (.json object/list or .csv)")
+    recommend_parser.add_argument("--format", choices=["text", "json", "csv"], default="text")
+    recommend_parser.set_defaults(func=recommend)
+
+    generate_parser = subparsers.add_parser("generate", help="Generate Spark code from saved parameters")
+    generate_parser.add_argument("--params", required=True, help="Parameter file written by Save Parameters")
+    generate_parser.add_argument("--spec", help="Job spec used to add recommended Spark configs")
+    generate_parser.add_argument("--output", help="Write the code to this file instead of stdout")
+    generate_parser.add_argument("--warehouse", help="Take table sizes and row counts from the Parquet/ORC metadata under this path")
+    _add_generate_options(generate_parser)
+    generate_parser.set_defaults(func=generate)
+
+    simulate_parser = subparsers.add_parser("simulate", help="Simulate runtime and cost under spot interruptions")
+    simulate_parser.add_argument("--params", required=True, help="Parameter file written by Save Parameters")
+    simulate_parser.add_argument("--spec", help="Job spec for the recommendation (default: from the parameter file)")
+    simulate_parser.add_argument("--spot-fractions", type=_float_list, default=DEFAULT_SPOT_FRACTIONS,
+                                 help="Comma-separated shares of workers on spot (default: 0,0.2,0.5,0.8,1)")
+    simulate_parser.add_argument("--interruption-rates", type=_float_list, default=DEFAULT_INTERRUPTION_RATES,
+                                 help="Comma-separated spot interruptions per node-hour (default: 0.02,0.05,0.1,0.2)")
+    simulate_parser.add_argument("--trials", type=int, default=DEFAULT_TRIALS)
+    simulate_parser.add_argument("--seed", type=int, default=0)
+    simulate_parser.add_argument("--format", choices=["text", "json", "csv"], default="text")
+    simulate_parser.set_defaults(func=simulate)
+
+    calibrate_parser = subparsers.add_parser("calibrate", help="Fit the workload scoring rules to past runs' event logs")
+    calibrate_parser.add_argument("--jobs", required=True,
+                                  help="Job specs (.json list or .csv) with an event_log path per run, relative to this file")
+    calibrate_parser.add_argument("--output", default=DEFAULT_MODEL_PATH, help="Model file to write (default: %(default)s)")
+    calibrate_parser.add_argument("--workers", type=int, help="Processes reading event logs (default: one per CPU)")
+    calibrate_parser.set_defaults(func=calibrate)
+
+    advise_parser = subparsers.add_parser("advise", help="Suggest config and code changes from a run's event log")
+    advise_parser.add_argument("--params", required=True, help="Parameter file the run was generated from")
+    advise_parser.add_argument("--event-log", required=True, help="The run's Spark event log (file, .gz or rolling directory)")
+    advise_parser.add_argument("--spec", help="Job spec of the recommendation the run used")
+    advise_parser.add_argument("--output-params", help="Write the updated parameters to this file")
+    advise_parser.add_argument("--output", help="Regenerate the job with the advice into this file")
+    _add_generate_options(advise_parser)
+    advise_parser.set_defaults(func=advise)
+
+    stats_parser = subparsers.add_parser("stats", help="Collect table sizes and row counts from local Parquet/ORC metadata")
+    stats_parser.add_argument("--params", required=True, help="Parameter file whose tables are looked up")
+    stats_parser.add_argument("--warehouse", default=DEFAULT_WAREHOUSE_PATH,
+                              help="Directory holding <schema>/<table> or <schema>.db/<table> (default: %(default)s)")
+    stats_parser.add_argument("--workers", type=int, default=DEFAULT_STATS_WORKERS, help="Threads reading file footers")
+    stats_parser.add_argument("--output-params", help="Write the parameters with the collected sizes to this file")
+    stats_parser.add_argument("--format", choices=["text", "json"], default="text")
+    stats_parser.set_defaults(func=stats)
+
+    bulk_parser = subparsers.add_parser("bulk", help="Generate code and recommendations for a directory of parameter files")
+    bulk_parser.add_argument("--input", required=True, help="Directory searched recursively for *_job.json and saved_parameters_*.json")
+    bulk_parser.add_argument("--output", required=True, help="Directory for the generated jobs, recommendations and manifest")
+    bulk_parser.add_argument("--workers", type=int, help="Worker processes (default: one per CPU, 1 runs in process)")
+    bulk_parser.add_argument("--force", action="store_true", help="Regenerate files whose content hash is unchanged")
+    _add_generate_options(bulk_parser)
+    bulk_parser.set_defaults(func=bulk)
+
+    import_parser = subparsers.add_parser("import-parameters", help="Import saved parameter JSON files into the parameter store")
+    import_parser.add_argument("--directory", default=".", help="Directory holding saved_parameters_*.json and *_job.json")
+    import_parser.add_argument("--store", default=DEFAULT_STORE_PATH)
+    import_parser.set_defaults(func=import_parameters)
+
+    serve_parser = subparsers.add_parser("serve", help="Launch the Gradio UI")
+    serve_parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="Parameter store used by Save/Load Parameters")
+    serve_parser.add_argument("--host", default=None)
+    serve_parser.add_argument("--port", type=int, default=None)
+    serve_parser.add_argument("--share", action="store_true")
+    serve_parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                              help="Processes running recommendations and code generation (default: one per CPU, 1 runs in process)")
+    serve_parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Gradio events processed at once")
+    serve_parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE, help="Gradio events allowed to wait")
+    serve_parser.add_argument("--api-port", type=int, help="Also serve the JSON API on this port")
+    serve_parser.add_argument("--max-pending", type=int, default=DEFAULT_MAX_PENDING,
+                              help="API requests in flight before answering 503")
+    serve_parser.set_defaults(func=serve)
+
+    api_parser = subparsers.add_parser("api", help="Serve the JSON HTTP API (/recommend, /generate, /batch) without the UI")
+    api_parser.add_argument("--host", default="127.0.0.1")
+    api_parser.add_argument("--port", type=int, default=8001)
+    api_parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                            help="Worker processes (default: one per CPU, 1 runs in process)")
+    api_parser.add_argument("--max-pending", type=int, default=DEFAULT_MAX_PENDING,
+                            help="Requests in flight before answering 503")
+    api_parser.set_defaults(func=api)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
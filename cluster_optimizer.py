@@ -0,0 +1,235 @@
+"""
+Cost-optimal EMR worker fleets from the local instance catalog.
+
+``instance_catalog.json`` lists the instance sizes we run on with their vCPUs,
+memory, local disk and hourly prices. ``optimize_fleet`` picks, for many jobs
+at once, the cheapest worker fleet that covers each job's cores, memory and
+local disk: either one instance size, or two sizes of the same family (large
+nodes topped up with a few smaller ones). Mixing is kept within a family so
+that every node has the same memory per core and one executor layout fits all
+of them.
+"""
+import functools
+import json
+import os
+from typing import NamedTuple
+
+import numpy as np
+
+DEFAULT_CATALOG_PATH = os.environ.get(
+    "INSTANCE_CATALOG_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance_catalog.json"))
+
+MIN_WORKERS = 2
+
+# Jobs optimized per numpy pass, which bounds the size of the candidate arrays
+CHUNK_SIZE = 1024
+
+# Pruned two-size candidates per (catalog, min_nodes); the catalog is kept with them so a reused id() is not mistaken for it
+_candidate_cache = {}
+
+
+class InstanceCatalog(NamedTuple):
+    """
+    Instance sizes as parallel arrays, in catalog order.
+    """
+    version: str
+    region: str
+    instance_type: np.ndarray
+    family: np.ndarray
+    vcpu: np.ndarray
+    memory_gib: np.ndarray
+    local_disk_gb: np.ndarray
+    on_demand_hourly: np.ndarray
+    spot_hourly: np.ndarray
+    emr_hourly: np.ndarray
+
+    def index(self, instance_type):
+        return int(np.flatnonzero(self.instance_type == instance_type)[0])
+
+    def capacity(self):
+        """
+        (instance, resource) matrix of cores, memory and local disk.
+        """
+        return np.column_stack([self.vcpu, self.memory_gib, self.local_disk_gb])
+
+    def hourly_rates(self, spot_fraction):
+        """
+        (job, instance) matrix of hourly prices, with the given fraction of
+        nodes on spot and the EMR fee on every node.
+        """
+        spot_fraction = np.asarray(spot_fraction, dtype=float)[:, None]
+        return (1 - spot_fraction) * self.on_demand_hourly + spot_fraction * self.spot_hourly + self.emr_hourly
+
+    def master_indices(self):
+        """
+        For every instance, the smallest size of its family, which is all the
+        master node needs.
+        """
+        smallest = {}
+        for i in np.argsort(-self.vcpu, kind="stable"):
+            smallest[self.family[i]] = i
+        return np.array([smallest[family] for family in self.family])
+
+
+@functools.lru_cache(maxsize=8)
+def load_instance_catalog(path=DEFAULT_CATALOG_PATH):
+    """
+    Read the catalog once per path. Raises ValueError if it is malformed.
+    """
+    with open(path, "r") as f:
+        catalog = json.load(f)
+    try:
+        instances = catalog["instances"]
+        return InstanceCatalog(
+            version=str(catalog["version"]),
+            region=catalog.get("region", ""),
+            instance_type=np.array([i["instance_type"] for i in instances], dtype=object),
+            family=np.array([i.get("family") or i["instance_type"].split(".")[0] for i in instances], dtype=object),
+            **{field: np.array([float(i[field]) for i in instances])
+               for field in ("vcpu", "memory_gib", "local_disk_gb", "on_demand_hourly", "spot_hourly", "emr_hourly")},
+        )
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Invalid instance catalog {path}: {e!r}")
+
+
+def _nodes_needed(requirements, capacity):
+    """
+    Nodes of one size needed to cover ``requirements`` (..., resource), given the
+    per-node ``capacity`` broadcast against it. Infinite when a required resource
+    has no capacity.
+    """
+    needed = 0.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Elementwise over the few resources, which is much faster than reducing a short last axis.
+        # fmax skips the NaN of 0 / 0, so a resource that is neither required nor offered does not count.
+        for resource in range(requirements.shape[-1]):
+            needed = np.fmax(needed, requirements[..., resource] / capacity[..., resource])
+    # Tolerance keeps exact fits (64 cores on 16-core nodes) from rounding up
+    return np.ceil(needed - 1e-9).clip(min=0)
+
+
+def _unique_rows(rows):
+    """
+    Distinct rows of a 2-D array and, per row, the index of its distinct row:
+    ``np.unique(rows, axis=0, return_inverse=True)`` with a plain lexsort, which
+    is several times faster than the structured view that np.unique sorts.
+    """
+    order = np.lexsort(rows.T[::-1])
+    ordered = rows[order]
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = (ordered[1:] != ordered[:-1]).any(axis=1)
+    inverse = np.empty(len(rows), dtype=int)
+    inverse[order] = np.cumsum(first) - 1
+    return ordered[first], inverse
+
+
+def _mixed_candidates(catalog, min_nodes):
+    """
+    Every two-size fleet worth pricing, as parallel (large, small, small count)
+    arrays: for each pair of sizes of one family, 1 up to ceil(large / small)
+    nodes of the smaller size. More small nodes than that could be swapped for
+    one more large node, which the catalog prices no higher.
+
+    Candidates are dropped when another one with the same large size has small
+    nodes that cover at least as much for no more money at any spot fraction
+    (two xlarge nodes rather than one 2xlarge): it can never be the cheapest.
+    """
+    same_family = catalog.family[:, None] == catalog.family[None, :]
+    larger = catalog.vcpu[:, None] > catalog.vcpu[None, :]
+    large, small = np.nonzero(same_family & larger)
+    counts = np.ceil(catalog.vcpu[large] / catalog.vcpu[small]).astype(int)
+    starts = np.cumsum(counts) - counts
+    small_count = np.arange(counts.sum()) - np.repeat(starts, counts) + 1
+    large, small = np.repeat(large, counts), np.repeat(small, counts)
+
+    covered = small_count[:, None] * catalog.capacity()[small]
+    # Prices are linear in the spot fraction, so all-on-demand and all-spot bound every mix
+    rates = small_count * catalog.hourly_rates([0.0, 1.0])[:, small]
+    kept = np.ones(len(large), dtype=bool)
+    for size in np.unique(large):
+        # (candidate, candidate) pairs with this large size: does the first one dominate the second?
+        group = np.flatnonzero(large == size)
+        group_rates = rates[:, group]
+        no_dearer = (group_rates[:, :, None] <= group_rates[:, None, :]).all(axis=0)
+        cheaper = (group_rates[:, :, None] < group_rates[:, None, :]).all(axis=0)
+        # Ties go to the earlier candidate, as in the argmin
+        earlier = group[:, None] < group[None, :]
+        # Fewer small nodes must not force more large nodes to reach min_nodes
+        counts = small_count[group]
+        enough_nodes = (counts[:, None] >= counts[None, :]) | (counts[:, None] >= min_nodes - 1)
+        dominates = ((covered[group][:, None, :] >= covered[group][None, :, :]).all(axis=2)
+                     & no_dearer & (cheaper | earlier) & enough_nodes)
+        np.fill_diagonal(dominates, False)
+        kept[group] = ~dominates.any(axis=0)
+    return large[kept], small[kept], small_count[kept]
+
+
+def _optimize_chunk(requirements, rates, catalog, candidates, min_nodes):
+    capacity = catalog.capacity()
+    num_jobs, num_types = rates.shape
+
+    # Single-size fleets: (job, instance)
+    single_counts = np.maximum(min_nodes, _nodes_needed(requirements[:, None, :], capacity[None, :, :]))
+    single_costs = single_counts * rates
+
+    # Two-size fleets: (job, candidate), a few small nodes plus the large nodes the rest needs
+    large, small, small_count = candidates
+    remaining = requirements[:, None, :] - small_count[None, :, None] * capacity[small][None, :, :]
+    large_count = np.maximum(_nodes_needed(remaining, capacity[large][None, :, :]), min_nodes - small_count)
+    mixed_costs = large_count * rates[:, large] + small_count * rates[:, small]
+    # Without large nodes it is a single-size fleet, already priced above
+    mixed_costs = np.where(large_count > 0, mixed_costs, np.inf)
+
+    # Singles come first so that they win ties
+    costs = np.concatenate([single_costs, mixed_costs], axis=1)
+    best = np.argmin(costs, axis=1)
+    is_single = best < num_types
+    single = np.minimum(best, num_types - 1)
+    mixed = np.maximum(best - num_types, 0)
+    jobs = np.arange(num_jobs)
+
+    primary = np.where(is_single, single, large[mixed])
+    secondary = np.where(is_single, -1, small[mixed])
+    primary_count = np.where(is_single, single_counts[jobs, single], large_count[jobs, mixed])
+    secondary_count = np.where(is_single, 0, small_count[mixed])
+    return primary, primary_count, secondary, secondary_count, costs[jobs, best]
+
+
+def optimize_fleet(cores, memory_gb, disk_gb=0, spot_fraction=0, catalog=None, min_nodes=MIN_WORKERS):
+    """
+    Cheapest worker fleet per job covering ``cores``, ``memory_gb`` and local
+    ``disk_gb`` (arrays or scalars, one value per job), with ``spot_fraction``
+    of the nodes priced at spot. At least ``min_nodes`` nodes are used.
+
+    Returns a dict of arrays: ``primary`` / ``secondary`` (catalog indices, -1
+    for no second size), ``primary_count`` / ``secondary_count`` and
+    ``hourly_cost`` of the workers. Raises ValueError if no size can cover a job.
+    """
+    if catalog is None:
+        catalog = load_instance_catalog()
+    cores, memory_gb, disk_gb, spot_fraction = np.broadcast_arrays(
+        *(np.atleast_1d(np.asarray(value, dtype=float)) for value in (cores, memory_gb, disk_gb, spot_fraction)))
+    # Batches repeat the same requirements a lot, so each distinct one is optimized once
+    jobs, inverse = _unique_rows(np.column_stack([cores, memory_gb, disk_gb, spot_fraction]))
+    requirements = jobs[:, :3]
+    rates = catalog.hourly_rates(jobs[:, 3])
+    cached = _candidate_cache.get((id(catalog), min_nodes))
+    if cached is None or cached[0] is not catalog:
+        if len(_candidate_cache) >= 8:
+            _candidate_cache.clear()
+        cached = _candidate_cache[id(catalog), min_nodes] = (catalog, _mixed_candidates(catalog, min_nodes))
+    candidates = cached[1]
+
+    chunks = [_optimize_chunk(requirements[start:start + CHUNK_SIZE], rates[start:start + CHUNK_SIZE], catalog, candidates, min_nodes)
+              for start in range(0, len(requirements), CHUNK_SIZE)]
+    primary, primary_count, secondary, secondary_count, hourly_cost = (
+        np.concatenate(column)[inverse] for column in zip(*chunks))
+    if not np.isfinite(hourly_cost).all():
+        raise ValueError("No instance size in the catalog can cover the required cores, memory and disk")
+    return {
+        "primary": primary,
+        "primary_count": primary_count.astype(int),
+        "secondary": secondary,
+        "secondary_count": secondary_count.astype(int),
+        "hourly_cost": hourly_cost,
+    }
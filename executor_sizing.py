@@ -0,0 +1,177 @@
+"""
+Executor layout for a worker fleet: spark.executor.* and dynamic-allocation
+settings that fit the chosen nodes.
+
+Each node gives up one core and part of its memory to the OS and the Hadoop
+daemons. The rest is split into executors of a few cores each, with the
+workload deciding the cores per executor (one fewer when that packs the
+node's cores better). Each executor's YARN container is its heap plus the
+memory overhead. Executor cores are chosen for the node with the fewest cores
+and the container for the node with the least memory per executor, so the
+same executors fill every node of the fleet.
+"""
+import numpy as np
+
+# Cores per executor by workload type; 5 is the usual ceiling for HDFS/S3 client throughput
+EXECUTOR_CORES = {
+    "ML/High Memory": 3,  # Fewer cores per executor, so more memory per core
+    "Streaming/ELT": 5,
+    "Data Caching/Analysis": 4,
+    "General": 4,
+}
+
+# Off-heap memory overhead as a fraction of the executor memory; Python-heavy ML needs more
+MEMORY_OVERHEAD_FRACTION = {
+    "ML/High Memory": 0.2,
+    "Streaming/ELT": 0.1,
+    "Data Caching/Analysis": 0.1,
+    "General": 0.1,
+}
+MIN_MEMORY_OVERHEAD_MB = 384
+
+# Share of the heap for execution and storage (Spark's default is 0.6); caching workloads keep more in storage
+MEMORY_FRACTION = {
+    "ML/High Memory": 0.6,
+    "Streaming/ELT": 0.6,
+    "Data Caching/Analysis": 0.7,
+    "General": 0.6,
+}
+
+RESERVED_CORES = 1
+
+
+def reserved_memory_gb(memory_gb):
+    """
+    Memory kept back from YARN for the OS and the Hadoop daemons: a quarter of
+    the node, between 2 and 8 GB (close to what EMR leaves out of
+    yarn.nodemanager.resource.memory-mb).
+    """
+    return np.clip(0.25 * np.asarray(memory_gb, dtype=float), 2, 8)
+
+
+def _by_workload(table, workload_type):
+    general = table["General"]
+    return np.array([table.get(workload, general) for workload in np.asarray(workload_type, dtype=object).ravel().tolist()])
+
+
+def _executors_on_smallest(executors_per_node, node_counts, instances):
+    """
+    Executors on the ``instances`` nodes of the fleet that hold the fewest
+    executors: scaling in may leave only the smallest nodes.
+    """
+    order = np.argsort(np.where(node_counts > 0, executors_per_node, np.iinfo(int).max), axis=1, kind="stable")
+    per_node = np.take_along_axis(executors_per_node, order, axis=1)
+    counts = np.take_along_axis(node_counts, order, axis=1)
+    before = np.cumsum(counts, axis=1) - counts
+    taken = np.clip(np.asarray(instances)[:, None] - before, 0, counts)
+    return (per_node * taken).sum(axis=1)
+
+
+def _executors_scaled_out(executors_per_node, node_counts, instances):
+    """
+    Executors on ``instances`` nodes added in the fleet's own mix: each size
+    scaled in proportion, with the nodes left over by rounding on the primary
+    (first) size.
+    """
+    instances = np.asarray(instances)
+    scaled = np.floor(node_counts * (instances / node_counts.sum(axis=1))[:, None]).astype(int)
+    scaled[:, 0] += instances - scaled.sum(axis=1)
+    return (executors_per_node * scaled).sum(axis=1)
+
+
+def executor_layout(workload_type, node_cores, node_memory_gb, node_counts, master_memory_gb, min_instances, max_instances):
+    """
+    Executor settings per job, vectorized.
+
+    ``node_cores``, ``node_memory_gb`` and ``node_counts`` are (job, size)
+    arrays describing the fleet (count 0 for unused sizes);
+    ``master_memory_gb`` is the master node's memory, which holds the driver.
+    ``min_instances`` / ``max_instances`` are the autoscaling bounds in nodes.
+
+    Returns a dict of arrays: ``executor_cores``, ``executor_memory_mb``,
+    ``memory_overhead_mb``, ``executors_per_node`` (job, size),
+    ``executor_instances``, ``driver_memory_mb``, ``memory_fraction``,
+    ``min_executors`` and ``max_executors``.
+    """
+    node_cores = np.asarray(node_cores, dtype=float)
+    node_memory_gb = np.asarray(node_memory_gb, dtype=float)
+    node_counts = np.asarray(node_counts)
+    used = node_counts > 0
+
+    usable_cores = np.maximum(node_cores - RESERVED_CORES, 1)
+    usable_memory_mb = np.floor((node_memory_gb - reserved_memory_gb(node_memory_gb)) * 1024)
+
+    # Size executor cores for the node with the fewest cores in use
+    smallest = np.argmin(np.where(used, node_cores, np.inf), axis=1)
+    jobs = np.arange(len(node_cores))
+    node = usable_cores[jobs, smallest]
+    target = np.minimum(_by_workload(EXECUTOR_CORES, workload_type), node)
+    # One core fewer per executor when that leaves fewer cores idle (7 usable cores: 2 x 3 rather than 1 x 4)
+    fewer = np.maximum(target - 1, 1)
+    executor_cores = np.where(node % fewer < node % target, fewer, target).astype(int)
+    # Every size runs as many executors as its cores allow, so the container is sized for the size with the
+    # least memory per executor; the fewest cores does not mean the least memory per core
+    executors_per_node = np.where(used, usable_cores // executor_cores[:, None], 0).astype(int)
+    container_mb = np.where(used, usable_memory_mb // np.maximum(executors_per_node, 1), np.inf).min(axis=1)
+
+    overhead_fraction = _by_workload(MEMORY_OVERHEAD_FRACTION, workload_type)
+    executor_memory_mb = np.floor(np.minimum(container_mb / (1 + overhead_fraction), container_mb - MIN_MEMORY_OVERHEAD_MB))
+    memory_overhead_mb = container_mb - executor_memory_mb
+
+    total_executors = (executors_per_node * node_counts).sum(axis=1)
+    # One container goes to the YARN application master
+    executor_instances = np.maximum(total_executors - 1, 1)
+
+    # The driver runs on the master; it gets an executor's heap if the master has room for it
+    master_memory_mb = np.floor((np.asarray(master_memory_gb, dtype=float) - reserved_memory_gb(master_memory_gb)) * 1024)
+    driver_memory_mb = np.maximum(np.minimum(executor_memory_mb, master_memory_mb - MIN_MEMORY_OVERHEAD_MB), 1024)
+
+    # Dynamic allocation follows the node autoscaling bounds, counted on the nodes left at each bound
+    min_executors = np.maximum(_executors_on_smallest(executors_per_node, node_counts, min_instances) - 1, 1).astype(int)
+    max_executors = np.maximum(_executors_scaled_out(executors_per_node, node_counts, max_instances) - 1,
+                               executor_instances).astype(int)
+
+    return {
+        "executor_cores": executor_cores,
+        "executor_memory_mb": executor_memory_mb.astype(int),
+        "memory_overhead_mb": memory_overhead_mb.astype(int),
+        "executors_per_node": executors_per_node,
+        "executor_instances": executor_instances.astype(int),
+        "driver_memory_mb": driver_memory_mb.astype(int),
+        "memory_fraction": _by_workload(MEMORY_FRACTION, workload_type),
+        "min_executors": min_executors,
+        "max_executors": max_executors,
+    }
+
+
+def _executor_config(cores, memory, overhead, instances, driver_memory, fraction, min_executors, max_executors):
+    return (
+        ("spark.executor.cores", str(cores)),
+        ("spark.executor.memory", f"{memory}m"),
+        ("spark.executor.memoryOverhead", f"{overhead}m"),
+        ("spark.executor.instances", str(instances)),
+        ("spark.driver.memory", f"{driver_memory}m"),
+        ("spark.memory.fraction", str(fraction)),
+        ("spark.dynamicAllocation.enabled", "true"),
+        ("spark.dynamicAllocation.minExecutors", str(min_executors)),
+        ("spark.dynamicAllocation.maxExecutors", str(max_executors)),
+        ("spark.dynamicAllocation.initialExecutors", str(instances)),
+    )
+
+
+def executor_configs(layout):
+    """
+    Spark (key, value) pairs per job of an ``executor_layout`` result.
+    """
+    columns = zip(*(layout[name].tolist() for name in (
+        "executor_cores", "executor_memory_mb", "memory_overhead_mb", "executor_instances", "driver_memory_mb",
+        "memory_fraction", "min_executors", "max_executors")))
+    # Jobs share a few distinct layouts, so each one is formatted once and the tuple reused
+    configs = {}
+    result = []
+    for row in columns:
+        config = configs.get(row)
+        if config is None:
+            config = configs[row] = _executor_config(*row)
+        result.append(config)
+    return result
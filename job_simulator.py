@@ -0,0 +1,236 @@
+"""
+Runtime and cost simulation of a generated job on a recommended cluster.
+
+The job spec is broken into stages: the table scan, every shuffle join and
+the group-by (sized by ``spark_code_generator.plan_shuffle_stages``), and the
+output write. A stage takes its data volume divided by the cluster's task
+slots times a per-core throughput coefficient, plus a fixed scheduling
+overhead.
+
+Spot interruptions are simulated per trial with NumPy, for every combination
+of spot share and interruption rate. Interruptions arrive as a Poisson
+process on the spot nodes. Each one loses the interrupted node's share of the
+work done in the current stage and the shuffle output it held from the
+previous stage, and leaves the cluster a node short until the replacement
+arrives. Runs past the recommendation's ``max_execution_time`` are killed by
+the safeguard.
+
+    result = simulate_job(tables, joins, transformations, recommendation)
+    print(result.summary())
+"""
+from __future__ import annotations
+
+import json
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from cluster_optimizer import load_instance_catalog
+from query_planner import plan_join_order
+from spark_code_generator import (
+    DEFAULT_BROADCAST_THRESHOLD_MB,
+    plan_broadcast_joins,
+    plan_shuffle_stages,
+    plan_skew_joins,
+    table_size_mb,
+)
+
+# MB processed per second by one task slot, per stage kind
+THROUGHPUT_MB_PER_CORE_SECOND = {
+    "scan": 60.0,
+    "shuffle": 25.0,
+    "write": 35.0,
+}
+
+# Scheduling and task start-up per stage
+STAGE_OVERHEAD_SECONDS = 3.0
+
+# EMR provisioning and bootstrap before the first stage (billed, not part of the job runtime)
+DEFAULT_STARTUP_SECONDS = 420
+
+# Time until a reclaimed spot node is replaced
+DEFAULT_REPLACEMENT_SECONDS = 300
+
+# Spot interruptions per spot node and hour
+DEFAULT_INTERRUPTION_RATES = (0.02, 0.05, 0.1, 0.2)
+
+DEFAULT_SPOT_FRACTIONS = (0.0, 0.2, 0.5, 0.8, 1.0)
+
+DEFAULT_TRIALS = 2000
+
+# Extra rounds of interruptions during the time added by earlier interruptions
+FEEDBACK_ROUNDS = 2
+
+
+class Stage(NamedTuple):
+    name: str
+    kind: str
+    size_mb: float
+    seconds: float
+
+
+def _task_slots(recommendation):
+    """
+    Executor instances x executor cores from the recommended Spark configs,
+    else the recommended total cores.
+    """
+    configs = dict(getattr(recommendation, "spark_configs", ()) or ())
+    try:
+        return int(configs["spark.executor.instances"]) * int(configs["spark.executor.cores"])
+    except (KeyError, ValueError):
+        return int(recommendation.total_cores)
+
+
+def estimate_stages(tables, joins, transformations, recommendation, throughput=None,
+                    broadcast_threshold_mb=DEFAULT_BROADCAST_THRESHOLD_MB):
+    """
+    The job's stages with their data volume and duration on the full cluster.
+
+    Tables without a ``size_gb`` estimate share the recommendation's
+    ``total_data_size`` equally. Raises ValueError if there are no tables.
+    """
+    if not tables:
+        raise ValueError("The job has no tables")
+    throughput = dict(THROUGHPUT_MB_PER_CORE_SECOND, **(throughput or {}))
+    if any(table_size_mb(table) is None for table in tables):
+        share = float(recommendation.total_data_size) / len(tables)
+        tables = [dict(table, size_gb=share) if table_size_mb(table) is None else table for table in tables]
+
+    joins, _ = plan_join_order(tables, joins)
+    broadcast_plan = plan_broadcast_joins(tables, joins, broadcast_threshold_mb)
+    skew_plan = plan_skew_joins(tables, joins, broadcast_plan, total_cores=recommendation.total_cores)
+    shuffle_plan = plan_shuffle_stages(tables, joins, transformations, broadcast_plan, skew_plan, recommendation.total_cores)
+
+    volumes = [("scan", "scan", sum(table_size_mb(table) for table in tables))]
+    volumes += [(stage["label"], "shuffle", stage["shuffled_mb"]) for stage in shuffle_plan["joins"] if stage]
+    group_by = shuffle_plan["group_by"]
+    if group_by:
+        volumes.append((group_by["label"], "shuffle", group_by["shuffled_mb"]))
+    output_mb = group_by["shuffled_mb"] if group_by else shuffle_plan["result_mb"]
+    volumes.append(("write", "write", output_mb if output_mb is not None else volumes[0][2]))
+
+    slots = max(1, _task_slots(recommendation))
+    return [Stage(name, kind, size_mb, size_mb / (slots * throughput[kind]) + STAGE_OVERHEAD_SECONDS)
+            for name, kind, size_mb in volumes]
+
+
+def _node_rates(recommendation, catalog):
+    """
+    Average hourly on-demand and spot price (EMR fee included) of a worker in
+    the recommended fleet, and the master's hourly price.
+    """
+    counts = np.array([count for _, count in recommendation.instance_fleet], dtype=float)
+    indices = [catalog.index(instance_type) for instance_type, _ in recommendation.instance_fleet]
+    on_demand = catalog.on_demand_hourly[indices] + catalog.emr_hourly[indices]
+    spot = catalog.spot_hourly[indices] + catalog.emr_hourly[indices]
+    master = catalog.index(recommendation.master_instance_type)
+    return (counts @ on_demand / counts.sum(), counts @ spot / counts.sum(),
+            catalog.on_demand_hourly[master] + catalog.emr_hourly[master])
+
+
+class SimulationResult(NamedTuple):
+    """
+    Simulated runs: ``runtime_seconds``, ``cost`` and ``killed`` are
+    (interruption rate, spot fraction, trial) arrays.
+    """
+    stages: tuple[Stage, ...]
+    interruption_rates: np.ndarray
+    spot_fractions: np.ndarray
+    spot_workers: np.ndarray
+    hourly_cost: np.ndarray
+    runtime_seconds: np.ndarray
+    cost: np.ndarray
+    killed: np.ndarray
+
+    def summary(self, quantiles=(0.5, 0.9, 0.99)):
+        """
+        One row per interruption rate and spot fraction: the completion time
+        (minutes) and cost quantiles, mean cost and the share of runs killed.
+        """
+        rates, fractions = np.meshgrid(self.interruption_rates, self.spot_fractions, indexing="ij")
+        columns = {
+            "interruption_rate": rates.ravel(),
+            "spot_fraction": fractions.ravel(),
+            "spot_workers": np.broadcast_to(self.spot_workers, rates.shape).ravel(),
+            "hourly_cost": np.broadcast_to(self.hourly_cost, rates.shape).ravel(),
+        }
+        minutes = np.quantile(self.runtime_seconds / 60, quantiles, axis=-1)
+        costs = np.quantile(self.cost, quantiles, axis=-1)
+        for quantile, runtime, cost in zip(quantiles, minutes, costs):
+            columns[f"runtime_p{quantile * 100:g}_min"] = runtime.ravel()
+            columns[f"cost_p{quantile * 100:g}"] = cost.ravel()
+        columns["cost_mean"] = self.cost.mean(axis=-1).ravel()
+        columns["killed_share"] = self.killed.mean(axis=-1).ravel()
+        return pd.DataFrame(columns)
+
+
+def simulate_job(tables, joins, transformations, recommendation, spot_fractions=DEFAULT_SPOT_FRACTIONS,
+                 interruption_rates=DEFAULT_INTERRUPTION_RATES, trials=DEFAULT_TRIALS, throughput=None,
+                 startup_seconds=DEFAULT_STARTUP_SECONDS, replacement_seconds=DEFAULT_REPLACEMENT_SECONDS,
+                 broadcast_threshold_mb=DEFAULT_BROADCAST_THRESHOLD_MB, catalog=None, seed=0):
+    """
+    Monte Carlo runtime and cost of a job on the recommended fleet for every
+    spot fraction and interruption rate (interruptions per spot node-hour).
+
+    ``tables``, ``joins`` and ``transformations`` are the decoded UI specs and
+    ``recommendation`` a Recommendation. ``throughput`` overrides entries of
+    THROUGHPUT_MB_PER_CORE_SECOND. Costs include the on-demand master and the
+    cluster start-up time. Returns a SimulationResult.
+    """
+    if trials < 1:
+        raise ValueError("trials must be at least 1")
+    if catalog is None:
+        catalog = load_instance_catalog()
+    stages = estimate_stages(tables, joins, transformations, recommendation, throughput, broadcast_threshold_mb)
+    durations = np.array([stage.seconds for stage in stages])
+    ends = np.cumsum(durations)
+    starts = ends - durations
+    previous = np.concatenate([[0.0], durations[:-1]])
+    base_runtime = ends[-1]
+
+    workers = int(recommendation.workers)
+    rates = np.asarray(interruption_rates, dtype=float)
+    fractions = np.asarray(spot_fractions, dtype=float)
+    spot_workers = np.rint(workers * fractions).astype(int)
+    on_demand_rate, spot_rate, master_rate = _node_rates(recommendation, catalog)
+    hourly_cost = (workers - spot_workers) * on_demand_rate + spot_workers * spot_rate + master_rate
+
+    rng = np.random.default_rng(seed)
+    shape = (len(rates), len(fractions), trials)
+    # Interruptions per second of runtime for each (rate, fraction) pair
+    intensity = np.broadcast_to((rates[:, None] * spot_workers[None, :] / 3600)[..., None], shape)
+    runtime = np.full(shape, base_runtime)
+    exposure = runtime.copy()
+    for _ in range(1 + FEEDBACK_ROUNDS):
+        counts = rng.poisson(intensity * exposure)
+        total = counts.sum()
+        if total == 0:
+            break
+        # Each interruption lands at a uniform point of the fault-free schedule
+        trial = np.repeat(np.arange(counts.size), counts.ravel())
+        at = rng.uniform(0, base_runtime, total)
+        stage = np.minimum(np.searchsorted(ends, at, side="right"), len(stages) - 1)
+        lost = (at - starts[stage]) + previous[stage] + replacement_seconds
+        added = np.bincount(trial, weights=lost / workers, minlength=counts.size).reshape(shape)
+        runtime += added
+        exposure = added
+
+    limit = float(getattr(recommendation, "max_execution_time", np.inf))
+    killed = runtime > limit
+    runtime = np.minimum(runtime, limit)
+    cost = (runtime + startup_seconds) / 3600 * hourly_cost[None, :, None]
+    return SimulationResult(tuple(stages), rates, fractions, spot_workers, hourly_cost, runtime, cost, killed)
+
+
+def simulate_parameters(params, recommendation, **kwargs):
+    """
+    ``simulate_job`` for a saved parameter dict (see ``utils.save_parameters``).
+    """
+    def decoded(value):
+        if isinstance(value, str):
+            return json.loads(value) if value.strip() else []
+        return value or []
+
+    return simulate_job(decoded(params.get("tables")), decoded(params.get("joins")),
+                        decoded(params.get("transformations")), recommendation, **kwargs)
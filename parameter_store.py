@@ -0,0 +1,233 @@
+"""
+SQLite-backed store for saved job parameters.
+
+Every save of a job adds a version; identical contents are stored once (keyed by
+their SHA-256) and saving a job unchanged does not add a version. The tables,
+schemas and output table of every stored content are indexed for search, and
+jobs are listed a page at a time, most recently updated first.
+
+    store = ParameterStore("parameters.db")
+    store.save("daily_sales", params)
+    store.load("daily_sales")            # latest version
+    store.search(table="DimProduct")
+    store.import_json_files(".")         # one-shot import of saved_parameters_*.json / *_job.json
+"""
+import hashlib
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+from utils import is_parameter_file
+
+DEFAULT_STORE_PATH = os.environ.get("PARAMETER_STORE_PATH", "parameters.db")
+
+DEFAULT_PAGE_SIZE = 50
+
+# Parameter fields that the UI passes as JSON text or as decoded lists
+JSON_FIELDS = ("tables", "joins", "transformations")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS contents (
+    hash TEXT PRIMARY KEY,
+    params TEXT NOT NULL,
+    output_schema TEXT,
+    output_table TEXT
+);
+CREATE TABLE IF NOT EXISTS content_tables (
+    hash TEXT NOT NULL REFERENCES contents(hash),
+    table_schema TEXT,
+    table_name TEXT
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    job_name TEXT PRIMARY KEY,
+    latest_version INTEGER NOT NULL,
+    latest_hash TEXT NOT NULL REFERENCES contents(hash),
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS versions (
+    job_name TEXT NOT NULL REFERENCES jobs(job_name),
+    version INTEGER NOT NULL,
+    hash TEXT NOT NULL REFERENCES contents(hash),
+    saved_at TEXT NOT NULL,
+    PRIMARY KEY (job_name, version)
+);
+CREATE INDEX IF NOT EXISTS contents_output_table ON contents (output_table COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS contents_output_schema ON contents (output_schema COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS content_tables_name ON content_tables (table_name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS content_tables_schema ON content_tables (table_schema COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS content_tables_hash ON content_tables (hash);
+CREATE INDEX IF NOT EXISTS jobs_latest_hash ON jobs (latest_hash);
+CREATE INDEX IF NOT EXISTS jobs_updated_at ON jobs (updated_at);
+"""
+
+
+def normalize_parameters(params):
+    """
+    Decode the JSON-text fields so that the same parameters entered either way
+    have the same content hash.
+    """
+    normalized = dict(params)
+    for field in JSON_FIELDS:
+        value = normalized.get(field)
+        if isinstance(value, str):
+            try:
+                normalized[field] = json.loads(value) if value.strip() else []
+            except ValueError:
+                pass  # Kept as typed; the generator reports invalid JSON
+    return normalized
+
+
+def content_hash(params):
+    return hashlib.sha256(json.dumps(params, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+class ParameterStore:
+    """
+    Versioned, content-addressed job parameters in one SQLite file.
+
+    Connections are opened per operation, so one store can be shared by the
+    threads that serve UI events.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        # WAL keeps readers off the writer's lock; NORMAL sync is durable across application crashes
+        connection.execute("PRAGMA synchronous=NORMAL")
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def save(self, job_name, params, saved_at=None):
+        """
+        Save ``params`` as the next version of ``job_name``.
+
+        Returns ``(version, created)``; ``created`` is False when the contents
+        equal the job's latest version, which is then returned instead.
+        """
+        if not job_name:
+            raise ValueError("A job name is required")
+        params = normalize_parameters(params)
+        digest = content_hash(params)
+        saved_at = saved_at or datetime.now().isoformat(timespec="seconds")
+        with self._connect() as connection:
+            # Take the write lock before reading the latest version so concurrent saves get distinct versions
+            connection.execute("BEGIN IMMEDIATE")
+            latest = connection.execute("SELECT latest_version, latest_hash FROM jobs WHERE job_name = ?", (job_name,)).fetchone()
+            if latest and latest[1] == digest:
+                return latest[0], False
+
+            inserted = connection.execute(
+                "INSERT OR IGNORE INTO contents (hash, params, output_schema, output_table) VALUES (?, ?, ?, ?)",
+                (digest, json.dumps(params), params.get("output_schema"), params.get("output_table"))).rowcount
+            if inserted:
+                tables = params.get("tables") if isinstance(params.get("tables"), list) else []
+                connection.executemany(
+                    "INSERT INTO content_tables (hash, table_schema, table_name) VALUES (?, ?, ?)",
+                    [(digest, table.get("schema"), table.get("name")) for table in tables if isinstance(table, dict)])
+
+            version = latest[0] + 1 if latest else 1
+            connection.execute("INSERT INTO versions (job_name, version, hash, saved_at) VALUES (?, ?, ?, ?)",
+                               (job_name, version, digest, saved_at))
+            connection.execute(
+                "INSERT INTO jobs (job_name, latest_version, latest_hash, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (job_name) DO UPDATE SET latest_version = excluded.latest_version, "
+                "latest_hash = excluded.latest_hash, updated_at = excluded.updated_at",
+                (job_name, version, digest, saved_at))
+            return version, True
+
+    def load(self, job_name, version=None):
+        """
+        Parameters of ``job_name`` at ``version`` (default: latest). Raises KeyError if missing.
+        """
+        with self._connect() as connection:
+            if version is None:
+                row = connection.execute(
+                    "SELECT contents.params FROM jobs JOIN contents ON contents.hash = jobs.latest_hash WHERE job_name = ?",
+                    (job_name,)).fetchone()
+            else:
+                row = connection.execute(
+                    "SELECT contents.params FROM versions JOIN contents ON contents.hash = versions.hash "
+                    "WHERE job_name = ? AND version = ?", (job_name, int(version))).fetchone()
+        if row is None:
+            raise KeyError(f"{job_name} version {version}" if version is not None else job_name)
+        return json.loads(row[0])
+
+    def versions(self, job_name):
+        """
+        ``(version, saved_at, hash)`` for every version of ``job_name``, newest first.
+        """
+        with self._connect() as connection:
+            return connection.execute(
+                "SELECT version, saved_at, hash FROM versions WHERE job_name = ? ORDER BY version DESC", (job_name,)).fetchall()
+
+    def count_jobs(self):
+        with self._connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    def list_jobs(self, offset=0, limit=DEFAULT_PAGE_SIZE):
+        """
+        Job names, most recently updated first, one page at a time.
+        """
+        with self._connect() as connection:
+            rows = connection.execute("SELECT job_name FROM jobs ORDER BY updated_at DESC, job_name LIMIT ? OFFSET ?",
+                                      (limit, offset)).fetchall()
+        return [row[0] for row in rows]
+
+    def search(self, table=None, schema=None, output_table=None, offset=0, limit=DEFAULT_PAGE_SIZE):
+        """
+        Jobs whose latest version reads ``table`` / a table in ``schema``, or
+        writes ``output_table`` (all case-insensitive and combined with AND).
+        A ``schema`` matches either a source table schema or the output schema.
+        """
+        conditions = []
+        arguments = []
+        if table:
+            conditions.append("jobs.latest_hash IN (SELECT hash FROM content_tables WHERE table_name = ? COLLATE NOCASE)")
+            arguments.append(table)
+        if schema:
+            conditions.append("(jobs.latest_hash IN (SELECT hash FROM content_tables WHERE table_schema = ? COLLATE NOCASE) "
+                              "OR contents.output_schema = ? COLLATE NOCASE)")
+            arguments.extend([schema, schema])
+        if output_table:
+            conditions.append("contents.output_table = ? COLLATE NOCASE")
+            arguments.append(output_table)
+        where = " AND ".join(conditions) or "1"
+        with self._connect() as connection:
+            rows = connection.execute(
+                f"SELECT job_name FROM jobs JOIN contents ON contents.hash = jobs.latest_hash WHERE {where} "
+                "ORDER BY jobs.updated_at DESC, job_name LIMIT ? OFFSET ?", arguments + [limit, offset]).fetchall()
+        return [row[0] for row in rows]
+
+    def import_json_files(self, directory="."):
+        """
+        Import the parameter files in ``directory`` (see ``utils.list_parameter_files``)
+        as versions named after the file. Returns ``(imported, unchanged, failed)``
+        counts; importing again only adds files whose contents changed.
+        """
+        imported = unchanged = failed = 0
+        for filename in sorted(os.listdir(directory)):
+            if not is_parameter_file(filename):
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                with open(path, "r") as f:
+                    params = json.load(f)
+            except (OSError, ValueError):
+                failed += 1
+                continue
+            saved_at = datetime.fromtimestamp(os.path.getmtime(path)).isoformat(timespec="seconds")
+            _, created = self.save(os.path.splitext(filename)[0], params, saved_at=saved_at)
+            imported += created
+            unchanged += not created
+        return imported, unchanged, failed
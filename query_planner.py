@@ -0,0 +1,655 @@
+import heapq
+import re
+from functools import lru_cache
+
+# Words that look like identifiers in Spark SQL expressions but are not columns
+SQL_KEYWORDS = {
+    "and", "or", "not", "null", "is", "in", "like", "rlike", "ilike", "between", "exists",
+    "case", "when", "then", "else", "end", "as", "true", "false", "distinct", "all", "any",
+    "interval", "year", "month", "day", "hour", "minute", "second", "date", "timestamp",
+    "int", "integer", "bigint", "smallint", "tinyint", "long", "string", "double", "float",
+    "decimal", "boolean", "binary", "over", "partition", "by", "order", "asc", "desc",
+    "nulls", "first", "last", "rows", "range", "unbounded", "preceding", "following",
+    "current", "row", "group", "having", "filter", "within", "escape",
+}
+
+AGGREGATE_FUNCTIONS = ['sum(', 'avg(', 'count(', 'max(', 'min(']
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_IDENTIFIER = re.compile(r"`[^`]+`(?:\.`[^`]+`)?|[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)?")
+_FUNCTION_CALL = re.compile(r"\s*\(")
+_TABLE_DICT_COLUMN = re.compile(r"table_dict\[\s*['\"](\w+)['\"]\s*\]\s*\[\s*['\"](\w+)['\"]\s*\]")
+
+
+def classify_transformation(expression):
+    """
+    "group_by" for "group by ..." entries, "aggregate" for expressions using an
+    aggregate function, "select" for everything else.
+    """
+    lowered = expression.lower()
+    if lowered.startswith("group by"):
+        return "group_by"
+    if any(agg_func in lowered for agg_func in AGGREGATE_FUNCTIONS):
+        return "aggregate"
+    return "select"
+
+
+def sql_column_references(sql):
+    """
+    Column references in a Spark SQL expression, as written ("alias.column" or
+    "column"). Function names, keywords, literals and numbers are skipped.
+    """
+    text = _STRING_LITERAL.sub(" ", sql or "")
+    references = []
+    for match in _IDENTIFIER.finditer(text):
+        start, end = match.span()
+        if start > 0 and (text[start - 1].isdigit() or text[start - 1] == '.'):
+            continue  # Exponent / decimal part of a number, or a nested field
+        if _FUNCTION_CALL.match(text, end):
+            continue  # Function call
+        token = match.group(0).replace("`", "")
+        if token.lower() in SQL_KEYWORDS:
+            continue
+        references.append(token)
+    return references
+
+
+@lru_cache(maxsize=4096)
+def python_column_references(code):
+    """
+    Column references in a join condition written as Python: ``table_dict["a"]["c"]``
+    lookups plus the SQL column references inside every string literal
+    (``col("a.c")``, ``expr("a.c = b.c")``). Cached, since every join planner
+    parses the same conditions.
+    """
+    references = [f"{alias}.{column}" for alias, column in _TABLE_DICT_COLUMN.findall(code or "")]
+    remainder = _TABLE_DICT_COLUMN.sub(" ", code or "")
+    for literal in _STRING_LITERAL.findall(remainder):
+        references.extend(sql_column_references(literal[1:-1]))
+    return tuple(references)
+
+
+def split_conjuncts(sql):
+    """
+    Split a predicate on its top-level ANDs, leaving parenthesised groups, string
+    literals and the AND of ``BETWEEN x AND y`` intact.
+    """
+    if not sql or not sql.strip():
+        return []
+    conjuncts = []
+    depth = 0
+    start = 0
+    pending_between = False
+    tokens = re.finditer(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|[()]|\b(?:and|between)\b", sql, re.IGNORECASE)
+    for token in tokens:
+        value = token.group(0)
+        if value == "(":
+            depth += 1
+        elif value == ")":
+            depth -= 1
+        elif depth == 0 and value.lower() == "between":
+            pending_between = True
+        elif depth == 0 and value.lower() == "and":
+            if pending_between:
+                pending_between = False
+                continue
+            conjuncts.append(sql[start:token.start()].strip())
+            start = token.end()
+    conjuncts.append(sql[start:].strip())
+    return [conjunct for conjunct in conjuncts if conjunct]
+
+
+def null_supplying_aliases(tables, joins):
+    """
+    Aliases whose rows can be null-extended by an outer join. Filtering them
+    before the join would change the result, so their predicates stay global.
+    """
+    joined = [tables[0]['alias']] if tables else []
+    null_supplying = set()
+    for join in joins:
+        join_type = join['type'].lower()
+        right = join.get('right_table')
+        if join_type in ('left', 'left_outer', 'leftouter') and right:
+            null_supplying.add(right)
+        elif join_type in ('right', 'right_outer', 'rightouter'):
+            null_supplying.update(joined)
+        elif join_type in ('full', 'outer', 'full_outer', 'fullouter'):
+            null_supplying.update(joined)
+            if right:
+                null_supplying.add(right)
+        if right and join_type not in ('subquery', 'self'):
+            joined.append(right)
+    return null_supplying
+
+
+def _attribute(references, aliases):
+    """
+    Map column references to {alias: [column, ...]}; returns the mapping and
+    the references that cannot be attributed to a table.
+    """
+    columns = {}
+    unresolved = []
+    for reference in references:
+        if '.' in reference:
+            alias, column = reference.split('.', 1)
+            if alias in aliases:
+                columns.setdefault(alias, []).append(column)
+                continue
+        unresolved.append(reference)
+    return columns, unresolved
+
+
+def _unique(values):
+    seen = set()
+    unique = []
+    for value in values:
+        if value.lower() not in seen:
+            seen.add(value.lower())
+            unique.append(value)
+    return unique
+
+
+def plan_pushdown_and_pruning(tables, joins, predicates, transformations, partition_columns=(), static_partition_columns=(),
+                              pushdown_predicates=True, prune_columns=True):
+    """
+    Analysis pass over tables, joins, predicates and transformations.
+
+    Splits the global predicate into conjuncts and pushes every conjunct that
+    references a single table (which no outer join null-extends) into that
+    table's filter. Then works out the columns each table must provide to the
+    joins, remaining predicates, transformations and output, so the reads can
+    select only those.
+
+    Returns a dict with ``pushed`` ({alias: [predicate, ...]}), ``predicates``
+    (what is left of the global predicate), ``columns`` ({alias: [column, ...]}
+    or None when pruning is not safe) and ``notes`` explaining the choices.
+    """
+    aliases = {table['alias'] for table in tables}
+    plan = {"pushed": {}, "predicates": predicates, "columns": None, "notes": []}
+
+    remaining = []
+    blocked = null_supplying_aliases(tables, joins)
+    for conjunct in split_conjuncts(predicates):
+        referenced, unresolved = _attribute(sql_column_references(conjunct), aliases)
+        if pushdown_predicates and len(referenced) == 1 and not unresolved:
+            alias = next(iter(referenced))
+            if alias not in blocked:
+                plan["pushed"].setdefault(alias, []).append(conjunct)
+                continue
+        remaining.append(conjunct)
+    if plan["pushed"]:
+        if len(remaining) > 1:
+            remaining = [f"({conjunct})" for conjunct in remaining]
+        plan["predicates"] = " AND ".join(remaining)
+
+    if not prune_columns:
+        return plan
+
+    kinds = [classify_transformation(transform['expression']) for transform in transformations]
+    if "group_by" not in kinds and "select" not in kinds:
+        plan["notes"].append("Column pruning skipped: without a select or group by every column is written")
+        return plan
+    if any(join['type'] in ('subquery', 'self') for join in joins):
+        plan["notes"].append("Column pruning skipped: subquery and self-joins reference columns by their own aliases")
+        return plan
+
+    output_columns = {transform['output_column'].lower() for transform in transformations if transform.get('output_column')}
+    references = []
+    for join in joins:
+        references.extend(python_column_references(join['conditions']))
+    for conjunct in split_conjuncts(plan["predicates"]):
+        references.extend(sql_column_references(conjunct))
+    for transform, kind in zip(transformations, kinds):
+        expression = transform['expression']
+        if kind == "group_by":
+            expression = expression[len("group by"):]
+            output_columns.update(reference.split('.')[-1].lower() for reference in sql_column_references(expression))
+        references.extend(sql_column_references(expression))
+
+    columns, unresolved = _attribute(references, aliases)
+    unresolved = [reference for reference in unresolved if reference.lower() not in output_columns]
+    if unresolved:
+        plan["notes"].append(f"Column pruning skipped: cannot tell which table {', '.join(_unique(unresolved))} comes from")
+        return plan
+
+    missing = [column for column in partition_columns
+               if column.lower() not in output_columns and column not in static_partition_columns]
+    if missing:
+        plan["notes"].append(f"Column pruning skipped: partition column(s) {', '.join(missing)} are not produced by the transformations")
+        return plan
+
+    # A table none of whose columns are referenced is left as is rather than selecting nothing
+    plan["columns"] = {alias: _unique(alias_columns) for alias, alias_columns in columns.items() if alias_columns}
+    return plan
+
+
+# Exhaustive (dynamic programming) join ordering up to this many relations, greedy beyond
+MAX_DP_RELATIONS = 12
+
+REORDERABLE_JOIN_TYPES = ("inner",)
+
+
+def _cardinality_model(tables):
+    """
+    Base cardinality per alias: row counts when every table has one, else sizes
+    in bytes when every table has one, else None (no reordering).
+    """
+    if tables and all(table.get('rows') not in (None, "") for table in tables):
+        return "rows", {table['alias']: float(table['rows']) for table in tables}
+    if tables and all(table.get('size_gb') not in (None, "") for table in tables):
+        return "bytes", {table['alias']: float(table['size_gb']) * 1024 ** 3 for table in tables}
+    return None, None
+
+
+def join_aliases(condition, aliases):
+    """
+    Table aliases a join condition references.
+    """
+    referenced, _ = _attribute(python_column_references(condition), aliases)
+    return set(referenced)
+
+
+class _JoinGraph:
+    """
+    Cardinality estimates for one run of inner joins that may be reordered.
+
+    A set of relations joined onto the fixed prefix has cardinality
+    prefix * product(filtered table cardinality) * product(condition selectivity)
+    over the conditions whose aliases are all present. Without a selectivity hint a
+    condition is assumed to look up a unique key of the table the user joined it
+    with (a dimension), so its selectivity is 1 / that table's base cardinality.
+    """
+
+    def __init__(self, prefix_aliases, prefix_cardinality, relations, conditions, base, filtered):
+        self.prefix_aliases = prefix_aliases
+        self.prefix_cardinality = prefix_cardinality
+        self.relations = relations
+        self.conditions = conditions
+        self.index = {alias: position for position, alias in enumerate(relations)}
+        self.cardinality = [filtered[alias] for alias in relations]
+        # Conditions as bitmasks over the relations; prefix aliases are always present
+        self.condition_masks = []
+        self.selectivities = []
+        for condition in conditions:
+            mask = 0
+            for alias in condition["aliases"]:
+                if alias in self.index:
+                    mask |= 1 << self.index[alias]
+            self.condition_masks.append(mask)
+            if condition["selectivity"] is not None:
+                self.selectivities.append(float(condition["selectivity"]))
+            elif condition["join"]['right_table'] in condition["aliases"]:
+                self.selectivities.append(1 / max(1.0, base[condition["join"]['right_table']]))
+            else:
+                self.selectivities.append(1 / max(1.0, min(base[alias] for alias in condition["aliases"])))
+
+        # Per relation, the conditions that reference it, so that extending a set
+        # only looks at the conditions the new relation can complete
+        self.relation_conditions = [[] for _ in relations]
+        self.neighbours = [set() for _ in relations]
+        for condition, condition_mask, selectivity in zip(conditions, self.condition_masks, self.selectivities):
+            positions = {self.index[alias] for alias in condition["aliases"] if alias in self.index}
+            for position in positions:
+                self.relation_conditions[position].append((condition_mask, selectivity))
+                self.neighbours[position].update(positions - {position})
+
+    def extend(self, mask, cardinality, position):
+        """
+        Cardinality after joining relation ``position`` onto the set ``mask`` of
+        cardinality ``cardinality``, or None when no condition connects them.
+        """
+        extended = mask | 1 << position
+        cardinality *= self.cardinality[position]
+        connected = False
+        for condition_mask, selectivity in self.relation_conditions[position]:
+            if condition_mask & ~extended == 0:
+                cardinality *= selectivity
+                connected = True
+        return cardinality if connected else None
+
+    def cost(self, order):
+        """
+        Sum of the intermediate result sizes of ``order`` and the final size.
+        """
+        mask = 0
+        cardinality = self.prefix_cardinality
+        total = 0.0
+        for alias in order:
+            position = self.index[alias]
+            cardinality = self.extend(mask, cardinality, position) or cardinality * self.cardinality[position]
+            mask |= 1 << position
+            total += cardinality
+        return total, cardinality
+
+    def best_order(self):
+        count = len(self.relations)
+        if count <= MAX_DP_RELATIONS:
+            return self._dynamic_programming()
+        return self._greedy()
+
+    def _dynamic_programming(self):
+        # The cardinality of a set does not depend on the order it was joined in
+        best = {0: (0.0, [], self.prefix_cardinality)}
+        for mask in range(1 << len(self.relations)):
+            if mask not in best:
+                continue
+            cost, order, cardinality = best[mask]
+            for position in range(len(self.relations)):
+                if mask >> position & 1:
+                    continue
+                extended_cardinality = self.extend(mask, cardinality, position)
+                if extended_cardinality is None:
+                    continue
+                extended = mask | 1 << position
+                extended_cost = cost + extended_cardinality
+                if extended not in best or extended_cost < best[extended][0]:
+                    best[extended] = (extended_cost, order + [self.relations[position]], extended_cardinality)
+        full = (1 << len(self.relations)) - 1
+        return best[full][1] if full in best else None
+
+    def _greedy(self):
+        # Every candidate's growth factor only changes when a relation it shares a
+        # condition with is joined, so stale heap entries are skipped lazily
+        mask = 0
+        factors = [self.extend(mask, 1.0, position) for position in range(len(self.relations))]
+        heap = [(factor, position) for position, factor in enumerate(factors) if factor is not None]
+        heapq.heapify(heap)
+        order = []
+        while heap:
+            factor, position = heapq.heappop(heap)
+            if mask >> position & 1 or factor != factors[position]:
+                continue
+            mask |= 1 << position
+            order.append(self.relations[position])
+            for neighbour in self.neighbours[position]:
+                if not mask >> neighbour & 1:
+                    factors[neighbour] = self.extend(mask, 1.0, neighbour)
+                    if factors[neighbour] is not None:
+                        heapq.heappush(heap, (factors[neighbour], neighbour))
+        return order if len(order) == len(self.relations) else None
+
+
+def _format_estimate(value, unit):
+    return f"{value:.3g} {unit}"
+
+
+def plan_join_order(tables, joins):
+    """
+    Reorder runs of consecutive inner joins to minimise the estimated size of
+    the intermediate results (the sum of the result sizes after every join).
+
+    The first table stays the base of the chain. Outer, subquery and self joins
+    are barriers that keep their position, so outer-join semantics are
+    preserved. Conditions move to the first join at which every alias they
+    reference is available; several conditions on one join are combined with &.
+    A run is left as is when sizes are missing, a condition references no known
+    alias, or a table would be joined twice.
+
+    Returns ``(joins, notes)``.
+    """
+    unit, base = _cardinality_model(tables)
+    if unit is None or not joins:
+        return joins, []
+
+    filtered = {table['alias']: base[table['alias']] * float(table.get('selectivity') or 1) for table in tables}
+    aliases = set(base)
+    joined = {tables[0]['alias']}
+    cardinality = filtered[tables[0]['alias']]
+    ordered = []
+    notes = []
+
+    position = 0
+    while position < len(joins):
+        end = position
+        while end < len(joins) and joins[end]['type'] in REORDERABLE_JOIN_TYPES:
+            end += 1
+        if end == position:
+            join = joins[position]
+            if join.get('right_table') in filtered:
+                cardinality = max(cardinality, filtered[join['right_table']])
+                joined.add(join['right_table'])
+            ordered.append(join)
+            position += 1
+            continue
+
+        run = joins[position:end]
+        position = end
+        relations = [join['right_table'] for join in run]
+        conditions = [{"text": join['conditions'], "aliases": join_aliases(join['conditions'], aliases),
+                       "selectivity": join.get('selectivity'), "join": join} for join in run]
+        relation_set = set(relations)
+        reorderable = (
+            len(run) > 1
+            and len(relation_set) == len(relations)
+            and all(relation in filtered and relation not in joined for relation in relations)
+            and all(condition["aliases"] and all(alias in relation_set or alias in joined for alias in condition["aliases"])
+                    for condition in conditions)
+        )
+        if not reorderable:
+            ordered.extend(run)
+            joined.update(relation for relation in relations if relation in filtered)
+            continue
+
+        graph = _JoinGraph(joined, cardinality, relations, conditions, base, filtered)
+        order = graph.best_order()
+        if order is None:
+            ordered.extend(run)
+            joined.update(relations)
+            continue
+
+        original_cost, final_cardinality = graph.cost(relations)
+        chosen_cost, _ = graph.cost(order)
+        if chosen_cost >= original_cost:
+            order = relations
+        if order == relations:
+            notes.append(f"Join order kept: {', '.join(relations)} "
+                         f"(estimated intermediate size {_format_estimate(original_cost, unit)})")
+            ordered.extend(run)
+        else:
+            notes.append(f"Join order: {', '.join(order)} (estimated intermediate size {_format_estimate(chosen_cost, unit)}) "
+                         f"instead of {', '.join(relations)} ({_format_estimate(original_cost, unit)})")
+            ordered.extend(_reattach_conditions(order, run, conditions, joined))
+
+        joined.update(relations)
+        cardinality = final_cardinality
+
+    return ordered, notes
+
+
+def _reattach_conditions(order, run, conditions, joined):
+    """
+    Rebuild the joins of a reordered run, moving every condition to the first
+    join at which all of its aliases are available.
+    """
+    joins_by_right = {join['right_table']: join for join in run}
+    available = set(joined)
+    # Conditions over the prefix alone apply to the first join, the others are
+    # looked up through the relations they reference
+    pending = {index for index, condition in enumerate(conditions) if condition["aliases"] <= available}
+    by_relation = {}
+    for index, condition in enumerate(conditions):
+        for alias in condition["aliases"] - available:
+            by_relation.setdefault(alias, []).append(index)
+    applied = set()
+    reordered = []
+    for relation in order:
+        available.add(relation)
+        candidates = pending | {index for index in by_relation.get(relation, ()) if conditions[index]["aliases"] <= available}
+        applicable = [conditions[index] for index in sorted(candidates - applied)]
+        applied |= candidates
+        pending = set()
+        join = dict(joins_by_right[relation])
+        if len(applicable) == 1:
+            join['conditions'] = applicable[0]["text"]
+        else:
+            join['conditions'] = " & ".join(f"({condition['text']})" for condition in applicable)
+        others = sorted(set().union(*(condition["aliases"] for condition in applicable)) - {relation})
+        if others:
+            join['left_table'] = others[0]
+        # A selectivity hint belongs to the condition it was given with
+        join.pop('selectivity', None)
+        if len(applicable) == 1 and applicable[0]["selectivity"] is not None:
+            join['selectivity'] = applicable[0]["selectivity"]
+        reordered.append(join)
+    return reordered
+
+
+# Aggregates that can be computed in two steps: (partial aggregates, how the final step combines them)
+DECOMPOSABLE_AGGREGATES = {
+    "sum": (("sum", "SUM({arg})"),),
+    "count": (("count", "COUNT({arg})"),),
+    "min": (("min", "MIN({arg})"),),
+    "max": (("max", "MAX({arg})"),),
+    "avg": (("sum", "SUM({arg})"), ("count", "COUNT({arg})")),
+}
+_FINAL_AGGREGATES = {
+    "sum": "SUM({sum})",
+    "count": "SUM({count})",
+    "min": "MIN({min})",
+    "max": "MAX({max})",
+    "avg": "SUM({sum}) / SUM({count})",
+}
+
+_AGGREGATE_CALL = re.compile(r"\s*(sum|count|min|max|avg)\s*\((.*)\)\s*$", re.IGNORECASE | re.DOTALL)
+_PLAIN_COLUMN = re.compile(r"\s*(?:`[^`]+`|[A-Za-z_]\w*)(?:\.(?:`[^`]+`|[A-Za-z_]\w*))?\s*$")
+
+
+def split_top_level(sql, separator=","):
+    """
+    Split a SQL list on separators outside parentheses and string literals.
+    """
+    parts = []
+    depth = 0
+    start = 0
+    for token in re.finditer(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|[()]|" + re.escape(separator), sql):
+        value = token.group(0)
+        if value == "(":
+            depth += 1
+        elif value == ")":
+            depth -= 1
+        elif value == separator and depth == 0:
+            parts.append(sql[start:token.start()].strip())
+            start = token.end()
+    parts.append(sql[start:].strip())
+    return [part for part in parts if part]
+
+
+def _aggregate_call(expression):
+    """
+    (function, argument) when ``expression`` is a single decomposable aggregate
+    call such as ``SUM(o.amount)``, else None.
+    """
+    match = _AGGREGATE_CALL.match(expression)
+    if not match or re.match(r"\s*distinct\b", match.group(2), re.IGNORECASE):
+        return None
+    depth = 0
+    for token in re.finditer(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|[()]", match.group(2)):
+        depth += 1 if token.group(0) == "(" else -1 if token.group(0) == ")" else 0
+        if depth < 0:
+            return None  # "SUM(a) + MAX(b)": the parentheses do not enclose the whole expression
+    return match.group(1).lower(), match.group(2).strip()
+
+
+def _plan_pre_aggregation(plan, tables, joins, predicates):
+    """
+    Find the table all aggregates read from and check that grouping it by its
+    join and group-by columns before the joins gives the same result.
+    """
+    if not joins or any(join['type'] in ('subquery', 'self') for join in joins):
+        return None
+    aliases = {table['alias'] for table in tables}
+    calls = [(output, _aggregate_call(expression)) for output, expression in plan["aggregates"]]
+    if not calls or any(call is None for _, call in calls) or plan["projections"]:
+        return None
+
+    owners, unresolved = _attribute([reference for _, (_, argument) in calls for reference in sql_column_references(argument)], aliases)
+    if unresolved or len(owners) != 1:
+        return None
+    alias = next(iter(owners))
+    if alias in null_supplying_aliases(tables, joins):
+        return None
+
+    join_columns, unresolved = _attribute([reference for join in joins for reference in python_column_references(join['conditions'])], aliases)
+    predicate_columns, predicate_unresolved = _attribute(sql_column_references(predicates), aliases)
+    key_references = [reference for expression, _ in plan["group_keys"] for reference in sql_column_references(expression)]
+    key_columns, key_unresolved = _attribute(key_references, aliases)
+    if unresolved or predicate_unresolved or key_unresolved or not join_columns.get(alias):
+        return None
+    group_keys = {column.lower() for column in key_columns.get(alias, [])}
+    shared = [column for column in _unique(join_columns[alias]) if column.lower() in group_keys]
+    if not shared:
+        return None
+
+    keys = _unique(join_columns[alias] + predicate_columns.get(alias, []) + key_columns.get(alias, []))
+    partials = {}
+    aggregates = []
+    for output, (function, argument) in calls:
+        names = {}
+        for kind, template in DECOMPOSABLE_AGGREGATES[function]:
+            # Aggregates sharing a partial (SUM and AVG of one column) read the same one
+            partial = template.format(arg=argument)
+            names[kind] = partials.setdefault(partial.lower(), (f"{output}__{kind}", partial))[0]
+        aggregates.append((output, _FINAL_AGGREGATES[function].format(**{kind: f"{alias}.{name}" for kind, name in names.items()})))
+    return {
+        "alias": alias,
+        "keys": [f"{alias}.{column}" for column in keys],
+        "partials": list(partials.values()),
+        "aggregates": aggregates,
+        "note": (f"Partial pre-aggregation: the group by includes the join key {', '.join(f'{alias}.{column}' for column in shared)}, "
+                 f"so {alias} is aggregated by {', '.join(keys)} before the joins and combined after them"),
+    }
+
+
+def plan_transformations(transformations, tables=(), joins=(), predicates="", pre_aggregate=True):
+    """
+    Turn the transformations into at most one projection or aggregation.
+
+    Non-aggregate expressions become one ``select``; an expression that uses
+    the output of an earlier one goes into a later select, so there are as
+    many selects as the longest such chain. With a group by or aggregates, the
+    aggregates become ``agg(expr(...).alias(...))`` and the other expressions
+    grouping keys. ``pre_aggregate`` looks for a partial aggregation of one
+    table before the joins (see ``_plan_pre_aggregation``); ``predicates`` are
+    the global predicates applied between the joins and the aggregation.
+
+    Returns a dict with ``group_keys`` ([(expression, output name or None)]),
+    ``aggregates`` and ``projections`` ([[(output, expression)], ...], one list
+    per select), ``outputs`` (in the order given), ``pre_aggregation`` (None or
+    the partial aggregation and the rewritten aggregates) and ``notes``.
+    """
+    plan = {"group_keys": [], "aggregates": [], "projections": [], "outputs": [], "pre_aggregation": None, "notes": []}
+    selects = []
+    for transform in transformations:
+        expression = transform['expression'].strip()
+        kind = classify_transformation(expression)
+        if kind == "group_by":
+            for key in split_top_level(expression[len("group by"):]):
+                plan["group_keys"].append((key, key.replace("`", "").split('.')[-1] if _PLAIN_COLUMN.match(key) else None))
+        elif kind == "aggregate":
+            plan["aggregates"].append((transform['output_column'], expression))
+            plan["outputs"].append(transform['output_column'])
+        else:
+            selects.append((transform['output_column'], expression))
+            plan["outputs"].append(transform['output_column'])
+
+    if plan["group_keys"] or plan["aggregates"]:
+        # A column that is not aggregated must be one of the grouping keys
+        plan["group_keys"].extend((expression, output) for output, expression in selects)
+        if selects:
+            plan["notes"].append(f"Grouping also by the non-aggregate output(s) {', '.join(output for output, _ in selects)}")
+        if pre_aggregate:
+            plan["pre_aggregation"] = _plan_pre_aggregation(plan, tables, joins, predicates)
+            if plan["pre_aggregation"]:
+                plan["aggregates"] = plan["pre_aggregation"]["aggregates"]
+        return plan
+
+    # Layer of each select: one more than the deepest earlier output it references
+    layers = {}
+    for output, expression in selects:
+        depth = max((layers[reference.lower()] + 1 for reference in sql_column_references(expression)
+                     if reference.lower() in layers), default=0)
+        layers[output.lower()] = depth
+        while len(plan["projections"]) <= depth:
+            plan["projections"].append([])
+        plan["projections"][depth].append((output, expression))
+    return plan
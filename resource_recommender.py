@@ -1,176 +1,504 @@
+from __future__ import annotations
+
+import functools
+from typing import NamedTuple
+
 import numpy as np
+import pandas as pd
+
+from cluster_optimizer import load_instance_catalog, optimize_fleet
+from executor_sizing import executor_configs, executor_layout
+from spark_code_generator import DEFAULT_SHUFFLE_PARTITION_MB
 from utils import parse_list_input
+from workload_model import load_workload_model
+
+# Memory the workers need per core, by workload type
+MEMORY_PER_CORE_GB = {
+    "ML/High Memory": 8,
+    "Streaming/ELT": 2,
+    "Data Caching/Analysis": 7.5,
+    "General": 4,
+}
+
+# Input is read in splits of this size; cores are sized to read it in INPUT_WAVES waves of tasks
+INPUT_SPLIT_MB = 128
+INPUT_WAVES = 64  # About 8 GB of input per core
+
+# Workloads whose data is cached on the workers' local disks
+LOCAL_DISK_WORKLOADS = ("Data Caching/Analysis",)
+
+# Jobs whose sources update (frequency) or must be fresh (recency) above this level load incrementally
+INCREMENTAL_LOAD_THRESHOLD = 7
+
+LIST_COLUMNS = ["table_sizes", "join_complexities", "transformation_complexities", "data_skews"]
+
+
+def _flatten_list_column(values, num_rows, default_value=1):
+    """
+    Flatten a column of comma-separated strings (or sequences / scalars) into one
+    float array plus the row index of every element.
+
+    Rows that fail to parse fall back to ``[default_value]`` like ``parse_list_input``,
+    and so do rows that end up empty.
+    """
+    if isinstance(values, np.ndarray) and values.dtype.kind in "biuf":
+        if values.ndim == 2:
+            return values.astype(float).ravel(), np.repeat(np.arange(num_rows), values.shape[1])
+        return values.astype(float), np.arange(num_rows)
+
+    values = list(values)
+    try:
+        # Fast path: parse every token of a string column in a single numpy conversion
+        flat = np.array(",".join(values).split(","), dtype=float)
+        counts = np.char.count(np.array(values, dtype=str), ",") + 1
+        return flat, np.repeat(np.arange(num_rows), counts)
+    except (TypeError, ValueError):
+        pass  # Non-string, empty or malformed entries, fall back to parsing row by row
+
+    parsed = [
+        parse_list_input(v, default_value) if isinstance(v, str)
+        else [float(x) for x in v] if _is_column(v)
+        else [float(v)]
+        for v in values
+    ]
+    rows = np.repeat(np.arange(num_rows), [len(p) for p in parsed])
+    flat = np.fromiter((x for p in parsed for x in p), dtype=float, count=len(rows))
+
+    missing = np.setdiff1d(np.arange(num_rows), rows)
+    if len(missing):
+        rows = np.concatenate([rows, missing])
+        flat = np.concatenate([flat, np.full(len(missing), float(default_value))])
+        order = np.argsort(rows, kind="stable")
+        rows, flat = rows[order], flat[order]
+    return flat, rows
+
+
+def _list_column_stats(values, num_rows, limits):
+    """
+    Per-row statistics of a list column, both over the full list and over the list
+    truncated/padded to ``limits`` entries the way ``recommend_resources`` does it.
+    """
+    if not _is_column(values):
+        values = [values] * num_rows
+    flat, rows = _flatten_list_column(values, num_rows)
+    counts = np.bincount(rows, minlength=num_rows)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+    total = np.bincount(rows, weights=flat, minlength=num_rows)
+    mean = total / counts
+    variance = np.bincount(rows, weights=(flat - mean[rows]) ** 2, minlength=num_rows) / counts
+    maximum = np.maximum.reduceat(flat, starts)
+
+    # Lists shorter than num_tables are repeated num_tables times, longer ones truncated
+    in_limit = (np.arange(len(flat)) - starts[rows]) < limits[rows]
+    truncated_total = np.bincount(rows, weights=np.where(in_limit, flat, 0.0), minlength=num_rows)
+    truncated_max = np.maximum.reduceat(np.where(in_limit, flat, -np.inf), starts)
+
+    return {
+        "sum": total,
+        "mean": mean,
+        "max": maximum,
+        "var": variance,
+        "padded_sum": np.where(counts < limits, limits * total, truncated_total),
+        "padded_max": truncated_max,
+    }
+
+
+def _is_column(value):
+    return isinstance(value, (list, tuple, np.ndarray, pd.Series))
+
+
+def _columns(job_specs):
+    """
+    Accept a pandas DataFrame or a mapping of column name -> array-like (or scalar
+    applied to every job) and return a dict of columns plus the number of jobs.
+    """
+    if isinstance(job_specs, pd.DataFrame):
+        columns = {name: job_specs[name].to_numpy() for name in job_specs.columns}
+        return columns, len(job_specs)
+    columns = dict(job_specs)
+    num_rows = max((len(value) for value in columns.values() if _is_column(value)), default=1)
+    return columns, num_rows
+
+
+def _column(columns, name, num_rows, default, dtype=float):
+    value = columns.get(name, default)
+    if not _is_column(value):
+        return np.full(num_rows, value, dtype=dtype)
+    return np.asarray(value).astype(dtype)
+
+
+def _job_stats(columns, num_rows):
+    num_tables = np.maximum(_column(columns, "num_tables", num_rows, 1, dtype=float).astype(int), 1)
+    stats = {name: _list_column_stats(columns.get(name, "1"), num_rows, num_tables) for name in LIST_COLUMNS}
+    return num_tables, stats
+
+
+def workload_features(num_tables, stats, recency, frequency):
+    """
+    The ``workload_model.FEATURES`` columns of a batch of jobs.
+    """
+    features = {"num_tables": num_tables, "recency": recency, "frequency": frequency}
+    for name in LIST_COLUMNS:
+        for stat in ("mean", "max", "var"):
+            features[f"{name}.{stat}"] = stats[name][stat]
+    return features
+
+
+def _score_workload_types(num_tables, stats, recency, frequency):
+    return load_workload_model().predict(workload_features(num_tables, stats, recency, frequency))
+
+
+def determine_workload_type_batch(job_specs):
+    """
+    Determine the workload type of many jobs at once.
+
+    ``job_specs`` is a pandas DataFrame (or a mapping of column -> array) with the
+    same fields as ``determine_workload_type``: num_tables, table_sizes,
+    join_complexities, transformation_complexities, data_skews, recency and
+    frequency. List fields may hold comma-separated strings or sequences.
+    Returns an array with one workload type per job.
+    """
+    columns, num_rows = _columns(job_specs)
+    num_tables, stats = _job_stats(columns, num_rows)
+    recency = _column(columns, "recency", num_rows, 5)
+    frequency = _column(columns, "frequency", num_rows, 5)
+    return _score_workload_types(num_tables, stats, recency, frequency)
 
 
 def determine_workload_type(num_tables, table_sizes, join_complexities, transformation_complexities, data_skews, recency, frequency):
-    num_tables = int(num_tables)
-    table_sizes = parse_list_input(table_sizes)
-    join_complexities = parse_list_input(join_complexities)
-    transformation_complexities = parse_list_input(transformation_complexities)
-    data_skews = parse_list_input(data_skews)
+    return determine_workload_type_batch({
+        "num_tables": [num_tables],
+        "table_sizes": [table_sizes],
+        "join_complexities": [join_complexities],
+        "transformation_complexities": [transformation_complexities],
+        "data_skews": [data_skews],
+        "recency": [recency],
+        "frequency": [frequency],
+    })[0]
+
+
+class Recommendation(NamedTuple):
+    """
+    Resource recommendation for one job. ``instance_fleet`` holds the worker
+    (instance type, count) pairs, largest size first; ``instance_type`` and its
+    cores and memory describe that first size. ``hourly_cost`` includes the
+    master. ``spark_configs`` holds (key, value) pairs and is passed as is to
+    ``generate_spark_code``; ``render()`` gives the text report shown in the UI.
+    """
+    workload_type: str
+    instance_type: str
+    instance_cores: int
+    instance_memory: float
+    master_instance_type: str
+    instance_fleet: tuple[tuple[str, int], ...]
+    hourly_cost: float
+    catalog_version: str
+    total_data_size: float
+    total_cores: int
+    workers: int
+    use_spot_instances: bool
+    sla_requirements: bool
+    enable_auto_termination: bool
+    spot_percentage: int
+    spot_workers: int
+    on_demand_workers: int
+    min_instances: int
+    max_instances: int
+    broadcast_joins: bool
+    salt_keys: bool
+    cache_intermediate: bool
+    incremental_load: bool
+    spark_configs: tuple[tuple[str, str], ...]
+    scale_out_adjustment: int = 1  # Add 1 instance at a time
+    scale_in_adjustment: int = -1  # Remove 1 instance at a time
+    cooldown_period: int = 300  # 5 minutes cooldown between scaling activities
+    max_execution_time: int = 6 * 60 * 60  # 6 hours in seconds
+
+    def notes(self):
+        """
+        Additional recommendations based on the input.
+        """
+        recommendations = []
+
+        # Adjust for spot instances
+        if self.use_spot_instances and not self.sla_requirements:
+            recommendations.append("Using spot instances for workers. Consider a mix of on-demand and spot instances for reliability.")
+        elif self.sla_requirements:
+            recommendations.append("Using on-demand instances due to SLA requirements.")
+
+        # Auto-termination
+        if self.enable_auto_termination:
+            recommendations.append("Enabled auto-termination. Cluster will terminate after 15 minutes of inactivity.")
+
+        if self.broadcast_joins:
+            recommendations.append("Consider using broadcast joins for smaller tables.")
+
+        if self.salt_keys:
+            recommendations.append("High data skew detected. Consider salting keys for better distribution.")
+
+        if self.cache_intermediate:
+            recommendations.append("Complex transformations detected. Consider caching intermediate results.")
+
+        if self.incremental_load:
+            recommendations.append("Frequently updated or freshness-critical data. Load incrementally: give the fact tables a watermark_column.")
+
+        recommendations.append(f"Configured auto-scaling with min instances: {self.min_instances}, max instances: {self.max_instances}")
+        recommendations.append(f"Scale-out adjustment: +{self.scale_out_adjustment} instance, Scale-in adjustment: {self.scale_in_adjustment} instance")
+        recommendations.append(f"Auto-scaling cooldown period: {self.cooldown_period} seconds")
+        recommendations.append(f"Added safeguard to terminate jobs running longer than {self.max_execution_time/3600} hours")
+        return recommendations
+
+    def render(self):
+        """
+        Text report of the recommendation.
+        """
+        # Display Spark Configurations with newline preserved
+        spark_configs_display = "\n".join(f"{key} = {value}" for key, value in self.spark_configs)
+
+        recommendations_display = "\n".join(self.notes())
+
+        workers_display = " + ".join(f"{count} x {instance_type}" for instance_type, count in self.instance_fleet)
+
+        return f"""
+    Detected Workload Type: {self.workload_type}
     
-    total_size = sum(table_sizes)
-    avg_size = total_size / len(table_sizes)
-    max_size = max(table_sizes)
-    size_variance = np.var(table_sizes)
+    EMR Cluster Recommendations:
+    - Master Node: 1 x {self.master_instance_type}
+    - Worker Nodes: {workers_display}
+    - Total Cores: {self.total_cores}
+    - Cores per Instance: {self.instance_cores}
+    - Memory per Instance: {self.instance_memory:g} GB
+    - Estimated Cost: ${self.hourly_cost:.2f} per hour (instance catalog {self.catalog_version})
+
+    Auto-scaling Configuration:
+    - Minimum Instances: {self.min_instances}
+    - Maximum Instances: {self.max_instances}
+    - Scale-out Adjustment: +{self.scale_out_adjustment} instance
+    - Scale-in Adjustment: {self.scale_in_adjustment} instance
+    - Cooldown Period: {self.cooldown_period} seconds
+
+    Spot Instance Configuration:
+    - Spot Percentage: {self.spot_percentage}%
+    - Recommended Spot Instances: {self.spot_workers if self.use_spot_instances else 'N/A'}
+    - Recommended On-Demand Instances: {self.on_demand_workers if self.use_spot_instances else self.workers}
+
+    Safeguards:
+    - Maximum Job Execution Time: {self.max_execution_time/3600} hours
+    - Long-running Job Termination: Enabled
     
-    avg_join_complexity = np.mean(join_complexities)
-    max_join_complexity = max(join_complexities)
+    Spark Configurations:
+    {spark_configs_display}
     
-    avg_transformation_complexity = np.mean(transformation_complexities)
-    max_transformation_complexity = max(transformation_complexities)
+    Additional Recommendations:
+    {recommendations_display}
     
-    avg_data_skew = np.mean(data_skews)
-    max_data_skew = max(data_skews)
-
-    # Initialize scores for each workload type
-    scores = {
-        "General": 0,
-        "ML/High Memory": 0,
-        "Streaming/ELT": 0,
-        "Data Caching/Analysis": 0
-    }
+    Note: These recommendations are based on general guidelines. Always test and adjust based on your specific workload and performance requirements.
+    """
 
-    # Scoring based on number of tables
-    if num_tables <= 5:
-        scores["ML/High Memory"] += 2
-        scores["General"] += 1
-    elif 5 < num_tables <= 15:
-        scores["General"] += 2
-        scores["Data Caching/Analysis"] += 1
-    else:
-        scores["Streaming/ELT"] += 2
-        scores["Data Caching/Analysis"] += 1
-
-    # Scoring based on data sizes
-    if avg_size > 500:
-        scores["ML/High Memory"] += 2
-    elif 100 < avg_size <= 500:
-        scores["Data Caching/Analysis"] += 2
-    elif avg_size <= 100:
-        scores["Streaming/ELT"] += 1
-        scores["General"] += 1
-
-    if max_size > 1000:
-        scores["ML/High Memory"] += 1
-    if size_variance > 10000:  # High variance in table sizes
-        scores["Data Caching/Analysis"] += 2
-
-    # Scoring based on join complexity
-    if avg_join_complexity > 7:
-        scores["Data Caching/Analysis"] += 2
-    elif 4 <= avg_join_complexity <= 7:
-        scores["General"] += 1
-        scores["Streaming/ELT"] += 1
-    if max_join_complexity > 8:
-        scores["Data Caching/Analysis"] += 1
-
-    # Scoring based on transformation complexity
-    if avg_transformation_complexity > 7:
-        scores["ML/High Memory"] += 2
-    elif 4 <= avg_transformation_complexity <= 7:
-        scores["Streaming/ELT"] += 2
-    if max_transformation_complexity > 8:
-        scores["ML/High Memory"] += 1
-
-    # Scoring based on data skew
-    if avg_data_skew > 7:
-        scores["Data Caching/Analysis"] += 2
-    elif 4 <= avg_data_skew <= 7:
-        scores["Streaming/ELT"] += 1
-    if max_data_skew > 8:
-        scores["Data Caching/Analysis"] += 1
-
-    # Scoring based on recency
-    if recency > 7:
-        scores["Streaming/ELT"] += 2
-    elif 4 <= recency <= 7:
-        scores["Data Caching/Analysis"] += 1
-
-    # Scoring based on frequency
-    if frequency > 7:
-        scores["Streaming/ELT"] += 2
-    elif 4 <= frequency <= 7:
-        scores["Data Caching/Analysis"] += 1
-
-    # Determine the workload type with the highest score
-    workload_type = max(scores, key=scores.get)
-
-    # If the highest score is not significantly higher than others, consider it a General workload
-    if scores[workload_type] - max(score for type, score in scores.items() if type != workload_type) <= 2:
-        workload_type = "General"
-
-    return workload_type
+    __str__ = render
 
 
-def recommend_resources(num_tables, table_sizes, join_complexities, transformation_complexities, 
-                        data_skews, use_spot_instances, sla_requirements, 
-                        workload_type, enable_auto_termination, recency, frequency):
-    # Input validation and parsing
-    try:
-        num_tables = int(num_tables)
-        table_sizes = parse_list_input(table_sizes)
-        join_complexities = parse_list_input(join_complexities)
-        transformation_complexities = parse_list_input(transformation_complexities)
-        data_skews = parse_list_input(data_skews)
-    except ValueError as e:
-        return f"Error in input: {str(e)}. Please check your inputs and try again."
+def normalize_workload_inputs(num_tables, table_sizes, join_complexities, transformation_complexities, data_skews, recency, frequency):
+    """
+    Canonical, hashable form of the ``determine_workload_type`` inputs, so that
+    "10, 20" and "10,20," map to the same cache entry.
+    """
+    def as_tuple(values):
+        if isinstance(values, str):
+            values = parse_list_input(values)
+        return tuple(float(x) for x in values) or (1.0,)
+
+    return (
+        int(num_tables),
+        as_tuple(table_sizes),
+        as_tuple(join_complexities),
+        as_tuple(transformation_complexities),
+        as_tuple(data_skews),
+        float(recency),
+        float(frequency),
+    )
+
 
-    # Ensure all lists have the same length as num_tables
-    table_sizes = table_sizes * num_tables if len(table_sizes) < num_tables else table_sizes[:num_tables]
-    join_complexities = join_complexities * num_tables if len(join_complexities) < num_tables else join_complexities[:num_tables]
-    transformation_complexities = transformation_complexities * num_tables if len(transformation_complexities) < num_tables else transformation_complexities[:num_tables]
-    data_skews = data_skews * num_tables if len(data_skews) < num_tables else data_skews[:num_tables]
+@functools.lru_cache(maxsize=4096)
+def _cached_workload_type(num_tables, table_sizes, join_complexities, transformation_complexities, data_skews, recency, frequency):
+    return determine_workload_type(num_tables, table_sizes, join_complexities, transformation_complexities, data_skews, recency, frequency)
 
-    total_data_size = sum(table_sizes)
 
+def determine_workload_type_cached(num_tables, table_sizes, join_complexities, transformation_complexities, data_skews, recency, frequency):
+    """
+    ``determine_workload_type`` memoized on the normalized inputs. Used by the
+    live UI, where every keystroke re-triggers detection.
+    """
+    return _cached_workload_type(*normalize_workload_inputs(
+        num_tables, table_sizes, join_complexities, transformation_complexities, data_skews, recency, frequency))
 
 
+def workload_type_cache_info():
+    return _cached_workload_type.cache_info()
 
-    # Initialize recommendations
-    recommendations = []
-    
-    # Calculate total cores needed based on data size and complexity
-    total_cores = max(2, int(np.ceil(total_data_size / 128)))  # Assuming 128MB per core
-    
-    # Determine instance types based on workload
-    if workload_type == "ML/High Memory":
-        instance_type = "r5.xlarge"  # Memory optimized
-    elif workload_type == "Streaming/ELT":
-        instance_type = "c5.xlarge"  # Compute optimized
-    elif workload_type == "Data Caching/Analysis":
-        instance_type = "i3.xlarge"  # Storage optimized
+
+def _adaptive_configs(partitions, factor):
+    return (
+        ("spark.sql.shuffle.partitions", str(partitions)),
+        ("spark.sql.adaptive.enabled", "true"),
+        ("spark.sql.adaptive.coalescePartitions.enabled", "true"),
+        ("spark.sql.adaptive.advisoryPartitionSizeInBytes", str(DEFAULT_SHUFFLE_PARTITION_MB * 1024 * 1024)),
+        ("spark.sql.adaptive.skewJoin.enabled", "true"),
+        ("spark.sql.adaptive.skewJoin.skewedPartitionFactor", str(factor)),
+        ("spark.sql.adaptive.skewJoin.skewedPartitionThresholdInBytes", "268435456"),  # 256MB
+        ("spark.sql.adaptive.localShuffleReader.enabled", "true"),
+        ("spark.sql.adaptive.optimizeSkewsInRebalancePartitions.enabled", "true"),
+    )
+
+
+def recommend_resources_batch(job_specs):
+    """
+    Size many EMR jobs in one vectorized pass.
+
+    ``job_specs`` is a pandas DataFrame (or a mapping of column -> array) with the
+    ``recommend_resources`` fields. ``workload_type`` is optional; jobs without
+    one get ``determine_workload_type`` applied. Boolean flags default to False
+    and recency/frequency to 5.
+
+    Returns a DataFrame with one row per job: workload type, instance sizing,
+    worker counts, spot split, autoscaling bounds and the Spark configurations.
+    """
+    columns, num_rows = _columns(job_specs)
+    num_tables, stats = _job_stats(columns, num_rows)
+    recency = _column(columns, "recency", num_rows, 5)
+    frequency = _column(columns, "frequency", num_rows, 5)
+    use_spot_instances = _column(columns, "use_spot_instances", num_rows, False, dtype=bool)
+    sla_requirements = _column(columns, "sla_requirements", num_rows, False, dtype=bool)
+    enable_auto_termination = _column(columns, "enable_auto_termination", num_rows, False, dtype=bool)
+
+    workload_type = columns.get("workload_type")
+    if workload_type is None or not _is_column(workload_type):
+        workload_type = np.full(num_rows, workload_type, dtype=object)
     else:
-        instance_type = "m5.xlarge"  # General purpose
+        workload_type = np.asarray(workload_type, dtype=object)
+    missing = pd.isna(workload_type) | (workload_type == "")
+    if missing.any():
+        workload_type = np.where(missing, _score_workload_types(num_tables, stats, recency, frequency), workload_type)
 
-        # Calculate instance details
-    instance_cores = 4  # Assuming 4 cores per instance, adjust as needed
-    instance_memory = 16  # Assuming 16 GB memory per instance, adjust as needed
+    total_data_size = stats["table_sizes"]["padded_sum"]
 
-    # Calculate number of worker nodes
-    workers = max(2, int(np.ceil(total_cores / instance_cores)))  # Assuming 4 cores per instance
+    # Calculate total cores needed based on data size (table sizes are in GB)
+    input_splits = total_data_size * 1024 / INPUT_SPLIT_MB
+    total_cores = np.maximum(2, np.ceil(input_splits / INPUT_WAVES)).astype(int)
 
     # Spot instance recommendations
-    spot_percentage = 0
-    if use_spot_instances:
-        spot_percentage = 80 if not sla_requirements else 20
-        recommended_spot_workers = int(workers * spot_percentage / 100)
-        recommended_on_demand_workers = workers - recommended_spot_workers
+    spot_percentage = np.where(use_spot_instances, np.where(sla_requirements, 20, 80), 0)
+
+    # Cheapest worker fleet from the instance catalog that covers the cores, memory and local disk
+    catalog = load_instance_catalog()
+    memory_per_core = pd.Series(workload_type).map(MEMORY_PER_CORE_GB).fillna(MEMORY_PER_CORE_GB["General"]).to_numpy()
+    local_disk = np.where(np.isin(workload_type, LOCAL_DISK_WORKLOADS), total_data_size, 0.0)
+    fleet = optimize_fleet(total_cores, total_cores * memory_per_core, local_disk, spot_percentage / 100, catalog)
+    primary, secondary = fleet["primary"], fleet["secondary"]
+    instance_fleet = [
+        ((catalog.instance_type[a], n),) + (((catalog.instance_type[b], m),) if b >= 0 else ())
+        for a, n, b, m in zip(primary.tolist(), fleet["primary_count"].tolist(), secondary.tolist(), fleet["secondary_count"].tolist())
+    ]
+    # The master is always on-demand
+    master = catalog.master_indices()[primary]
+    master_cost = catalog.on_demand_hourly[master] + catalog.emr_hourly[master]
+
+    # Calculate number of worker nodes
+    workers = fleet["primary_count"] + fleet["secondary_count"]
+    spot_workers = workers * spot_percentage // 100
 
     # Auto-scaling configurations
-    min_instances = max(1, workers - 2)  # Minimum instances is either 1 or 2 less than recommended
+    min_instances = np.maximum(1, workers - 2)  # Minimum instances is either 1 or 2 less than recommended
     max_instances = workers * 2  # Maximum instances is double the recommended
-    
-    scale_out_adjustment = 1  # Add 1 instance at a time
-    scale_in_adjustment = -1  # Remove 1 instance at a time
-    
-    cooldown_period = 300  # 5 minutes cooldown between scaling activities
-    
-    # Safeguards against long-running jobs
-    max_execution_time = 6 * 60 * 60  # 6 hours in seconds
 
-    # EMR step to monitor and terminate long-running jobs
-    termination_step = {
+    # Executors sized for the fleet's nodes, with the driver on the master
+    fleet_sizes = np.column_stack([primary, np.where(secondary >= 0, secondary, primary)])
+    layout = executor_layout(workload_type, catalog.vcpu[fleet_sizes], catalog.memory_gib[fleet_sizes],
+                             np.column_stack([fleet["primary_count"], fleet["secondary_count"]]),
+                             catalog.memory_gib[master], min_instances, max_instances)
+
+    # Without the job spec, assume the data is shuffled once; whole waves of at least one task per core
+    shuffle_partitions = np.ceil(total_data_size * 1024 / DEFAULT_SHUFFLE_PARTITION_MB / total_cores).clip(min=1).astype(int) * total_cores
+    skewed_partition_factor = np.maximum(5, stats["data_skews"]["padded_max"].astype(int))
+
+    # Formatted once per distinct (partitions, skew factor) pair; the executor settings are shared the same way
+    adaptive_configs = {}
+    spark_configs = []
+    for partitions, factor, executors in zip(shuffle_partitions.tolist(), skewed_partition_factor.tolist(), executor_configs(layout)):
+        adaptive = adaptive_configs.get((partitions, factor))
+        if adaptive is None:
+            adaptive = adaptive_configs[partitions, factor] = _adaptive_configs(partitions, factor)
+        spark_configs.append(adaptive + executors)
+
+    return pd.DataFrame({
+        "workload_type": workload_type,
+        "instance_type": catalog.instance_type[primary],
+        "instance_cores": catalog.vcpu[primary].astype(int),
+        "instance_memory": catalog.memory_gib[primary],
+        "master_instance_type": catalog.instance_type[master],
+        "instance_fleet": instance_fleet,
+        "hourly_cost": np.round(fleet["hourly_cost"] + master_cost, 4),
+        "catalog_version": catalog.version,
+        "total_data_size": total_data_size,
+        "total_cores": total_cores,
+        "workers": workers,
+        "use_spot_instances": use_spot_instances,
+        "sla_requirements": sla_requirements,
+        "enable_auto_termination": enable_auto_termination,
+        "spot_percentage": spot_percentage,
+        "spot_workers": spot_workers,
+        "on_demand_workers": workers - spot_workers,
+        "min_instances": min_instances,
+        "max_instances": max_instances,
+        "executor_cores": layout["executor_cores"],
+        "executor_memory_mb": layout["executor_memory_mb"],
+        "executor_instances": layout["executor_instances"],
+        "shuffle_partitions": shuffle_partitions,
+        "skewed_partition_factor": skewed_partition_factor,
+        "broadcast_joins": stats["join_complexities"]["padded_max"] > 7,
+        "salt_keys": stats["data_skews"]["padded_max"] > 7,
+        "cache_intermediate": stats["transformation_complexities"]["padded_max"] > 7,
+        "incremental_load": (frequency > INCREMENTAL_LOAD_THRESHOLD) | (recency > INCREMENTAL_LOAD_THRESHOLD),
+        "spark_configs": spark_configs,
+    })
+
+
+def recommendations_from_batch(batch):
+    """
+    Convert the rows of ``recommend_resources_batch`` into Recommendation objects.
+    """
+    fields = [field for field in Recommendation._fields if field in batch.columns]
+    return [Recommendation(**row) for row in batch[fields].to_dict("records")]
+
+
+def recommend_resources(num_tables, table_sizes, join_complexities, transformation_complexities, 
+                        data_skews, use_spot_instances, sla_requirements, 
+                        workload_type, enable_auto_termination, recency, frequency):
+    """
+    Recommend EMR resources for one job. Raises ValueError on invalid input.
+    """
+    batch = recommend_resources_batch({
+        "num_tables": [int(num_tables)],
+        "table_sizes": [table_sizes],
+        "join_complexities": [join_complexities],
+        "transformation_complexities": [transformation_complexities],
+        "data_skews": [data_skews],
+        "use_spot_instances": [use_spot_instances],
+        "sla_requirements": [sla_requirements],
+        "workload_type": [workload_type],
+        "enable_auto_termination": [enable_auto_termination],
+        "recency": [recency],
+        "frequency": [frequency],
+    })
+    return recommendations_from_batch(batch)[0]
+
+
+def long_running_job_termination_step(max_execution_time=6 * 60 * 60):
+    """
+    EMR step to monitor and terminate long-running jobs.
+    """
+    return {
         "Name": "Monitor and Terminate Long-Running Jobs",
         "ActionOnFailure": "CONTINUE",
         "HadoopJarStep": {
@@ -194,85 +522,3 @@ def recommend_resources(num_tables, table_sizes, join_complexities, transformati
             ]
         }
     }
-
-    
-    # Adjust for spot instances
-    if use_spot_instances and not sla_requirements:
-        recommendations.append("Using spot instances for workers. Consider a mix of on-demand and spot instances for reliability.")
-    elif sla_requirements:
-        recommendations.append("Using on-demand instances due to SLA requirements.")
-    
-    # Auto-termination
-    if enable_auto_termination:
-        recommendations.append("Enabled auto-termination. Cluster will terminate after 15 minutes of inactivity.")
-    
-    # Spark configurations
-    spark_configs = [
-        f"spark.sql.shuffle.partitions = {2 * total_cores}",
-        "spark.sql.adaptive.enabled = true",
-        "spark.sql.adaptive.coalescePartitions.enabled = true",
-        "spark.sql.adaptive.skewJoin.enabled = true",
-        f"spark.sql.adaptive.skewJoin.skewedPartitionFactor = {max(5, int(np.max(data_skews)))}",
-        "spark.sql.adaptive.skewJoin.skewedPartitionThresholdInBytes = 268435456",  # 256MB
-        "spark.sql.adaptive.localShuffleReader.enabled = true",
-        "spark.sql.adaptive.optimizeSkewsInRebalancePartitions.enabled = true",
-    ]
-    
-    # Additional recommendations based on input
-    if np.max(join_complexities) > 7:
-        recommendations.append("Consider using broadcast joins for smaller tables.")
-    
-    if np.max(data_skews) > 7:
-        recommendations.append("High data skew detected. Consider salting keys for better distribution.")
-    
-    if np.max(transformation_complexities) > 7:
-        recommendations.append("Complex transformations detected. Consider caching intermediate results.")
-
-    # Update recommendations list
-    recommendations.append(f"Configured auto-scaling with min instances: {min_instances}, max instances: {max_instances}")
-    recommendations.append(f"Scale-out adjustment: +{scale_out_adjustment} instance, Scale-in adjustment: {scale_in_adjustment} instance")
-    recommendations.append(f"Auto-scaling cooldown period: {cooldown_period} seconds")
-    recommendations.append(f"Added safeguard to terminate jobs running longer than {max_execution_time/3600} hours")
-
-    # Display Spark Configurations with newline preserved
-    spark_configs_display = "\n".join(spark_configs)
-
-    recommendations_display = "\n".join(recommendations)
-    
-    # Compile final recommendations
-    final_recommendation = f"""
-    Detected Workload Type: {workload_type}
-    
-    EMR Cluster Recommendations:
-    - Master Node: 1 x {instance_type}
-    - Worker Nodes: {workers} x {instance_type}
-    - Total Cores: {total_cores}
-    - Cores per Instance: {instance_cores}
-    - Memory per Instance: {instance_memory} GB
-
-    Auto-scaling Configuration:
-    - Minimum Instances: {min_instances}
-    - Maximum Instances: {max_instances}
-    - Scale-out Adjustment: +{scale_out_adjustment} instance
-    - Scale-in Adjustment: {scale_in_adjustment} instance
-    - Cooldown Period: {cooldown_period} seconds
-
-    Spot Instance Configuration:
-    - Spot Percentage: {spot_percentage}%
-    - Recommended Spot Instances: {recommended_spot_workers if use_spot_instances else 'N/A'}
-    - Recommended On-Demand Instances: {recommended_on_demand_workers if use_spot_instances else workers}
-
-    Safeguards:
-    - Maximum Job Execution Time: {max_execution_time/3600} hours
-    - Long-running Job Termination: Enabled
-    
-    Spark Configurations:
-    {spark_configs_display}
-    
-    Additional Recommendations:
-    {recommendations_display}
-    
-    Note: These recommendations are based on general guidelines. Always test and adjust based on your specific workload and performance requirements.
-    """
-    
-    return final_recommendation
\ No newline at end of file
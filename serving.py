@@ -0,0 +1,218 @@
+"""
+Serving: a worker pool for the CPU-bound handlers and a JSON HTTP API.
+
+    python -m cli serve --workers 4 --concurrency 16 --api-port 8001   # Gradio UI plus the API
+    python -m cli api --port 8001 --workers 4                          # API only, without gradio
+
+The recommender and the code generator hold the GIL, so the pool runs them in
+worker processes; the Gradio queue and the HTTP server threads only wait on
+them. The API is backed by the same functions as the UI and the CLI:
+
+    POST /recommend  one job spec (the ``recommend`` fields)   -> recommendation
+    POST /batch      {"jobs": [spec, ...]} or a list of specs   -> list of recommendations
+    POST /generate   {"params": {...}, "spec": {...}, "options": {...}} -> {"code", "recommendation"}
+    GET  /health
+
+Requests beyond ``max_pending`` in flight get 503 so that a burst cannot
+queue without bound.
+"""
+import asyncio
+import functools
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from bulk_generator import generate_from_parameters
+from resource_recommender import recommend_resources_batch, recommendations_from_batch
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+# Gradio queue: events processed at once, and events allowed to wait
+DEFAULT_CONCURRENCY = 16
+DEFAULT_QUEUE_SIZE = 256
+
+# HTTP API: requests in flight before answering 503, largest request body, and time allowed per request
+DEFAULT_MAX_PENDING = 256
+MAX_REQUEST_BYTES = 10 * 1024 * 1024
+REQUEST_TIMEOUT_SECONDS = 60
+
+# generate_spark_code options accepted by /generate
+GENERATE_OPTIONS = ("broadcast_threshold_mb", "target_file_size_mb", "max_records_per_file", "production", "storage_level",
+                    "skew_threshold", "salt_buckets", "shuffle_partition_mb", "incremental", "merge_keys", "watermark_table",
+                    "streaming", "trigger_interval", "checkpoint_location", "stream_source")
+
+
+def _warm_up():
+    # Load the instance catalog and compile the numpy paths before the first request
+    recommend_resources_batch({"num_tables": [1], "table_sizes": ["10"]})
+
+
+class WorkerPool:
+    """
+    Process pool for CPU-bound handlers; ``workers=1`` runs them on one
+    thread of this process instead.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS):
+        self.workers = max(1, workers or DEFAULT_WORKERS)
+        if self.workers == 1:
+            self.executor = ThreadPoolExecutor(max_workers=1, initializer=_warm_up)
+        else:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_warm_up)
+
+    def submit(self, func, *args):
+        return self.executor.submit(func, *args)
+
+    def wrap(self, func):
+        """
+        An async version of the module-level ``func`` that runs in the pool,
+        for use as a Gradio event handler.
+        """
+        @functools.wraps(func)
+        async def pooled(*args):
+            return await asyncio.wrap_future(self.submit(func, *args))
+        return pooled
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _recommendation_dict(recommendation):
+    return dict(recommendation._asdict(), notes=recommendation.notes(), report=recommendation.render())
+
+
+def recommend_payload(spec):
+    """
+    /recommend: the recommendation for one job spec.
+    """
+    if not isinstance(spec, dict):
+        raise TypeError("Expected a job spec object")
+    return _recommendation_dict(recommendations_from_batch(recommend_resources_batch(pd.DataFrame([spec])))[0])
+
+
+def batch_payload(body):
+    """
+    /batch: one recommendation row per job spec, in the batch output's columns.
+    """
+    jobs = body.get("jobs") if isinstance(body, dict) else body
+    if not isinstance(jobs, list):
+        raise TypeError("Expected a non-empty list of job specs")
+    if not jobs:
+        raise ValueError("Expected a non-empty list of job specs")
+    return json.loads(recommend_resources_batch(pd.DataFrame(jobs)).to_json(orient="records"))
+
+
+def generate_payload(body):
+    """
+    /generate: the Spark job for saved parameters, sized by the optional job spec.
+    """
+    if not isinstance(body, dict) or not isinstance(body.get("params"), dict):
+        raise TypeError("Expected {\"params\": {...}} with optional \"spec\" and \"options\"")
+    options = body.get("options") or {}
+    unknown = set(options) - set(GENERATE_OPTIONS)
+    if unknown:
+        raise ValueError(f"Unknown options: {', '.join(sorted(unknown))}")
+    recommendation = None
+    if body.get("spec"):
+        recommendation = recommendations_from_batch(recommend_resources_batch(pd.DataFrame([body["spec"]])))[0]
+    code = generate_from_parameters(body["params"], recommendation, **options)
+    return {"code": code, "recommendation": _recommendation_dict(recommendation) if recommendation else None}
+
+
+ROUTES = {
+    "/recommend": recommend_payload,
+    "/batch": batch_payload,
+    "/generate": generate_payload,
+}
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so load tests and tooling do not pay a TCP handshake per request
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload, default=_json_default).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._reply(200, {"status": "ok", "pending": self.server.pending, "workers": self.server.pool.workers})
+        else:
+            self._reply(404, {"error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        handler = ROUTES.get(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_REQUEST_BYTES:
+            self.close_connection = True
+            self._reply(413, {"error": f"Request body over {MAX_REQUEST_BYTES} bytes"})
+            return
+        raw = self.rfile.read(length)
+        if handler is None:
+            self._reply(404, {"error": f"Unknown path {self.path}"})
+            return
+        if not self.server.slots.acquire(blocking=False):
+            self._reply(503, {"error": "Server busy, retry later"})
+            return
+        try:
+            future = self.server.pool.submit(handler, json.loads(raw or b"null"))
+            self._reply(200, future.result(timeout=REQUEST_TIMEOUT_SECONDS))
+        except (ValueError, KeyError, TypeError) as e:
+            # json.JSONDecodeError is a ValueError
+            self._reply(400, {"error": str(e)})
+        except FutureTimeoutError:
+            self._reply(503, {"error": f"No result within {REQUEST_TIMEOUT_SECONDS} seconds"})
+        finally:
+            self.server.slots.release()
+
+    def log_message(self, format, *args):
+        logger.debug("api %s - %s", self.address_string(), format % args)
+
+
+class ApiServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server for the JSON API; handlers run in ``pool``.
+    """
+    daemon_threads = True
+    # Listen backlog, enough for a burst of 100+ clients connecting at once
+    request_queue_size = 256
+
+    def __init__(self, address, pool, max_pending=DEFAULT_MAX_PENDING):
+        super().__init__(address, _ApiHandler)
+        self.pool = pool
+        self.max_pending = max_pending
+        self.slots = threading.BoundedSemaphore(max_pending)
+
+    @property
+    def pending(self):
+        return self.max_pending - self.slots._value
+
+
+def start_api_server(host, port, pool, max_pending=DEFAULT_MAX_PENDING):
+    """
+    Serve the API from a background thread; returns the server (``shutdown()`` stops it).
+    """
+    server = ApiServer((host, port), pool, max_pending)
+    threading.Thread(target=server.serve_forever, name="api-server", daemon=True).start()
+    return server
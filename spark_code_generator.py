@@ -2,22 +2,702 @@
 
 import json
 import logging
+import math
 
-def generate_spark_code(tables_json, joins_json, predicates, spark_configs, output_table, output_schema, transformations_json, write_mode, partition_columns, partition_values):
-    logging.debug(f"generate_spark_code inputs: tables_json={tables_json}, joins_json={joins_json}, predicates={predicates}, spark_configs={spark_configs}, transformations_json={transformations_json}, write_mode={write_mode}, partition_columns={partition_columns}, partition_values={partition_values}")
-    
-    tables = json.loads(tables_json)
-    joins = json.loads(joins_json)
-    transformations = json.loads(transformations_json)
-    
-    spark_code = f"""
+from query_planner import (classify_transformation, plan_join_order, plan_pushdown_and_pruning, plan_transformations,
+                           python_column_references, sql_column_references)
+
+# Dimension tables at or below this size get an explicit broadcast() hint
+DEFAULT_BROADCAST_THRESHOLD_MB = 100
+
+# Output files are sized towards this target when a data-size estimate is available
+DEFAULT_TARGET_FILE_SIZE_MB = 256
+
+# Storage levels accepted for persist() in production mode (pyspark.StorageLevel names)
+STORAGE_LEVELS = ("MEMORY_ONLY", "MEMORY_AND_DISK", "MEMORY_AND_DISK_DESER", "DISK_ONLY", "OFF_HEAP",
+                  "MEMORY_ONLY_2", "MEMORY_AND_DISK_2", "DISK_ONLY_2")
+
+# In production mode, join chains this long get their lineage truncated with localCheckpoint()
+DEFAULT_CHECKPOINT_INTERVAL = 8
+
+# Join types whose right side can be broadcast without changing the result
+BROADCASTABLE_JOIN_TYPES = ("inner", "left", "left_outer", "left_semi", "left_anti", "semi", "anti", "cross")
+
+# Joins are salted above this skew score (0-10), the recommender's salt_keys cut-off
+DEFAULT_SKEW_THRESHOLD = 7
+
+# Salting replicates one side of the join once per bucket, so the bucket count is capped
+MAX_SALT_FACTOR = 64
+
+# Core count assumed for the salt factor when there is no Recommendation (2 workers x 4 cores)
+DEFAULT_SALT_CORES = 8
+
+# Join types that stay correct when the left side is salted and the right side exploded
+SALTABLE_JOIN_TYPES = ("inner", "left", "left_outer")
+
+# Shuffle partitions are sized towards this many MB each (also the AQE advisory partition size)
+DEFAULT_SHUFFLE_PARTITION_MB = 160
+
+# Partial aggregation is assumed to shrink the data to this fraction before the group-by shuffle
+AGGREGATION_SHUFFLE_FRACTION = 0.1
+
+# A group-by's output is assumed to be this fraction of its input when sizing output files
+AGGREGATION_OUTPUT_FRACTION = 0.01
+
+# A stage gets its own repartition() when it needs this many times fewer partitions than the global setting
+REPARTITION_HINT_RATIO = 4
+
+# Join types whose output keeps every row of the right side
+RIGHT_PRESERVING_JOIN_TYPES = ("right", "right_outer", "full", "full_outer", "outer")
+
+# State table, in the output schema, holding the watermarks of incremental loads
+DEFAULT_WATERMARK_TABLE = "incremental_watermarks"
+
+# Structured Streaming defaults: micro-batch trigger, event-time watermark delay and rate source speed
+DEFAULT_TRIGGER_INTERVAL = "1 minute"
+DEFAULT_WATERMARK_DELAY = "10 minutes"
+DEFAULT_RATE_ROWS_PER_SECOND = 100
+
+# Streaming sources: catalog tables, new files under the warehouse path, or the rate source for local tests
+STREAM_SOURCES = ("table", "file", "rate")
+
+# Join types Structured Streaming can run, by which side streams
+STREAM_STATIC_JOIN_TYPES = ("inner", "left", "left_outer", "left_semi", "semi")
+STATIC_STREAM_JOIN_TYPES = ("inner", "right", "right_outer")
+STREAM_STREAM_JOIN_TYPES = ("inner", "left", "left_outer", "right", "right_outer", "full", "full_outer", "outer", "left_semi", "semi")
+
+# State store partitions without a Recommendation; a query keeps the count of its first run
+DEFAULT_STATE_PARTITIONS = 8
+
+ROCKSDB_STATE_STORE = "org.apache.spark.sql.execution.streaming.state.RocksDBStateStoreProvider"
+
+# Load mode choices (CLI and UI) as generate_spark_code's ``incremental``; auto follows the Recommendation
+LOAD_MODES = {"auto": None, "full": False, "incremental": True}
+
+# Streaming choices (CLI and UI)
+STREAMING_MODES = {"auto": None, "on": True, "off": False}
+
+
+def format_spark_configs(spark_configs, overrides=None):
+    """
+    Turn Spark configs into SparkSession builder calls.
+
+    Accepts (key, value) pairs, a mapping, or a Recommendation (its
+    ``spark_configs`` are used). A string is taken as already rendered code.
+    ``overrides`` replace the value of a key in place, or are appended.
+    """
+    overrides = dict(overrides or {})
+    if isinstance(spark_configs, str):
+        spark_configs, rendered = [], [spark_configs]
+    else:
+        rendered = []
+    spark_configs = getattr(spark_configs, "spark_configs", spark_configs) or []
+    if isinstance(spark_configs, dict):
+        spark_configs = spark_configs.items()
+    pairs = [(key, overrides.pop(key, value)) for key, value in spark_configs] + list(overrides.items())
+    rendered.extend(f"spark = spark.config({str(key)!r}, {str(value)!r})" for key, value in pairs)
+    return "\n".join(rendered)
+
+
+def _spark_config_value(spark_configs, key):
+    """
+    Value of ``key`` in Spark configs of any form ``format_spark_configs``
+    accepts; None when it is not set or the configs are already rendered.
+    """
+    spark_configs = getattr(spark_configs, "spark_configs", spark_configs) or []
+    if isinstance(spark_configs, str):
+        return None
+    if isinstance(spark_configs, dict):
+        spark_configs = spark_configs.items()
+    return next((value for name, value in spark_configs if name == key), None)
+
+
+def table_size_mb(table):
+    """
+    Estimated size of a table spec in MB, from its optional ``size_gb`` field.
+    """
+    size_gb = table.get('size_gb')
+    if size_gb in (None, ""):
+        return None
+    return float(size_gb) * 1024
+
+
+def _describe_size(table):
+    description = f"~{float(table['size_gb']):g} GB"
+    if table.get('rows') not in (None, ""):
+        description += f", ~{int(float(table['rows'])):,} rows"
+    return description
+
+
+def plan_broadcast_joins(tables, joins, broadcast_threshold_mb=DEFAULT_BROADCAST_THRESHOLD_MB):
+    """
+    Decide per join whether the right-hand table should be broadcast.
+
+    Returns a list aligned with ``joins`` of ``(broadcast, reason)``; ``reason``
+    is None when the table has no size estimate, which leaves the join to Spark.
+    """
+    tables_by_alias = {table['alias']: table for table in tables}
+    plan = []
+    for join in joins:
+        table = tables_by_alias.get(join.get('right_table'))
+        if join['type'] in ('subquery', 'self') or table is None or table_size_mb(table) is None:
+            plan.append((False, None))
+            continue
+
+        size = _describe_size(table)
+        if table_size_mb(table) > broadcast_threshold_mb:
+            plan.append((False, f"Shuffle join: {join['right_table']} is {size}, above the {broadcast_threshold_mb:g} MB broadcast threshold"))
+        elif join['type'] not in BROADCASTABLE_JOIN_TYPES:
+            plan.append((False, f"Shuffle join: {join['right_table']} is {size} but a {join['type']} join cannot broadcast its right side"))
+        else:
+            plan.append((True, f"Broadcast {join['right_table']}: {size}, within the {broadcast_threshold_mb:g} MB threshold, so the left side is not shuffled"))
+    return plan
+
+
+def plan_reuse(tables, joins):
+    """
+    Find DataFrames that the generated job would evaluate more than once.
+
+    Returns the table aliases read by more than one join (or by the base and a
+    join), the subquery texts that appear more than once, and the indexes of
+    self-joins, which read result_df twice.
+    """
+    references = {}
+    if tables:
+        references[tables[0]['alias']] = 1
+    subqueries = {}
+    self_joins = []
+    for index, join in enumerate(joins):
+        if join['type'] == 'subquery':
+            subqueries[join['subquery']] = subqueries.get(join['subquery'], 0) + 1
+        elif join['type'] == 'self':
+            self_joins.append(index)
+        else:
+            references[join['right_table']] = references.get(join['right_table'], 0) + 1
+    return {
+        "tables": {alias for alias, count in references.items() if count > 1},
+        "subqueries": {subquery for subquery, count in subqueries.items() if count > 1},
+        "self_joins": self_joins,
+    }
+
+
+def salt_factor(skew, total_cores=None):
+    """
+    Number of salt buckets for a skewed join: a share of the cluster's cores that
+    grows with the skew score (0-10), at least 2 and at most MAX_SALT_FACTOR.
+    """
+    cores = total_cores or DEFAULT_SALT_CORES
+    return max(2, min(MAX_SALT_FACTOR, math.ceil(cores * float(skew) / 10)))
+
+
+def _hot_keys(join):
+    hot_keys = join.get('hot_keys') or []
+    if isinstance(hot_keys, str):
+        hot_keys = _split_csv(hot_keys)
+    return list(hot_keys)
+
+
+def _join_keys(condition, right_alias):
+    """
+    The (left, right) column pair of a single-equality condition, or None.
+    """
+    references = python_column_references(condition)
+    right = [reference for reference in references if reference.split('.')[0] == right_alias]
+    left = [reference for reference in references if '.' in reference and reference.split('.')[0] != right_alias]
+    if len(right) == 1 and len(left) == 1:
+        return left[0], right[0]
+    return None
+
+
+def plan_skew_joins(tables, joins, broadcast_plan, skew_threshold=DEFAULT_SKEW_THRESHOLD, total_cores=None, factor=None):
+    """
+    Decide per join whether to salt its key.
+
+    A join is skewed when it lists ``hot_keys`` or when a table it joins has a
+    ``skew`` score above ``skew_threshold``. The larger side (by ``size_gb``,
+    else the more skewed side) gets a random salt and the smaller side is
+    exploded over the salt range. Left joins can only salt their left side, and
+    broadcast joins are left alone since they do not shuffle. With hot keys and a single-equality condition only
+    the hot keys are salted.
+
+    Returns a list aligned with ``joins`` of None or a dict with ``salted``
+    ("left" or "right"), ``factor``, ``hot_keys``, ``keys`` and ``reason``.
+    """
+    skews = {table['alias']: float(table['skew']) for table in tables if table.get('skew') not in (None, "")}
+    sizes = {table['alias']: table_size_mb(table) for table in tables}
+    plan = []
+    for join, (use_broadcast, _) in zip(joins, broadcast_plan):
+        right_alias = join.get('right_table')
+        hot_keys = _hot_keys(join)
+        if join['type'] in ('subquery', 'self') or right_alias not in sizes:
+            plan.append(None)
+            continue
+
+        left_aliases = {reference.split('.')[0] for reference in python_column_references(join['conditions'])} - {right_alias}
+        left_skew = max([skews.get(alias, 0) for alias in left_aliases] or [0])
+        right_skew = skews.get(right_alias, 0)
+        skew = max(left_skew, right_skew)
+        if skew <= skew_threshold:
+            if not hot_keys:
+                plan.append(None)
+                continue
+            # Explicit hot keys count as the highest skew score
+            skew = 10
+        left_size = max([sizes.get(alias) or 0 for alias in left_aliases] or [0])
+        if sizes[right_alias] is not None and left_size:
+            salted = "right" if sizes[right_alias] > left_size else "left"
+        else:
+            salted = "right" if right_skew > left_skew else "left"
+        if use_broadcast:
+            plan.append(None)
+            continue
+        if join['type'] not in SALTABLE_JOIN_TYPES:
+            plan.append({"salted": None, "reason": f"Skewed {join['type']} join on {right_alias} cannot be salted without changing its result"})
+            continue
+        if salted == "right" and join['type'] != "inner":
+            plan.append({"salted": None, "reason": f"{right_alias} is skewed but a {join['type']} join can only salt its left side"})
+            continue
+
+        buckets = factor or salt_factor(skew, total_cores)
+        keys = _join_keys(join['conditions'], right_alias) if hot_keys else None
+        detail = f"skew score {skew:g}" if not hot_keys else f"hot keys {', '.join(map(str, hot_keys))}"
+        plan.append({
+            "salted": salted,
+            "factor": buckets,
+            "hot_keys": hot_keys if keys else [],
+            "keys": keys,
+            "reason": f"Skewed join on {right_alias} ({detail}): salt the {salted} side into {buckets} buckets",
+        })
+    return plan
+
+
+def _salted_join_code(join, salt, right_df):
+    """
+    Code for a salted join: a random salt on the skewed side, the salt range
+    exploded on the other side, a join on the original condition plus the salt,
+    and the salt columns dropped afterwards.
+    """
+    right_alias = join['right_table']
+    buckets = salt['factor']
+    random_salt = f"(rand(42) * {buckets}).cast('int')"
+    salt_range = f"sequence(lit(0), lit({buckets - 1}))"
+    if salt['hot_keys']:
+        left_key, right_key = salt['keys']
+        hot_keys = ", ".join(repr(key) for key in salt['hot_keys'])
+        salted_key, exploded_key = (left_key, right_key) if salt['salted'] == "left" else (right_key, left_key)
+        random_salt = f"when(col({salted_key!r}).isin({hot_keys}), {random_salt}).otherwise(lit(0))"
+        salt_range = f"when(col({exploded_key!r}).isin({hot_keys}), {salt_range}).otherwise(array(lit(0)))"
+    left_salt, right_salt = (random_salt, f"explode({salt_range})") if salt['salted'] == "left" else (f"explode({salt_range})", random_salt)
+    return f"""
+result_df = result_df.withColumn("_salt", {left_salt})
+salted_df = {right_df}.withColumn("_salt_{right_alias}", {right_salt})
+result_df = result_df.join(
+    salted_df,
+    ({join['conditions']}) & (col("_salt") == col("_salt_{right_alias}")),
+    "{join['type']}"
+).drop("_salt", "_salt_{right_alias}")
+"""
+
+
+def shuffle_partition_count(shuffled_mb, target_partition_mb=DEFAULT_SHUFFLE_PARTITION_MB, total_cores=None):
+    """
+    Partitions for an exchange of ``shuffled_mb``: about ``target_partition_mb``
+    each, rounded up to whole waves of ``total_cores`` tasks when given.
+    """
+    partitions = max(1, math.ceil(shuffled_mb / target_partition_mb))
+    if total_cores:
+        partitions = max(total_cores, math.ceil(partitions / total_cores) * total_cores)
+    return partitions
+
+
+def _describe_mb(size_mb):
+    if size_mb >= 100 * 1024:
+        return f"~{size_mb / 1024:,.0f} GB"
+    return f"~{size_mb / 1024:.3g} GB" if size_mb >= 1024 else f"~{size_mb:.3g} MB"
+
+
+def plan_shuffle_stages(tables, joins, transformations, broadcast_plan, skew_plan=None, total_cores=None,
+                        target_partition_mb=DEFAULT_SHUFFLE_PARTITION_MB):
+    """
+    Estimate the data moved by every exchange of the job and the shuffle
+    partitions it needs.
+
+    The result is followed through the join chain from the table ``size_gb`` /
+    ``rows`` estimates (and their ``selectivity`` hints). A join widens the
+    result rows by the right side's row width, at most doubling it, and the
+    result is capped at the two inputs scaled by the join's row growth: column
+    pruning keeps only the columns used downstream, so a chain of lookups does
+    not double the row width at every join. Without a join ``selectivity`` hint
+    a join is taken to look up a unique key (one match per row), and
+    right/full outer joins keep at least every right row. A shuffle join moves both sides (a
+    salted side times its salt factor), a broadcast join moves nothing and a
+    group-by moves the result after partial aggregation
+    (``AGGREGATION_SHUFFLE_FRACTION``).
+
+    ``spark.sql.shuffle.partitions`` is set for the largest exchange, since AQE
+    can coalesce partitions but not split them. Shuffle joins on a single key
+    and group-bys that need ``REPARTITION_HINT_RATIO`` times fewer partitions
+    get a ``repartition(n, keys)`` hint, which the join or aggregation reuses
+    instead of shuffling again.
+
+    Returns a dict with ``partitions`` (None when nothing is sized), ``joins``
+    (aligned with ``joins``: None or a stage dict), ``group_by`` (a stage dict
+    or None), ``notes`` and ``result_mb``, the estimated size of the joined
+    result (None when unknown). A stage dict has ``shuffled_mb``, ``partitions``,
+    ``hint`` and the join ``keys``.
+    """
+    skew_plan = skew_plan or [None] * len(joins)
+    filters = {table['alias']: float(table.get('selectivity') or 1) for table in tables}
+    sizes = {alias: (size * filters[alias] if size is not None else None)
+             for alias, size in ((table['alias'], table_size_mb(table)) for table in tables)}
+    rows = {table['alias']: float(table['rows']) * filters[table['alias']] for table in tables if table.get('rows') not in (None, "")}
+
+    result_mb = sizes.get(tables[0]['alias']) if tables else None
+    result_rows = rows.get(tables[0]['alias']) if tables else None
+    join_stages = []
+    for join, (use_broadcast, _), salt in zip(joins, broadcast_plan, skew_plan):
+        if result_mb is None:
+            join_stages.append(None)
+            continue
+        if join['type'] in ('subquery', 'self'):
+            # A subquery's size is unknown, so only the left side is counted; a self-join moves the result twice
+            shuffled = result_mb * (2 if join['type'] == 'self' else 1)
+            join_stages.append({"shuffled_mb": shuffled, "keys": None, "label": f"{join['type']} join"})
+            continue
+
+        right_alias = join['right_table']
+        right_mb = sizes.get(right_alias)
+        if right_mb is None:
+            join_stages.append(None)
+            continue
+        if use_broadcast:
+            join_stages.append(None)
+        else:
+            left_factor = right_factor = 1
+            if salt and salt['salted']:
+                left_factor, right_factor = (1, salt['factor']) if salt['salted'] == "left" else (salt['factor'], 1)
+            join_stages.append({
+                "shuffled_mb": result_mb * left_factor + right_mb * right_factor,
+                "keys": _join_keys(join['conditions'], right_alias) if not (salt and salt['salted']) else None,
+                "label": f"join with {right_alias}",
+            })
+
+        # Size of the join result
+        if result_rows and rows.get(right_alias):
+            right_rows = rows[right_alias]
+            output_rows = result_rows * right_rows * float(join['selectivity']) if join.get('selectivity') else result_rows
+            if join['type'] in RIGHT_PRESERVING_JOIN_TYPES:
+                output_rows = max(output_rows, right_rows)
+            left_width = result_mb / result_rows
+            result_mb = min(output_rows * (left_width + min(right_mb / right_rows, left_width)),
+                            (result_mb + right_mb) * output_rows / result_rows)
+            result_rows = output_rows
+        else:
+            result_mb += min(right_mb, result_mb)
+            result_rows = None
+
+    group_by_stage = None
+    if result_mb is not None and any(classify_transformation(transform['expression']) == "group_by" for transform in transformations):
+        group_by_stage = {"shuffled_mb": result_mb * AGGREGATION_SHUFFLE_FRACTION, "keys": None, "label": "group-by"}
+
+    stages = [stage for stage in join_stages + [group_by_stage] if stage is not None]
+    if not stages:
+        return {"partitions": None, "joins": join_stages, "group_by": None, "notes": [], "result_mb": result_mb}
+
+    for stage in stages:
+        stage["partitions"] = shuffle_partition_count(stage["shuffled_mb"], target_partition_mb, total_cores)
+    largest = max(stages, key=lambda stage: stage["partitions"])
+    partitions = largest["partitions"]
+    for stage in stages:
+        stage["hint"] = (stage["partitions"] * REPARTITION_HINT_RATIO <= partitions
+                         and (stage is group_by_stage or stage["keys"] is not None))
+        stage["note"] = (f"Shuffle for the {stage['label']}: {_describe_mb(stage['shuffled_mb'])} / "
+                         f"{target_partition_mb:g} MB = {stage['partitions']} partitions")
+
+    notes = [(f"Shuffle partitions: {partitions}, sized for the largest exchange ({largest['label']}, "
+              f"{_describe_mb(largest['shuffled_mb'])} at {target_partition_mb:g} MB per partition)")]
+    return {"partitions": partitions, "joins": join_stages, "group_by": group_by_stage, "notes": notes, "result_mb": result_mb}
+
+
+def _split_csv(value):
+    return [item.strip() for item in (value or "").split(',') if item.strip()]
+
+
+def estimate_output_gb(tables, spark_configs=None, transformations=()):
+    """
+    Output size estimate: the recommender's total data size when a Recommendation
+    is given, else the sum of the table ``size_gb`` estimates. A group-by
+    scales it by ``AGGREGATION_OUTPUT_FRACTION``; a global aggregate writes
+    one row.
+    """
+    total_data_size = getattr(spark_configs, "total_data_size", None)
+    if total_data_size:
+        input_gb = float(total_data_size)
+    else:
+        sizes = [table_size_mb(table) for table in tables]
+        sizes = [size for size in sizes if size is not None]
+        input_gb = sum(sizes) / 1024 if sizes else None
+    kinds = {classify_transformation(transform['expression']) for transform in transformations}
+    if input_gb is None or "group_by" not in kinds and "aggregate" not in kinds:
+        return input_gb
+    if "group_by" in kinds or "select" in kinds:
+        # Non-aggregate outputs next to aggregates are grouping keys too (see plan_transformations)
+        return input_gb * AGGREGATION_OUTPUT_FRACTION
+    return (estimate_row_bytes(tables) or 1024) / 1024 ** 3
+
+
+def estimate_row_bytes(tables):
+    """
+    Average row width of the largest table that has both size and row estimates.
+    """
+    sized = [table for table in tables if table_size_mb(table) and table.get('rows') not in (None, "")]
+    if not sized:
+        return None
+    largest = max(sized, key=table_size_mb)
+    rows = float(largest['rows'])
+    return table_size_mb(largest) * 1024 * 1024 / rows if rows else None
+
+
+def plan_output_layout(tables, partition_columns, partition_values, estimated_output_gb=None,
+                       target_file_size_mb=None, max_records_per_file=None, repartition_by_partition_columns=True):
+    """
+    Work out how the result is laid out on disk before the write.
+
+    Static partition columns are constant, so they are never repartition keys.
+    Hashing on a dynamic partition column alone would send all rows of one
+    value to one task; with a size estimate a ``pmod(hash(*), n)`` salt is
+    added to the keys, so a value is spread over up to ``n`` tasks of about
+    the target file size.
+
+    Returns a dict with the partition columns, static partition values, the
+    repartition count/columns/salt and maxRecordsPerFile, plus a comment per choice.
+    """
+    columns = _split_csv(partition_columns)
+    values = _split_csv(partition_values)
+    # Static partition values (Hive-style PARTITION (col='value')) when one is given per column
+    static_values = dict(zip(columns, values)) if values and len(values) == len(columns) else {}
+    layout = {
+        "partition_columns": columns,
+        "static_values": static_values,
+        "num_partitions": None,
+        "repartition_columns": [column for column in columns if column not in static_values] if repartition_by_partition_columns else [],
+        "salt_buckets": None,
+        "max_records_per_file": max_records_per_file,
+        "notes": [],
+    }
+
+    if target_file_size_mb and estimated_output_gb:
+        num_files = max(1, math.ceil(estimated_output_gb * 1024 / target_file_size_mb))
+        layout["num_partitions"] = num_files
+        layout["notes"].append(f"~{estimated_output_gb:g} GB output / {target_file_size_mb:g} MB target file size = {num_files} partitions")
+        if layout["repartition_columns"] and num_files > 1:
+            layout["salt_buckets"] = num_files
+            layout["notes"].append(f"Salted with pmod(hash(*), {num_files}) so each {', '.join(layout['repartition_columns'])} value "
+                                   "is spread over several tasks instead of one")
+        row_bytes = estimate_row_bytes(tables)
+        if columns and not max_records_per_file and row_bytes:
+            # A task may still hold several salt buckets of one partition value; cap the file size by record count too
+            layout["max_records_per_file"] = max(1, int(target_file_size_mb * 1024 * 1024 / row_bytes))
+            layout["notes"].append(f"~{row_bytes:.0f} bytes/row, so {layout['max_records_per_file']:,} records per {target_file_size_mb:g} MB file")
+    elif target_file_size_mb:
+        layout["notes"].append("No data-size estimate available, so the file size target is not applied")
+
+    if layout["max_records_per_file"]:
+        layout["notes"].append(f"spark.sql.files.maxRecordsPerFile = {layout['max_records_per_file']} splits oversized files")
+    return layout
+
+
+def plan_incremental_load(tables, partition_columns, output_schema, output_table, merge_keys=None, watermark_table=None):
+    """
+    Work out how an incremental run reads and writes, or None when no table
+    has a ``watermark_column``.
+
+    Tables with a watermark column are read from the watermark stored for
+    them in the state table up to the column's current maximum; the others
+    are read in full. The write is a MERGE upsert on ``merge_keys`` when
+    given. Otherwise, when every watermark column is an output partition
+    column, it is a dynamic partition overwrite that rewrites only the
+    partitions read (the last one is read again, since it may have been
+    incomplete). Otherwise the new rows are appended.
+    """
+    sources = [table for table in tables if table.get('watermark_column')]
+    if not sources:
+        return None
+    target = f"{output_schema}.{output_table}"
+    keys = _split_csv(merge_keys)
+    watermark_columns = [table['watermark_column'].split(".")[-1] for table in sources]
+    if keys:
+        mode = "merge"
+        note = f"upserted with MERGE on {', '.join(keys)}"
+    elif partition_columns and all(column in partition_columns for column in watermark_columns):
+        mode = "dynamic"
+        note = "written with dynamic partition overwrite, so only the partitions read are replaced"
+    else:
+        mode = "append"
+        note = "appended; give merge_keys to upsert rows that can change"
+    return {
+        "mode": mode,
+        "target": target,
+        "state_table": watermark_table or f"{output_schema}.{DEFAULT_WATERMARK_TABLE}",
+        "merge_keys": keys,
+        "sources": [{"alias": table['alias'], "source": f"{table['schema']}.{table['name']}",
+                     "column": table['watermark_column'], "operator": ">=" if mode == "dynamic" else ">"}
+                    for table in sources],
+        "notes": [f"Incremental load of {', '.join(table['alias'] for table in sources)}; the new data is {note}"],
+    }
+
+
+def _event_time(table):
+    return table.get('event_time_column') or table.get('watermark_column') or None
+
+
+def _referenced_columns(table, tables, joins, predicates, transformations):
+    # The columns of one table used anywhere in the spec; unqualified references count when it is the only table
+    alias = table['alias']
+    references = sql_column_references(table.get('predicate')) + sql_column_references(predicates)
+    for join in joins:
+        references.extend(python_column_references(join.get('conditions')))
+    for transform in transformations:
+        references.extend(sql_column_references(transform['expression'][len("group by"):] if
+                                                classify_transformation(transform['expression']) == "group_by" else transform['expression']))
+    output_columns = {transform.get('output_column', '').lower() for transform in transformations}
+    columns = []
+    for reference in references:
+        owner, _, column = reference.rpartition('.')
+        if ((owner == alias or (not owner and len(tables) == 1 and reference.lower() not in output_columns))
+                and column.lower() not in {name.lower() for name in columns}):
+            columns.append(column)
+    return columns
+
+
+def plan_streaming_query(tables, joins, transformations, predicates="", broadcast_threshold_mb=DEFAULT_BROADCAST_THRESHOLD_MB,
+                         total_cores=None):
+    """
+    Work out how the spec runs as a Structured Streaming query.
+
+    The tables marked ``"stream": true`` are read as streams (the first table
+    when none is marked), the rest as static tables. Streams with an
+    ``event_time_column`` (or ``watermark_column``) get a watermark of their
+    ``watermark_delay``. Static sides of stream joins are broadcast unless
+    their size estimate is above ``broadcast_threshold_mb``; stream-stream
+    joins get a time bound from the right side's watermark delay, so their
+    state is dropped. Stateful queries keep their state in RocksDB, in one
+    shuffle partition per core. ``streams`` also lists the columns each
+    stream must provide, for the rate source.
+
+    Raises ValueError for joins Structured Streaming cannot run, and for
+    aggregations after a stream-stream join.
+    """
+    by_alias = {table['alias']: table for table in tables}
+    marked = [table['alias'] for table in tables if table.get('stream')]
+    streams = set(marked or [tables[0]['alias']])
+    plan = {
+        "streams": {alias: {"column": _event_time(by_alias[alias]),
+                            "delay": by_alias[alias].get('watermark_delay') or DEFAULT_WATERMARK_DELAY,
+                            "columns": _referenced_columns(by_alias[alias], tables, joins, predicates, transformations)}
+                    for alias in streams},
+        "joins": [],
+        "stateful": False,
+        "notes": [],
+    }
+
+    def event_time(alias):
+        column = _event_time(by_alias[alias]) if alias in streams else None
+        return f"{alias}.{column.split('.')[-1]}" if column else None
+
+    streaming = tables[0]['alias'] in streams
+    last_event_time = event_time(tables[0]['alias'])
+    for join in joins:
+        join_type = join['type']
+        right = join.get('right_table') if join_type != 'subquery' else None
+        if join_type == 'self':
+            raise ValueError("Self-joins are not supported in a streaming query")
+        right_stream = right in streams
+        stage = {"broadcast": False, "time_bound": None, "note": None}
+        if streaming and right_stream:
+            if join_type not in STREAM_STREAM_JOIN_TYPES:
+                raise ValueError(f"Structured Streaming cannot run a {join_type} join between two streams")
+            left_time = event_time(join.get('left_table')) if join.get('left_table') in by_alias else None
+            left_time, right_time = left_time or last_event_time, event_time(right)
+            if left_time and right_time:
+                delay = plan["streams"][right]["delay"]
+                stage["time_bound"] = f"{right_time} BETWEEN {left_time} - INTERVAL {delay} AND {left_time} + INTERVAL {delay}"
+                stage["note"] = f"Stream-stream join: {right} rows are matched within {delay} of {left_time}, so the watermarks drop old state"
+            elif join_type != "inner":
+                raise ValueError(f"The {join_type} stream-stream join with {right} needs an event_time_column on both sides")
+            else:
+                stage["note"] = f"Stream-stream join without event times: the state of the join with {right} is never dropped"
+            plan["stateful"] = True
+        elif streaming:
+            if join_type not in STREAM_STATIC_JOIN_TYPES:
+                raise ValueError(f"Structured Streaming cannot run a {join_type} join of a stream with static {right or 'subquery'}")
+            size_mb = table_size_mb(by_alias[right]) if right in by_alias else None
+            stage["broadcast"] = size_mb is None or size_mb <= broadcast_threshold_mb
+            if stage["broadcast"]:
+                stage["note"] = f"Static {right or 'subquery'} is broadcast, so every micro-batch joins it without a shuffle"
+            else:
+                stage["note"] = (f"Static {right} ({_describe_mb(size_mb)}) is above the {broadcast_threshold_mb:g} MB broadcast "
+                                 "threshold, so it is shuffled in every micro-batch")
+        elif right_stream:
+            if join_type not in STATIC_STREAM_JOIN_TYPES:
+                raise ValueError(f"Structured Streaming cannot run a {join_type} join of static tables with stream {right}")
+            stage["note"] = f"{right} streams against the static join result"
+            streaming, last_event_time = True, event_time(right)
+        plan["joins"].append(stage)
+
+    kinds = {classify_transformation(transform['expression']) for transform in transformations}
+    if "group_by" in kinds or kinds >= {"aggregate", "select"}:
+        plan["output_mode"] = "update"
+    elif "aggregate" in kinds:
+        plan["output_mode"] = "complete"
+    else:
+        plan["output_mode"] = "append"
+    if plan["stateful"] and plan["output_mode"] != "append":
+        # Spark runs an aggregation after a stream-stream join only in append mode over an event-time window
+        raise ValueError("Aggregating after a stream-stream join is not supported in a streaming query; "
+                         "aggregate the joined stream in a separate job or join a static table instead")
+    plan["stateful"] = plan["stateful"] or plan["output_mode"] != "append"
+
+    plan["state_partitions"] = None
+    if plan["stateful"]:
+        plan["state_partitions"] = int(total_cores or DEFAULT_STATE_PARTITIONS)
+        plan["notes"].append(f"State store: {plan['state_partitions']} partitions (one per core) in RocksDB. "
+                             "The checkpoint fixes the count, so changing it needs a new checkpoint location")
+    return plan
+
+
+def _output_layout_code(layout):
+    lines = []
+    for note in layout["notes"]:
+        lines.append(f"# {note}")
+    for column, value in layout["static_values"].items():
+        lines.append(f"result_df = result_df.withColumn({column!r}, lit({value!r}))")
+
+    repartition_args = [str(layout["num_partitions"])] if layout["num_partitions"] else []
+    repartition_args += [repr(column) for column in layout["repartition_columns"]]
+    if layout.get("salt_buckets"):
+        repartition_args.append(f"expr('pmod(hash(*), {layout['salt_buckets']})')")
+    if repartition_args:
+        lines.append(f"result_df = result_df.repartition({', '.join(repartition_args)})")
+
+    if not lines:
+        return ""
+    return "\n# Output layout\n" + "\n".join(lines) + "\n"
+
+
+# Code fragments of the generated job. Each is compiled once into a bound
+# str.format, and generate_spark_code emits them into a list (or straight into a
+# file) that is joined once, so generation stays linear in the size of the spec.
+_HEADER = """
+from pyspark import StorageLevel
 from pyspark.sql import SparkSession
-from pyspark.sql.functions import col, expr
+from pyspark.sql.functions import array, broadcast, col, explode, expr, lit, rand, row_number, sequence, when
+from pyspark.sql.window import Window
 import os
 
 # Initialize Spark session with configurations
 spark = SparkSession.builder.appName("GeneratedComplexSparkJob")
-{spark_configs}
+{builder_configs}
 spark = spark.getOrCreate()
 
 # Read environment variables
@@ -26,112 +706,702 @@ environment = os.getenv('ENVIRONMENT', 'dev')
 
 # Read tables
 table_dict = {{}}
-"""
-
-    for table in tables:
-        spark_code += f"""
-table_dict["{table['alias']}"] = spark.read.table("{table['schema']}.{table['name']}")
-"""
-        if table['predicate']:
-            spark_code += f"""
-table_dict["{table['alias']}"] = table_dict["{table['alias']}"].filter("{table['predicate']}")
-"""
-
-    spark_code += """
+""".format
+_NOTE = """
+# {note}
+""".format
+_WATERMARK_STATE = """
+# Incremental load: the watermark processed so far for each source is kept in {state_table}
+spark.sql("CREATE TABLE IF NOT EXISTS {state_table} (target STRING, source STRING, watermark STRING, updated_at TIMESTAMP) USING parquet")
+watermark_state = spark.table("{state_table}").filter(col("target") == "{target}")
+watermarks = {{}}
+""".format
+_READ_TABLE = """
+table_dict["{alias}"] = spark.read.table("{schema}.{name}").alias("{alias}")
+""".format
+_INCREMENTAL_READ = """
+# Incremental read: rows of {source} with {column} {operator} the stored watermark, up to its current maximum
+last_watermark = watermark_state.filter(col("source") == "{source}").orderBy(col("updated_at").desc()).first()
+watermarks["{alias}"] = table_dict["{alias}"].agg(expr("max({column})").cast("string")).first()[0]
+watermark_filter = col("{column}") <= lit(watermarks["{alias}"])
+if last_watermark is not None:
+    watermark_filter = watermark_filter & (col("{column}") {operator} lit(last_watermark["watermark"]))
+table_dict["{alias}"] = table_dict["{alias}"].filter(watermark_filter)
+""".format
+_TABLE_PREDICATE = """
+table_dict["{alias}"] = table_dict["{alias}"].filter("{predicate}")
+""".format
+_PUSHED_PREDICATE = """
+# Pushed down from the global predicates
+table_dict["{alias}"] = table_dict["{alias}"].filter({predicate})
+""".format
+_PRUNE_COLUMNS = """
+# Column pruning: read only the columns used by joins, predicates, transformations and output
+table_dict["{alias}"] = table_dict["{alias}"].select({columns}).alias("{alias}")
+""".format
+_PERSIST_TABLE = """
+# {alias} is read by more than one join; persist it so it is scanned once
+table_dict["{alias}"] = table_dict["{alias}"]{persist}
+""".format
+_JOINS_START = """
 # Perform joins
-result_df = table_dict["{0}"]
-""".format(tables[0]['alias'])
-
-    for join in joins:
-        if join['type'] == 'subquery':
-            spark_code += f"""
+result_df = table_dict["{alias}"]
+""".format
+_JOIN_NOTE = """
+# {note}""".format
+_PERSIST_SUBQUERY = """
+# This subquery is joined more than once; persist it so it runs once
+{name} = spark.sql('''
+    {subquery}
+'''){persist}
+""".format
+_SUBQUERY = """
 subquery_df = spark.sql('''
-    {join['subquery']}
+    {subquery}
 ''')
-result_df = result_df.join(
-    subquery_df,
-    {join['conditions']},
+""".format
+_SUBQUERY_JOIN = """result_df = result_df.join(
+    {name},
+    {conditions},
     "inner"
 )
-"""
-        elif join['type'] == 'self':
-            spark_code += f"""
-result_df = result_df.alias("{join['left_alias']}").join(
-    result_df.alias("{join['right_alias']}"),
-    {join['conditions']},
+""".format
+_PERSIST_SELF_JOIN = """
+# The self-join reads result_df twice; persist it so the upstream joins run once
+{name} = result_df{persist}""".format
+_SELF_JOIN = """
+result_df = {name}.alias("{left_alias}").join(
+    {name}.alias("{right_alias}"),
+    {conditions},
     "inner"
 )
-"""
-        else:
-            spark_code += f"""
+""".format
+_JOIN = """
 result_df = result_df.join(
-    table_dict["{join['right_table']}"],
-    {join['conditions']},
-    "{join['type']}"
+    {right_df},
+    {conditions},
+    "{type}"
 )
-"""
-
-    if predicates:
-        spark_code += f"""
+""".format
+_REPARTITION_JOIN = """
+# {note}; repartition both sides on the join key, which the join reuses
+result_df = result_df.repartition({partitions}, col({key}))""".format
+_LOCAL_CHECKPOINT = """
+# Truncate the lineage of the long join chain ({joins} joins so far)
+result_df = result_df.localCheckpoint()
+""".format
+_GLOBAL_PREDICATES = """
 # Apply global predicates
 result_df = result_df.filter("{predicates}")
-"""
-
-    if transformations:
-        spark_code += """
+""".format
+_PERSIST_JOINED = """
+# Complex transformations follow; persist the joined result so it is computed once
+joined_df = result_df{persist}
+result_df = joined_df
+""".format
+_TRANSFORMATIONS_START = """
 # Apply transformations
-"""
-        group_by_columns = []
-        agg_expressions = []
-        select_columns = []
-        for transform in transformations:
-            if transform['expression'].lower().startswith("group by"):
-                group_by_columns.extend([col.strip() for col in transform['expression'].lower().split("group by")[1].split(",")])
-            elif any(agg_func in transform['expression'].lower() for agg_func in ['sum(', 'avg(', 'count(', 'max(', 'min(']):
-                agg_expressions.append(f"{transform['output_column']} = expr('{transform['expression']}')")
-            else:
-                select_columns.append(f"{transform['expression']} as {transform['output_column']}")
-
-        if group_by_columns:
-            group_by_str = ", ".join([f"'{col}'" for col in group_by_columns])
-            spark_code += f"""
-result_df = result_df.groupBy({group_by_str})
-"""
-            if agg_expressions:
-                agg_str = ", ".join(agg_expressions)
-                spark_code += f"""
-result_df = result_df.agg({agg_str})
-"""
-        elif select_columns:
-            select_str = ", ".join(select_columns)
-            spark_code += f"""
-result_df = result_df.selectExpr({select_str})
-"""
-        else:
-            for transform in transformations:
-                spark_code += f"""
-result_df = result_df.withColumn("{transform['output_column']}", expr("{transform['expression']}"))
-"""
-
-    spark_code += f"""
+""".format
+_GROUP_BY = """
+result_df = result_df.groupBy({keys}).agg(
+{aggregates}
+)
+""".format
+_GLOBAL_AGG = """
+result_df = result_df.agg(
+{aggregates}
+)
+""".format
+_DISTINCT_KEYS = """
+result_df = result_df.select({keys}).distinct()
+""".format
+_REPARTITION_GROUP_BY = """
+# {note}; the aggregation reuses this partitioning
+result_df = result_df.repartition({partitions}, {columns})""".format
+_SELECT = """
+result_df = result_df.select(
+{columns}
+)
+""".format
+_SELECT_OUTPUTS = """
+# Keep only the transformation outputs
+result_df = result_df.select({columns})
+""".format
+_PRE_AGGREGATE = """
+# {note}
+table_dict["{alias}"] = table_dict["{alias}"].groupBy({keys}).agg(
+{partials}
+).alias("{alias}")
+""".format
+_PRODUCTION_WRITER = """
+# Write the result to the output table
+writer = result_df.write.mode("{write_mode}")
+""".format
+_WRITER = """
 # Write the result to the output table and show Output
 result_df.show()
 
 # Prepare write operation
 writer = result_df.write.mode("{write_mode}")
-
-# Add partitioning if specified
-if "{partition_columns}" and "{partition_values}":
-    partition_cols = [col.strip() for col in "{partition_columns}".split(',')]
-    partition_vals = [val.strip() for val in "{partition_values}".split(',')]
-    for col, val in zip(partition_cols, partition_vals):
-        writer = writer.partitionBy(col, val)
-
+""".format
+_PARTITION_BY = """
+# Partition the output by {names}
+writer = writer.partitionBy({columns})
+""".format
+_SAVE_AS_TABLE = """
 # Write the data
 writer.saveAsTable("{output_schema}.{output_table}")
+""".format
+_DYNAMIC_OVERWRITE = """
+# Write the data: replace only the partitions present in result_df (dynamic partition overwrite);
+# the first run creates the table
+if spark.catalog.tableExists("{target}"):
+    result_df.select(spark.table("{target}").columns).write.insertInto("{target}", overwrite=True)
+else:
+    writer.saveAsTable("{target}")
+""".format
+_MERGE = """
+# Write the data: upsert on {keys} (MERGE INTO needs a Delta, Iceberg or Hudi table);
+# one row per key, since MERGE rejects several source rows for one target row. The first run creates the table
+if spark.catalog.tableExists("{target}"):
+{latest_per_key}    updates_df.createOrReplaceTempView("incremental_updates")
+    spark.sql('''
+        MERGE INTO {target} AS target
+        USING incremental_updates AS updates
+        ON {condition}
+        WHEN MATCHED THEN UPDATE SET *
+        WHEN NOT MATCHED THEN INSERT *
+    ''')
+else:
+    writer.saveAsTable("{target}")
+""".format
+_LATEST_PER_KEY = """    # Keep the latest row per key by {order_column}, so an older version never overwrites a newer one
+    latest_first = Window.partitionBy({key_list}).orderBy(col("{order_column}").desc())
+    updates_df = ({source}.withColumn("_row_number", row_number().over(latest_first))
+                  .filter(col("_row_number") == 1).drop("_row_number"))
+""".format
+_WATERMARK_COMMIT = """
+# Record the new watermarks only now that the write has succeeded, so a failed run starts again from the old ones
+new_watermarks = [("{target}", source, watermarks[alias]) for alias, source in {sources} if watermarks[alias] is not None]
+if new_watermarks:
+    (spark.createDataFrame(new_watermarks, "target STRING, source STRING, watermark STRING")
+        .withColumn("updated_at", expr("current_timestamp()"))
+        .write.insertInto("{state_table}"))
+""".format
+_READ_FILES = """
+# Read {schema}.{name} from its {format} files under WAREHOUSE_PATH
+table_dict["{alias}"] = spark.read.format("{format}").load(os.path.join(os.getenv("WAREHOUSE_PATH", "warehouse"), {path})).alias("{alias}")
+""".format
+_READ_STREAM_TABLE = """
+# Stream new data of {schema}.{name}, at most {files} files per micro-batch
+table_dict["{alias}"] = spark.readStream.option("maxFilesPerTrigger", {files}).table("{schema}.{name}").alias("{alias}")
+""".format
+_READ_STREAM_FILES = """
+# Stream new {format} files of {schema}.{name}, at most {files} per micro-batch; the schema comes from the files already there
+stream_path = os.path.join(os.getenv("WAREHOUSE_PATH", "warehouse"), {path})
+table_dict["{alias}"] = (spark.readStream.format("{format}").schema(spark.read.format("{format}").load(stream_path).schema)
+                         .option("maxFilesPerTrigger", {files}).load(stream_path).alias("{alias}"))
+""".format
+_READ_RATE = """
+# Synthetic stream standing in for {schema}.{name} (local testing): the rate source's counter fills the columns the job uses
+table_dict["{alias}"] = (spark.readStream.format("rate").option("rowsPerSecond", {rows_per_second}).load()
+                         .selectExpr({columns}).alias("{alias}"))
+""".format
+_WITH_WATERMARK = """
+# Event-time watermark: rows more than {delay} behind the latest {column} are late, and state older than that is dropped
+table_dict["{alias}"] = table_dict["{alias}"].withWatermark("{column}", "{delay}").alias("{alias}")
+""".format
+_STREAM_JOIN = """
+# Time-bounded stream-stream join
+result_df = result_df.join(
+    {right_df},
+    {conditions},
+    "{type}"
+)
+""".format
+_FOREACH_BATCH = """
+# Write every micro-batch; it arrives as a static DataFrame, so the batch writers (and MERGE) work on it.
+# foreachBatch is at-least-once: a micro-batch replayed after a failure is written again{replay}
+def write_batch(batch_df, batch_id):
+""".format
+_BATCH_APPEND = """    writer = batch_df.write.mode("{mode}")
+""".format
+_BATCH_PARTITION_BY = """    writer = writer.partitionBy({columns})
+""".format
+_BATCH_SAVE = """    writer.saveAsTable("{target}")
+""".format
+_BATCH_MERGE = """    if not batch_df.sparkSession.catalog.tableExists("{target}"):
+        writer = batch_df.write.mode("append")
+{partition_by}        writer.saveAsTable("{target}")
+        return
+    # Upsert on {keys} (MERGE INTO needs a Delta, Iceberg or Hudi table)
+{latest_per_key}    updates_df.createOrReplaceTempView("stream_updates")
+    batch_df.sparkSession.sql('''
+        MERGE INTO {target} AS target
+        USING stream_updates AS updates
+        ON {condition}
+        WHEN MATCHED THEN UPDATE SET *
+        WHEN NOT MATCHED THEN INSERT *
+    ''')
+""".format
+_START_QUERY = """
 
-print(f"Data written to {{output_schema}}.{{output_table}} on branch {{github_branch}} in {{environment}} environment")
+# Start the query; the checkpoint keeps the source offsets and the operator state between runs
+checkpoint_location = os.getenv("CHECKPOINT_LOCATION", "{checkpoint_location}")
+query = (result_df.writeStream
+         .queryName("{query_name}")
+         .outputMode("{output_mode}")
+         .trigger({trigger})
+         .option("checkpointLocation", checkpoint_location)
+         .foreachBatch(write_batch)
+         .start())
+query.awaitTermination()
+""".format
+_UNPERSIST_START = """
+# Release cached data
+""".format
+_UNPERSIST = """{name}.unpersist()
+""".format
+_FOOTER = """
+print(f"Data written to {output_schema}.{output_table} on branch {{github_branch}} in {{environment}} environment")
 # Stop the Spark session
 spark.stop()
-"""
-    return spark_code
+""".format
+
+
+def _latest_row_column(candidates, transformation_plan, qualified=True):
+    """
+    The column of the (alias, column) pairs in ``candidates`` that orders the
+    versions of a key in the job's output, or None when the transformations
+    drop them all. ``qualified=False`` for micro-batches, which lose the aliases.
+    """
+    outputs = transformation_plan["outputs"] + [output for _, output in transformation_plan["group_keys"] if output]
+    for alias, column in candidates:
+        column = column.split('.')[-1]
+        if not outputs:
+            return f"{alias}.{column}" if qualified else column
+        if column.lower() in {output.lower() for output in outputs}:
+            return column
+    return None
+
+
+def _warehouse_path_args(table):
+    if table.get('path'):
+        return repr(table['path'])
+    return f"{table['schema']!r}, {table['name']!r}"
+
+
+def _stream_read_code(table, stream, stream_source, files_per_trigger):
+    alias, schema, name = table['alias'], table['schema'], table['name']
+    if stream_source == "table":
+        return _READ_STREAM_TABLE(alias=alias, schema=schema, name=name, files=files_per_trigger)
+    if stream_source == "file":
+        return _READ_STREAM_FILES(alias=alias, schema=schema, name=name, format=table.get('format') or "parquet",
+                                  path=_warehouse_path_args(table), files=files_per_trigger)
+    event_time = (stream["column"] or "").split('.')[-1]
+    columns = [f"timestamp AS {event_time}" if column.lower() == event_time.lower() else f"value % 1000 AS {column}"
+               for column in stream["columns"]]
+    if event_time and event_time.lower() not in {column.lower() for column in stream["columns"]}:
+        columns.append(f"timestamp AS {event_time}")
+    return _READ_RATE(alias=alias, schema=schema, name=name, rows_per_second=DEFAULT_RATE_ROWS_PER_SECOND,
+                      columns=", ".join(repr(column) for column in columns or ["value", "timestamp"]))
+
+
+def _time_bounded_conditions(conditions, time_bound):
+    if conditions.strip().startswith("["):
+        return f"{conditions} + [expr({time_bound!r})]"
+    return f"({conditions}) & expr({time_bound!r})"
+
+
+def _streaming_sink_code(stream_plan, transformation_plan, partition_columns, target, merge_keys, trigger_interval, checkpoint_location):
+    keys = _split_csv(merge_keys) if isinstance(merge_keys, str) else list(merge_keys or [])
+    group_keys = [output for _, output in transformation_plan["group_keys"]]
+    if not keys and stream_plan["output_mode"] == "update" and None not in group_keys:
+        keys = group_keys
+    partition_by = ""
+    if partition_columns:
+        partition_by = _BATCH_PARTITION_BY(columns=", ".join(repr(column) for column in partition_columns))
+
+    if stream_plan["output_mode"] == "complete":
+        replay = ": the whole aggregate is rewritten, so a replay is harmless"
+        body = _BATCH_APPEND(mode="overwrite") + partition_by + _BATCH_SAVE(target=target)
+    elif keys:
+        replay = f": the MERGE on {', '.join(keys)} makes a replay harmless"
+        key_list = ", ".join(repr(key) for key in keys)
+        if keys == group_keys:
+            # An aggregation emits one row per group key
+            latest_per_key = "    updates_df = batch_df\n"
+        else:
+            order_column = _latest_row_column([(alias, stream["column"]) for alias, stream in stream_plan["streams"].items()
+                                               if stream["column"]], transformation_plan, qualified=False)
+            if order_column is None:
+                raise ValueError("A streaming MERGE on merge keys needs a stream event_time_column in the output "
+                                 "to keep the latest row per key")
+            latest_per_key = _LATEST_PER_KEY(source="batch_df", key_list=key_list, order_column=order_column)
+        body = _BATCH_MERGE(target=target, partition_by="    " + partition_by if partition_by else "", keys=", ".join(keys),
+                            latest_per_key=latest_per_key,
+                            condition=" AND ".join(f"target.{key} = updates.{key}" for key in keys))
+    else:
+        replay = "; give merge keys to make the writes idempotent"
+        body = _BATCH_APPEND(mode="append") + partition_by + _BATCH_SAVE(target=target)
+
+    trigger = f"processingTime={trigger_interval!r}" if trigger_interval else "availableNow=True"
+    return (_FOREACH_BATCH(replay=replay) + body +
+            _START_QUERY(checkpoint_location=checkpoint_location, query_name=target.split('.')[-1],
+                         output_mode=stream_plan["output_mode"], trigger=trigger))
+
+
+def _aliased_exprs(pairs, indent="    "):
+    return ",\n".join(f"{indent}expr({expression!r}).alias({output!r})" for output, expression in pairs)
+
+
+def _group_key_code(expression, output):
+    if output is not None and expression.replace("`", "").split('.')[-1] == output:
+        return repr(expression)
+    return f"expr({expression!r})" if output is None else f"expr({expression!r}).alias({output!r})"
+
+
+def _emit_transformations(emit, transformation_plan, group_by_stage=None):
+    emit(_TRANSFORMATIONS_START())
+    keys = ", ".join(_group_key_code(expression, output) for expression, output in transformation_plan["group_keys"])
+    if keys:
+        if group_by_stage and group_by_stage['hint']:
+            emit(_REPARTITION_GROUP_BY(note=group_by_stage['note'], partitions=group_by_stage['partitions'], columns=keys))
+        if transformation_plan["aggregates"]:
+            emit(_GROUP_BY(keys=keys, aggregates=_aliased_exprs(transformation_plan["aggregates"])))
+        else:
+            emit(_DISTINCT_KEYS(keys=keys))
+    elif transformation_plan["aggregates"]:
+        emit(_GLOBAL_AGG(aggregates=_aliased_exprs(transformation_plan["aggregates"])))
+    elif len(transformation_plan["projections"]) == 1:
+        emit(_SELECT(columns=_aliased_exprs(transformation_plan["projections"][0])))
+    else:
+        # Outputs that build on earlier outputs are added in a later select
+        for projection in transformation_plan["projections"]:
+            emit(_SELECT(columns='    "*",\n' + _aliased_exprs(projection)))
+        emit(_SELECT_OUTPUTS(columns=", ".join(repr(output) for output in transformation_plan["outputs"])))
+
+
+def generate_spark_code(tables_json, joins_json, predicates, spark_configs, output_table, output_schema, transformations_json, write_mode, partition_columns, partition_values,
+                        broadcast_threshold_mb=DEFAULT_BROADCAST_THRESHOLD_MB, target_file_size_mb=None, estimated_output_gb=None,
+                        max_records_per_file=None, repartition_by_partition_columns=True,
+                        production=False, storage_level="MEMORY_AND_DISK", checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL,
+                        cache_intermediate=None, pushdown_predicates=True, prune_columns=True, reorder_joins=True,
+                        salt_skewed_joins=True, skew_threshold=DEFAULT_SKEW_THRESHOLD, salt_buckets=None,
+                        plan_shuffles=True, shuffle_partition_mb=DEFAULT_SHUFFLE_PARTITION_MB, pre_aggregate=True,
+                        incremental=None, merge_keys=None, watermark_table=None,
+                        streaming=None, trigger_interval=DEFAULT_TRIGGER_INTERVAL, checkpoint_location=None, stream_source="table",
+                        out=None):
+    """
+    Generate a PySpark job from the UI specs.
+
+    ``production=True`` drops debug actions (``show()``), persists DataFrames that
+    are evaluated more than once (with ``storage_level``) and truncates the lineage
+    of join chains every ``checkpoint_interval`` joins with ``localCheckpoint()``.
+    ``cache_intermediate`` persists the joined result before the transformations;
+    it defaults to the Recommendation's ``cache_intermediate`` flag.
+    ``pushdown_predicates`` moves single-table conjuncts of the global predicate
+    into the table reads and ``prune_columns`` selects only the columns used
+    downstream (see ``query_planner.plan_pushdown_and_pruning``).
+    ``reorder_joins`` reorders runs of inner joins by the estimated size of the
+    intermediate results (see ``query_planner.plan_join_order``).
+    ``salt_skewed_joins`` salts the keys of joins with table ``skew`` scores above
+    ``skew_threshold`` or with ``hot_keys`` (see ``plan_skew_joins``); the bucket
+    count follows the skew score and the Recommendation's cores unless
+    ``salt_buckets`` is given.
+    ``plan_shuffles`` sets ``spark.sql.shuffle.partitions`` and the AQE advisory
+    partition size from the estimated size of every exchange, aiming at
+    ``shuffle_partition_mb`` per partition, and repartitions stages that need
+    far fewer partitions (see ``plan_shuffle_stages``).
+    The transformations are emitted as one ``select`` or one ``groupBy().agg()``
+    (see ``query_planner.plan_transformations``); ``pre_aggregate`` lets the
+    aggregation start on its table before the joins when the group-by keys
+    include the join key.
+    ``incremental`` reads the tables that have a ``watermark_column`` from the
+    watermark stored in ``watermark_table`` (default: ``incremental_watermarks``
+    in the output schema) and writes with a dynamic partition overwrite, a MERGE
+    on ``merge_keys`` or an append (see ``plan_incremental_load``). It defaults to
+    the Recommendation's ``incremental_load`` flag.
+    ``streaming`` turns the spec into a Structured Streaming query (see
+    ``plan_streaming_query``): the tables marked ``"stream": true`` are read
+    with ``readStream`` from the catalog, from new files (``stream_source="file"``)
+    or from the rate source (``"rate"``, for local runs; with either of the two
+    the static tables are read from their files under ``WAREHOUSE_PATH``).
+    Micro-batches run every ``trigger_interval`` (``None``: once over the
+    available data) and are written by ``foreachBatch``, as a MERGE on
+    ``merge_keys`` or the group-by columns when the query aggregates.
+    ``checkpoint_location`` defaults to ``checkpoints/<output_table>`` and can
+    be overridden by ``CHECKPOINT_LOCATION`` at run time. ``streaming``
+    defaults to on for "Streaming/ELT" workloads with a table marked as a stream;
+    skew salting and shuffle planning do not apply to streaming queries.
+
+    The code is returned as a string, or written fragment by fragment to ``out``
+    (a list or a file-like object with ``write``), in which case None is returned.
+    """
+    if storage_level not in STORAGE_LEVELS:
+        raise ValueError(f"Unknown storage level {storage_level!r}, expected one of {', '.join(STORAGE_LEVELS)}")
+    if shuffle_partition_mb <= 0:
+        raise ValueError("shuffle_partition_mb must be positive")
+    if stream_source not in STREAM_SOURCES:
+        raise ValueError(f"Unknown stream source {stream_source!r}, expected one of {', '.join(STREAM_SOURCES)}")
+    if cache_intermediate is None:
+        cache_intermediate = bool(getattr(spark_configs, "cache_intermediate", False))
+
+    logging.debug("generate_spark_code inputs: tables_json=%s, joins_json=%s, predicates=%s, spark_configs=%s, transformations_json=%s, "
+                  "write_mode=%s, partition_columns=%s, partition_values=%s", tables_json, joins_json, predicates, spark_configs,
+                  transformations_json, write_mode, partition_columns, partition_values)
+
+    tables = json.loads(tables_json)
+    joins = json.loads(joins_json)
+    transformations = json.loads(transformations_json)
+
+    streaming_notes = []
+    if streaming is None:
+        streaming_workload = getattr(spark_configs, "workload_type", None) == "Streaming/ELT"
+        streaming = streaming_workload and any(table.get('stream') for table in tables)
+        if streaming_workload and not streaming:
+            streaming_notes = ['Streaming/ELT workload: mark the source tables with "stream": true to generate a Structured Streaming query']
+    if streaming and incremental:
+        raise ValueError("A streaming query loads incrementally through its checkpoint; do not combine it with an incremental load")
+    if streaming:
+        incremental = False
+        salt_skewed_joins = plan_shuffles = False
+
+    join_order_notes = []
+    if reorder_joins:
+        joins, join_order_notes = plan_join_order(tables, joins)
+
+    broadcast_plan = plan_broadcast_joins(tables, joins, broadcast_threshold_mb)
+
+    stream_plan = None
+    if streaming:
+        stream_plan = plan_streaming_query(tables, joins, transformations, predicates, broadcast_threshold_mb,
+                                           getattr(spark_configs, "total_cores", None))
+        streaming_notes = stream_plan["notes"]
+        broadcast_plan = [(stage["broadcast"], stage["note"]) if stage["note"] else batch
+                          for batch, stage in zip(broadcast_plan, stream_plan["joins"])]
+
+    skew_plan = [None] * len(joins)
+    if salt_skewed_joins:
+        skew_plan = plan_skew_joins(tables, joins, broadcast_plan, skew_threshold,
+                                    getattr(spark_configs, "total_cores", None), salt_buckets)
+
+    shuffle_plan = {"partitions": None, "joins": [None] * len(joins), "group_by": None, "notes": [], "result_mb": None}
+    if plan_shuffles:
+        shuffle_plan = plan_shuffle_stages(tables, joins, transformations, broadcast_plan, skew_plan,
+                                           getattr(spark_configs, "total_cores", None), shuffle_partition_mb)
+    recommended_partitions = _spark_config_value(spark_configs, "spark.sql.shuffle.partitions")
+    if shuffle_plan["partitions"] and recommended_partitions and str(recommended_partitions) != str(shuffle_plan["partitions"]):
+        # The recommender sized its number for one shuffle of the input; make the change visible rather than silent
+        shuffle_plan["notes"].append(f"This replaces the recommended {recommended_partitions} shuffle partitions, "
+                                     "which assume the input is shuffled once (plan_shuffles=False keeps them)")
+    overrides = {}
+    if shuffle_plan["partitions"]:
+        overrides = {"spark.sql.shuffle.partitions": shuffle_plan["partitions"],
+                     "spark.sql.adaptive.advisoryPartitionSizeInBytes": int(shuffle_partition_mb * 1024 * 1024)}
+    if stream_plan and stream_plan["state_partitions"]:
+        overrides = {"spark.sql.shuffle.partitions": stream_plan["state_partitions"],
+                     "spark.sql.streaming.stateStore.providerClass": ROCKSDB_STATE_STORE}
+
+    builder_configs = [format_spark_configs(spark_configs, overrides)] if spark_configs or overrides else []
+    if any(table_size_mb(table) is not None for table in tables):
+        # Keep Spark's own (runtime/AQE) broadcast decisions in line with the hints below
+        builder_configs.append(f"spark = spark.config('spark.sql.autoBroadcastJoinThreshold', '{int(broadcast_threshold_mb * 1024 * 1024)}')")
+
+    if estimated_output_gb is None:
+        estimated_output_gb = estimate_output_gb(tables, spark_configs, transformations)
+    layout = plan_output_layout(tables, partition_columns, partition_values, estimated_output_gb,
+                                target_file_size_mb, max_records_per_file, repartition_by_partition_columns)
+    if layout["max_records_per_file"]:
+        builder_configs.append(f"spark = spark.config('spark.sql.files.maxRecordsPerFile', '{layout['max_records_per_file']}')")
+
+    requested = incremental
+    if incremental is None:
+        incremental = bool(getattr(spark_configs, "incremental_load", False))
+    incremental_plan = None
+    incremental_notes = []
+    if incremental:
+        incremental_plan = plan_incremental_load(tables, layout["partition_columns"], output_schema, output_table,
+                                                 merge_keys, watermark_table)
+        if incremental_plan is None and requested:
+            raise ValueError("An incremental load needs at least one table with a watermark_column")
+        if incremental_plan is None:
+            incremental_notes = ["Incremental load recommended for this update frequency or recency, but no table has a watermark_column; reading in full"]
+        elif incremental_plan["mode"] != "dynamic" and any(
+                classify_transformation(transform['expression']) != "select" for transform in transformations):
+            # Aggregates of the new rows alone would replace (MERGE) or duplicate (append) the stored totals
+            if requested:
+                raise ValueError(f"An incremental load that aggregates cannot be written in {incremental_plan['mode']} mode; "
+                                 "make the watermark columns output partition columns or load in full")
+            incremental_plan = None
+            incremental_notes = [("Incremental load recommended, but the job aggregates and only a dynamic partition overwrite "
+                                  "keeps the totals complete; reading in full")]
+        else:
+            incremental_notes = incremental_plan["notes"]
+            if incremental_plan["mode"] == "dynamic":
+                builder_configs.append("spark = spark.config('spark.sql.sources.partitionOverwriteMode', 'dynamic')")
+    incremental_reads = {source["alias"]: source for source in incremental_plan["sources"]} if incremental_plan else {}
+
+    # saveAsTable in overwrite mode replaces the whole table; static partitions must replace only their own partition
+    static_overwrite = bool(layout["static_values"]) and write_mode == "overwrite" and not incremental_plan and not stream_plan
+    if static_overwrite:
+        builder_configs.append("spark = spark.config('spark.sql.sources.partitionOverwriteMode', 'dynamic')")
+
+    access_plan = plan_pushdown_and_pruning(tables, joins, predicates, transformations,
+                                            layout["partition_columns"], layout["static_values"],
+                                            pushdown_predicates, prune_columns)
+    predicates = access_plan["predicates"]
+    transformation_plan = plan_transformations(transformations, tables, joins, predicates, pre_aggregate and not stream_plan)
+    pre_aggregation = transformation_plan["pre_aggregation"]
+
+    code = []
+    emit = code.append if out is None else (out.append if isinstance(out, list) else out.write)
+
+    emit(_HEADER(builder_configs="\n".join(builder_configs)))
+
+    # Streaming DataFrames cannot be persisted or checkpointed outside the query
+    reuse = plan_reuse(tables, joins) if production and not stream_plan else {"tables": set(), "subqueries": set(), "self_joins": []}
+    persist = f".persist(StorageLevel.{storage_level})"
+    persisted = []
+    if stream_plan:
+        cache_intermediate = False
+
+    for note in access_plan["notes"] + shuffle_plan["notes"] + incremental_notes + streaming_notes + transformation_plan["notes"]:
+        emit(_NOTE(note=note))
+    if incremental_plan:
+        emit(_WATERMARK_STATE(state_table=incremental_plan["state_table"], target=incremental_plan["target"]))
+
+    streams = stream_plan["streams"] if stream_plan else {}
+    files_per_trigger = int(getattr(spark_configs, "total_cores", None) or DEFAULT_STATE_PARTITIONS)
+    for table in tables:
+        alias = table['alias']
+        if alias in streams:
+            emit(_stream_read_code(table, streams[alias], stream_source, files_per_trigger))
+        elif stream_plan and stream_source != "table":
+            emit(_READ_FILES(alias=alias, schema=table['schema'], name=table['name'], format=table.get('format') or "parquet",
+                             path=_warehouse_path_args(table)))
+        else:
+            emit(_READ_TABLE(alias=alias, schema=table['schema'], name=table['name']))
+        if alias in incremental_reads:
+            emit(_INCREMENTAL_READ(**incremental_reads[alias]))
+        if table['predicate']:
+            emit(_TABLE_PREDICATE(alias=alias, predicate=table['predicate']))
+        for predicate in access_plan["pushed"].get(alias, []):
+            emit(_PUSHED_PREDICATE(alias=alias, predicate=repr(predicate)))
+        if access_plan["columns"] and alias in access_plan["columns"]:
+            columns = access_plan["columns"][alias]
+            event_time = streams[alias]["column"] if alias in streams else None
+            if event_time and event_time.split('.')[-1].lower() not in {column.lower() for column in columns}:
+                # The watermark is defined on the event-time column, so pruning must keep it
+                columns = columns + [event_time.split('.')[-1]]
+            emit(_PRUNE_COLUMNS(alias=alias, columns=", ".join(repr(column) for column in columns)))
+        if alias in streams and streams[alias]["column"]:
+            emit(_WITH_WATERMARK(alias=alias, column=streams[alias]["column"].split('.')[-1], delay=streams[alias]["delay"]))
+        if pre_aggregation and alias == pre_aggregation["alias"]:
+            emit(_PRE_AGGREGATE(note=pre_aggregation["note"], alias=alias, keys=", ".join(repr(key) for key in pre_aggregation["keys"]),
+                                partials=_aliased_exprs(pre_aggregation["partials"])))
+        if alias in reuse["tables"]:
+            emit(_PERSIST_TABLE(alias=alias, persist=persist))
+            persisted.append(f'table_dict["{alias}"]')
+
+    emit(_JOINS_START(alias=tables[0]['alias']))
+    for note in join_order_notes:
+        emit(_NOTE(note=note))
+
+    subquery_names = {}
+    for index, (join, (use_broadcast, reason), salt, stage) in enumerate(zip(joins, broadcast_plan, skew_plan, shuffle_plan["joins"])):
+        if reason:
+            emit(_JOIN_NOTE(note=reason))
+        if salt:
+            emit(_JOIN_NOTE(note=salt['reason']))
+        if join['type'] == 'subquery':
+            subquery_df = "subquery_df"
+            if join['subquery'] in reuse["subqueries"]:
+                subquery_df = subquery_names.get(join['subquery'])
+                if subquery_df is None:
+                    subquery_df = subquery_names[join['subquery']] = f"subquery_df_{len(subquery_names) + 1}"
+                    emit(_PERSIST_SUBQUERY(name=subquery_df, subquery=join['subquery'], persist=persist))
+                    persisted.append(subquery_df)
+            else:
+                emit(_SUBQUERY(subquery=join['subquery']))
+            emit(_SUBQUERY_JOIN(name=subquery_df, conditions=join['conditions']))
+        elif join['type'] == 'self':
+            self_join_df = "result_df"
+            if index in reuse["self_joins"]:
+                self_join_df = f"self_join_input_{reuse['self_joins'].index(index) + 1}"
+                emit(_PERSIST_SELF_JOIN(name=self_join_df, persist=persist))
+                persisted.append(self_join_df)
+            emit(_SELF_JOIN(name=self_join_df, left_alias=join['left_alias'], right_alias=join['right_alias'], conditions=join['conditions']))
+        else:
+            right_df = 'table_dict["{}"]'.format(join['right_table'])
+            if use_broadcast:
+                right_df = f"broadcast({right_df})"
+            if stage and stage['hint']:
+                left_key, right_key = stage['keys']
+                emit(_REPARTITION_JOIN(note=stage['note'], partitions=stage['partitions'], key=repr(left_key)))
+                right_df = f"{right_df}.repartition({stage['partitions']}, col({right_key!r}))"
+            if salt and salt['salted']:
+                emit(_salted_join_code(join, salt, right_df))
+            elif stream_plan and stream_plan["joins"][index]["time_bound"]:
+                emit(_STREAM_JOIN(right_df=right_df, type=join['type'],
+                                  conditions=_time_bounded_conditions(join['conditions'], stream_plan["joins"][index]["time_bound"])))
+            else:
+                emit(_JOIN(right_df=right_df, conditions=join['conditions'], type=join['type']))
+
+        if production and not stream_plan and (index + 1) % checkpoint_interval == 0 and index + 1 < len(joins):
+            emit(_LOCAL_CHECKPOINT(joins=index + 1))
+
+    if predicates:
+        emit(_GLOBAL_PREDICATES(predicates=predicates))
+
+    if transformations and cache_intermediate:
+        emit(_PERSIST_JOINED(persist=persist))
+        persisted.append("joined_df")
+
+    if transformations:
+        _emit_transformations(emit, transformation_plan, shuffle_plan["group_by"])
+
+    emit(_output_layout_code(layout))
+
+    if stream_plan:
+        emit(_streaming_sink_code(stream_plan, transformation_plan, layout["partition_columns"], f"{output_schema}.{output_table}",
+                                  merge_keys, trigger_interval, checkpoint_location or f"checkpoints/{output_table}"))
+        emit(_FOOTER(output_schema=output_schema, output_table=output_table))
+        return "".join(code) if out is None else None
+
+    if incremental_plan:
+        # The first incremental run creates the table; later dynamic and MERGE runs do not go through the writer
+        write_mode = "append" if incremental_plan["mode"] == "append" else "overwrite"
+    emit((_PRODUCTION_WRITER if production else _WRITER)(write_mode=write_mode))
+    if layout["partition_columns"]:
+        emit(_PARTITION_BY(names=", ".join(layout["partition_columns"]),
+                           columns=", ".join(repr(column) for column in layout["partition_columns"])))
+
+    if incremental_plan and incremental_plan["mode"] == "dynamic":
+        emit(_DYNAMIC_OVERWRITE(target=incremental_plan["target"]))
+    elif static_overwrite:
+        emit(_DYNAMIC_OVERWRITE(target=f"{output_schema}.{output_table}"))
+    elif incremental_plan and incremental_plan["mode"] == "merge":
+        keys = incremental_plan["merge_keys"]
+        key_list = ", ".join(repr(key) for key in keys)
+        order_column = _latest_row_column([(source["alias"], source["column"]) for source in incremental_plan["sources"]],
+                                          transformation_plan)
+        if order_column is None:
+            raise ValueError("A MERGE incremental load needs a watermark_column in the output to keep the latest row per key")
+        emit(_MERGE(target=incremental_plan["target"], keys=", ".join(keys),
+                    latest_per_key=_LATEST_PER_KEY(source="result_df", key_list=key_list, order_column=order_column),
+                    condition=" AND ".join(f"target.{key} = updates.{key}" for key in keys)))
+    else:
+        emit(_SAVE_AS_TABLE(output_schema=output_schema, output_table=output_table))
+    if incremental_plan:
+        emit(_WATERMARK_COMMIT(target=incremental_plan["target"], state_table=incremental_plan["state_table"],
+                               sources=repr([(source["alias"], source["source"]) for source in incremental_plan["sources"]])))
+    if persisted:
+        emit(_UNPERSIST_START())
+        for name in persisted:
+            emit(_UNPERSIST(name=name))
+
+    emit(_FOOTER(output_schema=output_schema, output_table=output_table))
+    if out is None:
+        return "".join(code)
+    return None
@@ -0,0 +1,164 @@
+"""
+Streaming reader for Spark event logs.
+
+Event logs are JSON lines, one listener event per line, and routinely run to
+several GB. They are read one line at a time and only the running totals are
+kept, so memory stays flat whatever the size of the log. Lines for events
+nobody asked for are skipped before JSON decoding, from the event name at the
+start of the line.
+
+Plain and gzip-compressed files are read directly, as are rolling event log
+directories (``eventlog_v2_*`` holding ``events_<n>_*`` files). Logs written
+with Spark's own codecs (lz4, zstd, snappy) need to be decompressed first.
+"""
+import gzip
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+# Spark writes every event as {"Event":"<name>",...}
+_EVENT_PREFIX = '{"Event":"'
+
+_ROLLING_FILE = re.compile(r"^events_(\d+)_")
+
+_SPARK_CODECS = (".lz4", ".zstd", ".zst", ".snappy", ".lzf")
+
+
+def event_log_files(path):
+    """
+    The files of an event log in order: the file itself, or the numbered
+    parts of a rolling event log directory.
+    """
+    if not os.path.isdir(path):
+        return [path]
+    parts = [(int(match.group(1)), name) for name in os.listdir(path) for match in [_ROLLING_FILE.match(name)] if match]
+    if not parts:
+        raise ValueError(f"No event log files in {path}")
+    return [os.path.join(path, name) for _, name in sorted(parts)]
+
+
+def _open(path):
+    if path.endswith(_SPARK_CODECS):
+        raise ValueError(f"{path} is compressed with a Spark codec; decompress it first")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+
+def iter_events(path, events=None):
+    """
+    Yield the decoded events of an event log, one at a time. With ``events``
+    (a set of event names), other events are skipped without decoding them.
+    Truncated or malformed lines, such as the last line of a log still being
+    written, are skipped.
+    """
+    for part in event_log_files(path):
+        with _open(part) as f:
+            for line in f:
+                if events is not None and line.startswith(_EVENT_PREFIX):
+                    end = line.find('"', len(_EVENT_PREFIX))
+                    if line[len(_EVENT_PREFIX):end] not in events:
+                        continue
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if events is None or event.get("Event") in events:
+                    yield event
+
+
+class ResourceUsage(NamedTuple):
+    """
+    Resource usage of one application, summed over its tasks. Times are in
+    seconds and sizes in bytes; ``peak_execution_memory`` is the largest
+    peak of any single task.
+    """
+    app_id: str
+    app_name: str
+    duration: float
+    tasks: int
+    failed_tasks: int
+    executor_run_time: float
+    executor_cpu_time: float
+    gc_time: float
+    peak_execution_memory: int
+    memory_bytes_spilled: int
+    disk_bytes_spilled: int
+    input_bytes: int
+    output_bytes: int
+    shuffle_read_bytes: int
+    shuffle_write_bytes: int
+    max_executor_cores: int
+
+
+USAGE_EVENTS = {"SparkListenerApplicationStart", "SparkListenerApplicationEnd", "SparkListenerTaskEnd",
+                "SparkListenerExecutorAdded"}
+
+
+def summarize_resource_usage(path):
+    """
+    Aggregate the task metrics of one event log into a ResourceUsage.
+    """
+    app_id = app_name = ""
+    start = end = None
+    tasks = failed_tasks = 0
+    run_time_ms = cpu_time_ns = gc_time_ms = 0
+    peak_memory = memory_spilled = disk_spilled = 0
+    input_bytes = output_bytes = shuffle_read = shuffle_write = 0
+    max_cores = 0
+    for event in iter_events(path, USAGE_EVENTS):
+        name = event["Event"]
+        if name == "SparkListenerTaskEnd":
+            tasks += 1
+            if event.get("Task End Reason", {}).get("Reason", "Success") != "Success":
+                failed_tasks += 1
+            metrics = event.get("Task Metrics") or {}
+            run_time_ms += metrics.get("Executor Run Time", 0)
+            cpu_time_ns += metrics.get("Executor CPU Time", 0)
+            gc_time_ms += metrics.get("JVM GC Time", 0)
+            peak_memory = max(peak_memory, metrics.get("Peak Execution Memory", 0))
+            memory_spilled += metrics.get("Memory Bytes Spilled", 0)
+            disk_spilled += metrics.get("Disk Bytes Spilled", 0)
+            input_bytes += (metrics.get("Input Metrics") or {}).get("Bytes Read", 0)
+            output_bytes += (metrics.get("Output Metrics") or {}).get("Bytes Written", 0)
+            read = metrics.get("Shuffle Read Metrics") or {}
+            shuffle_read += read.get("Remote Bytes Read", 0) + read.get("Local Bytes Read", 0)
+            shuffle_write += (metrics.get("Shuffle Write Metrics") or {}).get("Shuffle Bytes Written", 0)
+        elif name == "SparkListenerExecutorAdded":
+            max_cores = max(max_cores, (event.get("Executor Info") or {}).get("Total Cores", 0))
+        elif name == "SparkListenerApplicationStart":
+            app_id, app_name, start = event.get("App ID", ""), event.get("App Name", ""), event.get("Timestamp")
+        else:
+            end = event.get("Timestamp")
+
+    return ResourceUsage(
+        app_id=app_id,
+        app_name=app_name,
+        duration=(end - start) / 1000 if start is not None and end is not None else 0.0,
+        tasks=tasks,
+        failed_tasks=failed_tasks,
+        executor_run_time=run_time_ms / 1000,
+        executor_cpu_time=cpu_time_ns / 1e9,
+        gc_time=gc_time_ms / 1000,
+        peak_execution_memory=peak_memory,
+        memory_bytes_spilled=memory_spilled,
+        disk_bytes_spilled=disk_spilled,
+        input_bytes=input_bytes,
+        output_bytes=output_bytes,
+        shuffle_read_bytes=shuffle_read,
+        shuffle_write_bytes=shuffle_write,
+        max_executor_cores=max_cores,
+    )
+
+
+def summarize_event_logs(paths, workers=None):
+    """
+    ``summarize_resource_usage`` for many logs, in a process pool (JSON
+    decoding is CPU-bound). ``workers=1`` stays in-process.
+    """
+    if workers == 1 or len(paths) <= 1:
+        return [summarize_resource_usage(path) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(summarize_resource_usage, paths))
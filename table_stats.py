@@ -0,0 +1,518 @@
+"""
+Table statistics from the metadata of local Parquet and ORC files.
+
+    python -m cli stats --params my_job.json --warehouse /data/warehouse --output-params my_job.json
+
+Each table of a job is looked up under the warehouse directory, as
+``<warehouse>/<schema>/<name>`` or the Hive layout ``<warehouse>/<schema>.db/<name>``
+(or from the table's own ``path``). Only file metadata is read, through
+memory-mapped views: the Parquet footer, or the ORC file and stripe footers.
+Collecting stats for a multi-TB table costs a few KB of reads per file and
+never touches the data pages. Files are read on a thread
+pool and the result for each file is cached against its mtime and size, so
+re-collecting a table only reads the files that changed.
+
+The totals replace the hand-typed ``size_gb`` and ``rows`` of the table
+specs, which feed both the recommender's ``table_sizes`` and the generator's
+broadcast, shuffle and file sizing.
+"""
+from __future__ import annotations
+
+import functools
+import mmap
+import os
+import struct
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+DEFAULT_WAREHOUSE_PATH = os.environ.get("WAREHOUSE_PATH", "warehouse")
+
+# Threads reading footers; the reads are I/O bound
+DEFAULT_STATS_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+_PARQUET_MAGIC = b"PAR1"
+_ORC_MAGIC = b"ORC"
+
+# Parquet footer: FileMetaData, RowGroup, ColumnChunk and ColumnMetaData thrift field ids
+_FILE_NUM_ROWS, _FILE_ROW_GROUPS = 3, 4
+_ROW_GROUP_COLUMNS = 1
+_CHUNK_META_DATA = 3
+_COLUMN_PATH, _COLUMN_COMPRESSED_SIZE = 3, 7
+_PARQUET_FOOTER_SPEC = {
+    _FILE_NUM_ROWS: None,
+    _FILE_ROW_GROUPS: {_ROW_GROUP_COLUMNS: {_CHUNK_META_DATA: {_COLUMN_PATH: None, _COLUMN_COMPRESSED_SIZE: None}}},
+}
+
+# ORC tail: PostScript, Footer, StripeInformation, Type, StripeFooter and Stream protobuf field numbers
+_PS_FOOTER_LENGTH, _PS_COMPRESSION = 1, 2
+_FOOTER_STRIPES, _FOOTER_TYPES, _FOOTER_NUM_ROWS = 3, 4, 6
+_STRIPE_OFFSET, _STRIPE_INDEX_LENGTH, _STRIPE_DATA_LENGTH, _STRIPE_FOOTER_LENGTH = 1, 2, 3, 4
+_TYPE_SUBTYPES, _TYPE_FIELD_NAMES = 2, 3
+_STRIPE_FOOTER_STREAMS = 1
+_STREAM_COLUMN, _STREAM_LENGTH = 2, 3
+
+_ORC_NONE, _ORC_ZLIB, _ORC_SNAPPY = 0, 1, 2
+
+
+class FileStats(NamedTuple):
+    """
+    Footer statistics of one data file; ``rows`` is None when the footer
+    could not be decoded, in which case only the file size is known.
+    """
+    format: str
+    bytes: int
+    rows: int | None
+    column_bytes: dict
+
+
+class TableStats(NamedTuple):
+    """
+    Totals over a table's data files. ``rows`` is None unless every file's
+    footer had a row count; ``partitions`` counts the distinct
+    ``key=value`` directories (0 for an unpartitioned table).
+    """
+    alias: str
+    path: str
+    files: int
+    bytes: int
+    rows: int | None
+    partitions: int
+    column_bytes: dict
+    unreadable: int
+
+    @property
+    def size_gb(self):
+        return self.bytes / 1024 ** 3
+
+
+class _CompactReader:
+    """
+    Thrift compact protocol decoder that only builds the fields it is asked
+    for. A field spec maps field ids to None (decode the value) or to the
+    spec of a struct, or of a list's struct elements; every other field is
+    skipped without being decoded, which keeps footers with large statistics
+    cheap.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def varint(self):
+        data, pos = self.data, self.pos
+        result = shift = 0
+        while True:
+            byte = data[pos]
+            pos += 1
+            result |= (byte & 0x7F) << shift
+            if not byte & 0x80:
+                self.pos = pos
+                return result
+            shift += 7
+
+    def zigzag(self):
+        n = self.varint()
+        return (n >> 1) ^ -(n & 1)
+
+    def _list_header(self):
+        header = self.data[self.pos]
+        self.pos += 1
+        size = header >> 4
+        return (self.varint() if size == 15 else size), header & 0x0F
+
+    def value(self, kind, spec=None):
+        if kind in (1, 2):
+            return kind == 1
+        if kind in (4, 5, 6):
+            return self.zigzag()
+        if kind == 8:
+            length = self.varint()
+            self.pos += length
+            return bytes(self.data[self.pos - length:self.pos])
+        if kind in (9, 10):
+            size, element = self._list_header()
+            return [self.value(element, spec) for _ in range(size)]
+        if kind == 12:
+            return self.struct(spec or {})
+        raise ValueError(f"Unsupported thrift type {kind} for a requested field")
+
+    def struct(self, spec):
+        fields, field_id, data = {}, 0, self.data
+        while True:
+            header = data[self.pos]
+            self.pos += 1
+            if header == 0:
+                return fields
+            field_id = field_id + (header >> 4) if header >> 4 else self.zigzag()
+            if field_id in spec:
+                fields[field_id] = self.value(header & 0x0F, spec[field_id])
+            else:
+                self.pos = _skip_thrift(data, self.pos, header & 0x0F)
+
+
+def _skip_thrift(data, pos, kind):
+    """
+    Position after the compact protocol value of type ``kind`` at ``pos``.
+    Statistics make up most of a Parquet footer, so this is the hot loop.
+    """
+    if kind in (4, 5, 6):
+        while data[pos] & 0x80:
+            pos += 1
+        return pos + 1
+    if kind == 12:
+        while True:
+            header = data[pos]
+            pos += 1
+            if header == 0:
+                return pos
+            if not header >> 4:
+                # Long form field id, a zigzag varint
+                while data[pos] & 0x80:
+                    pos += 1
+                pos += 1
+            field_kind = header & 0x0F
+            if field_kind in (4, 5, 6):
+                while data[pos] & 0x80:
+                    pos += 1
+                pos += 1
+            elif field_kind not in (1, 2):
+                pos = _skip_thrift(data, pos, field_kind)
+    if kind in (8, 9, 10, 11):
+        size = shift = 0
+        header = data[pos] if kind in (9, 10) else None
+        if header is not None:
+            pos += 1
+            size = header >> 4
+        if header is None or size == 15:
+            size = 0
+            while True:
+                byte = data[pos]
+                pos += 1
+                size |= (byte & 0x7F) << shift
+                if not byte & 0x80:
+                    break
+                shift += 7
+        if kind == 8:
+            return pos + size
+        if kind == 11:
+            if not size:
+                return pos
+            key, value = data[pos] >> 4, data[pos] & 0x0F
+            pos += 1
+            for _ in range(size):
+                pos = _skip_thrift(data, _skip_thrift(data, pos, key), value)
+            return pos
+        element = header & 0x0F
+        if element in (1, 2, 3):
+            return pos + size
+        if element == 7:
+            return pos + 8 * size
+        for _ in range(size):
+            pos = _skip_thrift(data, pos, element)
+        return pos
+    if kind in (1, 2):
+        return pos
+    if kind == 3:
+        return pos + 1
+    if kind == 7:
+        return pos + 8
+    raise ValueError(f"Unknown thrift type {kind}")
+
+
+def _protobuf_fields(data):
+    """
+    Protobuf message as {field number: [values]}; varints are ints and
+    length-delimited fields bytes.
+    """
+    fields, pos = {}, 0
+    while pos < len(data):
+        key, pos = _protobuf_varint(data, pos)
+        wire_type = key & 7
+        if wire_type == 0:
+            value, pos = _protobuf_varint(data, pos)
+        elif wire_type == 1:
+            value, pos = data[pos:pos + 8], pos + 8
+        elif wire_type == 2:
+            length, pos = _protobuf_varint(data, pos)
+            value, pos = bytes(data[pos:pos + length]), pos + length
+        elif wire_type == 5:
+            value, pos = data[pos:pos + 4], pos + 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+        fields.setdefault(key >> 3, []).append(value)
+    return fields
+
+
+def _protobuf_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _packed_varints(values):
+    # Repeated varints arrive packed (one bytes value) or one per field
+    result = []
+    for value in values:
+        if isinstance(value, bytes):
+            pos = 0
+            while pos < len(value):
+                number, pos = _protobuf_varint(value, pos)
+                result.append(number)
+        else:
+            result.append(value)
+    return result
+
+
+def _snappy_decompress(data):
+    """
+    Raw snappy block decoding, for the (small) ORC footers only.
+    """
+    length, pos = _protobuf_varint(data, 0)
+    out = bytearray()
+    while pos < len(data):
+        tag = data[pos]
+        pos += 1
+        kind = tag & 3
+        if kind == 0:
+            size = tag >> 2
+            if size >= 60:
+                extra = size - 59
+                size = int.from_bytes(data[pos:pos + extra], "little")
+                pos += extra
+            size += 1
+            out += data[pos:pos + size]
+            pos += size
+            continue
+        if kind == 1:
+            size, offset = ((tag >> 2) & 7) + 4, ((tag >> 5) << 8) | data[pos]
+            pos += 1
+        else:
+            width = 2 if kind == 2 else 4
+            size, offset = (tag >> 2) + 1, int.from_bytes(data[pos:pos + width], "little")
+            pos += width
+        if not 0 < offset <= len(out):
+            raise ValueError("Corrupt snappy block")
+        start = len(out) - offset
+        # Copies may overlap their own output
+        for i in range(size):
+            out.append(out[start + i])
+    if len(out) != length:
+        raise ValueError("Corrupt snappy block")
+    return bytes(out)
+
+
+def _orc_decompress(data, compression):
+    if compression == _ORC_NONE:
+        return bytes(data)
+    out, pos = bytearray(), 0
+    while pos < len(data):
+        header = int.from_bytes(data[pos:pos + 3], "little")
+        chunk = data[pos + 3:pos + 3 + (header >> 1)]
+        pos += 3 + (header >> 1)
+        if header & 1:
+            out += chunk
+        elif compression == _ORC_ZLIB:
+            out += zlib.decompress(chunk, -15)
+        elif compression == _ORC_SNAPPY:
+            out += _snappy_decompress(chunk)
+        else:
+            raise ValueError(f"Unsupported ORC compression kind {compression}")
+    return bytes(out)
+
+
+def _parquet_stats(view, size):
+    footer_length = int.from_bytes(view[size - 8:size - 4], "little")
+    if footer_length > size - 12:
+        raise ValueError("Corrupt Parquet footer length")
+    metadata = _CompactReader(view[size - 8 - footer_length:size - 8]).struct(_PARQUET_FOOTER_SPEC)
+    column_bytes = Counter()
+    for row_group in metadata.get(_FILE_ROW_GROUPS, []):
+        for chunk in row_group.get(_ROW_GROUP_COLUMNS, []):
+            column = chunk.get(_CHUNK_META_DATA)
+            if column:
+                column_bytes[".".join(part.decode() for part in column[_COLUMN_PATH])] += column.get(_COLUMN_COMPRESSED_SIZE, 0)
+    return FileStats("parquet", size, metadata.get(_FILE_NUM_ROWS, 0), dict(column_bytes))
+
+
+def _orc_stats(view, size):
+    postscript_length = view[size - 1]
+    postscript = _protobuf_fields(view[size - 1 - postscript_length:size - 1])
+    compression = postscript.get(_PS_COMPRESSION, [_ORC_NONE])[0]
+    footer_end = size - 1 - postscript_length
+    footer_start = footer_end - postscript[_PS_FOOTER_LENGTH][0]
+    footer = _protobuf_fields(_orc_decompress(view[footer_start:footer_end], compression))
+
+    # Bytes per column id from the stream directories in the stripe footers
+    # (metadata too; the stripes' data is never touched)
+    types = [_protobuf_fields(kind) for kind in footer.get(_FOOTER_TYPES, [])]
+    stream_bytes = [0] * len(types)
+    for stripe in footer.get(_FOOTER_STRIPES, []):
+        stripe = {key: values[0] for key, values in _protobuf_fields(stripe).items()}
+        start = stripe.get(_STRIPE_OFFSET, 0) + stripe.get(_STRIPE_INDEX_LENGTH, 0) + stripe.get(_STRIPE_DATA_LENGTH, 0)
+        stripe_footer = _protobuf_fields(_orc_decompress(view[start:start + stripe.get(_STRIPE_FOOTER_LENGTH, 0)], compression))
+        for stream in stripe_footer.get(_STRIPE_FOOTER_STREAMS, []):
+            stream = _protobuf_fields(stream)
+            column = stream.get(_STREAM_COLUMN, [0])[0]
+            if column < len(stream_bytes):
+                stream_bytes[column] += stream.get(_STREAM_LENGTH, [0])[0]
+
+    # Types are in pre-order from the root struct, so a top-level column's
+    # subtree runs up to the next top-level column
+    column_bytes = {}
+    if types:
+        roots = _packed_varints(types[0].get(_TYPE_SUBTYPES, []))
+        for name, first, last in zip(types[0].get(_TYPE_FIELD_NAMES, []), roots, roots[1:] + [len(types)]):
+            column_bytes[name.decode()] = sum(stream_bytes[first:last])
+    return FileStats("orc", size, footer.get(_FOOTER_NUM_ROWS, [0])[0], column_bytes)
+
+
+@functools.lru_cache(maxsize=65536)
+def _cached_file_stats(path, mtime_ns, size):
+    # mtime_ns and size are only part of the cache key: a rewritten file is read again
+    if size < len(_PARQUET_MAGIC) * 2 + 4:
+        return None
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        if view[size - 4:] == _PARQUET_MAGIC:
+            file_format, reader = "parquet", _parquet_stats
+        elif view[:len(_ORC_MAGIC)] == _ORC_MAGIC:
+            file_format, reader = "orc", _orc_stats
+        else:
+            return None
+        try:
+            return reader(view, size)
+        except (ValueError, KeyError, IndexError, UnicodeDecodeError, zlib.error, struct.error):
+            # Encrypted Parquet footers, ORC codecs without a stdlib decoder, truncated files
+            return FileStats(file_format, size, None, {})
+
+
+def file_stats(path):
+    """
+    Footer statistics of a Parquet or ORC file, or None for other files.
+    Cached until the file's mtime or size changes.
+    """
+    stat = os.stat(path)
+    return _cached_file_stats(path, stat.st_mtime_ns, stat.st_size)
+
+
+def clear_stats_cache():
+    _cached_file_stats.cache_clear()
+
+
+def table_path(table, warehouse=DEFAULT_WAREHOUSE_PATH):
+    """
+    Directory (or file) holding a table spec's data, or None if there is none.
+    """
+    if table.get("path"):
+        candidates = [os.path.join(warehouse, table["path"])]
+    else:
+        schema, name = table.get("schema") or "", table.get("name") or ""
+        if not name:
+            return None
+        candidates = [os.path.join(warehouse, directory, table_name)
+                      for directory in (schema, f"{schema}.db", schema.lower(), f"{schema.lower()}.db")
+                      for table_name in (name, name.lower())]
+    return next((path for path in candidates if os.path.exists(path)), None)
+
+
+def data_files(path):
+    """
+    The files under a table path with their partition directory, skipping
+    Spark's bookkeeping files (``_SUCCESS``, ``_delta_log``, ``.crc`` ...).
+    """
+    if os.path.isfile(path):
+        return [(path, "")]
+    files = []
+    for directory, subdirectories, names in os.walk(path):
+        subdirectories[:] = [name for name in subdirectories if not name.startswith(("_", "."))]
+        partition = os.path.relpath(directory, path)
+        partition = "" if partition == "." or "=" not in partition else partition
+        files.extend((os.path.join(directory, name), partition) for name in names if not name.startswith(("_", ".")))
+    return files
+
+
+def collect_table_stats(tables, warehouse=DEFAULT_WAREHOUSE_PATH, workers=DEFAULT_STATS_WORKERS):
+    """
+    TableStats per table alias for the table specs found under ``warehouse``;
+    tables without data files there are left out. All files of all tables
+    are read on one thread pool (``workers=1`` reads them in this thread).
+    """
+    located = []
+    for table in tables:
+        path = table_path(table, warehouse)
+        if path:
+            located.append((table.get("alias") or table.get("name"), path, data_files(path)))
+    paths = [path for _, _, files in located for path, _ in files]
+    if workers == 1 or len(paths) <= 1:
+        results = [file_stats(path) for path in paths]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(file_stats, paths))
+
+    stats, results = {}, iter(results)
+    for alias, path, files in located:
+        readable = [(result, partition) for result, (_, partition) in zip(results, files) if result is not None]
+        if not readable:
+            continue
+        column_bytes = Counter()
+        for result, _ in readable:
+            column_bytes.update(result.column_bytes)
+        rows = [result.rows for result, _ in readable]
+        stats[alias] = TableStats(
+            alias=alias,
+            path=path,
+            files=len(readable),
+            bytes=sum(result.bytes for result, _ in readable),
+            rows=None if None in rows else sum(rows),
+            partitions=len({partition for _, partition in readable if partition}),
+            column_bytes=dict(column_bytes.most_common()),
+            unreadable=sum(result.rows is None for result, _ in readable),
+        )
+    return stats
+
+
+def fill_table_stats(tables, stats):
+    """
+    Set ``size_gb``, ``rows`` and ``partitions`` of the table specs that
+    have collected stats, replacing hand-entered estimates.
+    """
+    for table in tables:
+        table_stats = stats.get(table.get("alias") or table.get("name"))
+        if table_stats is None:
+            continue
+        table["size_gb"] = round(table_stats.size_gb, 6)
+        if table_stats.rows is not None:
+            table["rows"] = table_stats.rows
+        if table_stats.partitions:
+            table["partitions"] = table_stats.partitions
+    return tables
+
+
+def table_sizes_input(tables):
+    """
+    The recommender's comma-separated ``table_sizes`` (GB) for table specs
+    that all have a ``size_gb``, else None.
+    """
+    sizes = [table.get("size_gb") for table in tables if table.get("name")]
+    if not sizes or any(size in (None, "") for size in sizes):
+        return None
+    return ",".join(f"{float(size):g}" for size in sizes)
+
+
+def render_table_stats(stats):
+    lines = []
+    for table in stats.values():
+        rows = f"{table.rows:,} rows" if table.rows is not None else "rows unknown"
+        partitions = f", {table.partitions} partitions" if table.partitions else ""
+        lines.append(f"{table.alias}: {table.size_gb:.3f} GB, {rows}, {table.files} files{partitions} ({table.path})")
+        if table.unreadable:
+            lines.append(f"  {table.unreadable} files with undecodable footers counted by size only")
+        for column, size in list(table.column_bytes.items())[:10]:
+            lines.append(f"  {column}: {size / 1024 ** 2:.1f} MB")
+    return "\n".join(lines)
@@ -0,0 +1,399 @@
+"""
+Post-run tuning advice from one run's Spark event log.
+
+    advice = advise(analyze_event_log("eventlog"), params, recommendation)
+    print(advice.render())
+    generate_spark_code(json.dumps(advice.params["tables"]), ..., advice.spark_configs, ..., **advice.generate_options)
+
+The log is streamed once (see ``spark_event_log``) into a small profile: per
+stage the task duration distribution (as a fixed log-scale histogram, so memory
+does not grow with the task count), spill and shuffle bytes; per executor its
+busy time; and any broadcast failures. The findings (skewed tasks, spill,
+badly sized shuffle partitions, broadcast failures, idle executors) are mapped
+back onto the inputs of ``generate_spark_code``: new Spark configs, the
+broadcast threshold and shuffle partition size options, and table ``skew``
+scores that turn on salting for the join that most likely caused the skew.
+"""
+from __future__ import annotations
+
+import bisect
+import copy
+import json
+import math
+import re
+from typing import NamedTuple
+
+import numpy as np
+
+from query_planner import plan_join_order
+from spark_code_generator import (
+    DEFAULT_BROADCAST_THRESHOLD_MB,
+    DEFAULT_SHUFFLE_PARTITION_MB,
+    DEFAULT_SKEW_THRESHOLD,
+    SALTABLE_JOIN_TYPES,
+    plan_broadcast_joins,
+    plan_shuffle_stages,
+    plan_skew_joins,
+    shuffle_partition_count,
+    table_size_mb,
+)
+from spark_event_log import iter_events
+
+# A stage is skewed when its slowest task takes this many times the median...
+SKEW_RATIO = 5
+# ...and at least this long, in a stage with at least MIN_SKEW_TASKS tasks
+MIN_SKEW_TASK_SECONDS = 30
+MIN_SKEW_TASKS = 10
+
+# Average shuffle read per task outside this range (MB) is a badly sized partition
+UNDERSIZED_PARTITION_MB = 16
+OVERSIZED_PARTITION_MB = 512
+
+# Bounds for the recommended shuffle_partition_mb
+MIN_SHUFFLE_PARTITION_MB = 32
+MAX_SHUFFLE_PARTITION_MB = 1024
+
+# Executors busy less than IDLE_UTILIZATION of their core time are cut back towards TARGET_UTILIZATION
+IDLE_UTILIZATION = 0.3
+TARGET_UTILIZATION = 0.7
+
+# Spark's default spark.sql.broadcastTimeout, in seconds
+DEFAULT_BROADCAST_TIMEOUT = 300
+
+# Task durations per stage are counted in these log-scale bins (1 ms to ~28 hours, 20 per decade)
+_DURATION_BINS_MS = np.logspace(0, 8, 161).tolist()
+
+_BROADCAST_FAILURE = re.compile(
+    r"Could not execute broadcast|Cannot broadcast the table|Not enough memory to build and broadcast|"
+    r"spark\.sql\.autoBroadcastJoinThreshold|broadcastTimeout", re.IGNORECASE)
+_BROADCAST_TIMEOUT = re.compile(r"Could not execute broadcast in|broadcastTimeout", re.IGNORECASE)
+
+# Failure messages kept per run; the first few are enough to explain a failure
+MAX_FAILURE_MESSAGES = 20
+
+ADVISOR_EVENTS = {
+    "SparkListenerApplicationStart", "SparkListenerApplicationEnd", "SparkListenerEnvironmentUpdate",
+    "SparkListenerExecutorAdded", "SparkListenerExecutorRemoved", "SparkListenerStageCompleted",
+    "SparkListenerTaskEnd", "SparkListenerJobEnd",
+}
+
+
+class StageProfile(NamedTuple):
+    stage_id: int
+    name: str
+    tasks: int
+    median_task_seconds: float
+    max_task_seconds: float
+    input_bytes: int
+    shuffle_read_bytes: int
+    shuffle_write_bytes: int
+    memory_bytes_spilled: int
+    disk_bytes_spilled: int
+
+
+class RunProfile(NamedTuple):
+    """
+    What the advisor needs from one event log. ``executor_utilization`` is
+    task time over executor core time; ``failures`` holds the broadcast-related
+    failure messages.
+    """
+    app_id: str
+    spark_properties: dict
+    stages: tuple[StageProfile, ...]
+    peak_executors: int
+    executor_cores: int
+    executor_utilization: float
+    failures: tuple[str, ...]
+
+
+class _StageTotals:
+    """
+    Running totals of one stage's successful tasks.
+    """
+
+    def __init__(self):
+        self.name = ""
+        self.durations = np.zeros(len(_DURATION_BINS_MS) + 1, dtype=np.int64)
+        self.max_ms = 0
+        self.input = self.shuffle_read = self.shuffle_write = self.memory_spilled = self.disk_spilled = 0
+
+    def profile(self, stage_id):
+        tasks = int(self.durations.sum())
+        # Median from the histogram: upper edge of the bin holding the middle task
+        middle = np.searchsorted(np.cumsum(self.durations), (tasks + 1) / 2)
+        median_ms = min(_DURATION_BINS_MS[min(middle, len(_DURATION_BINS_MS) - 1)], self.max_ms)
+        return StageProfile(stage_id, self.name, tasks, median_ms / 1000, self.max_ms / 1000, self.input, self.shuffle_read,
+                            self.shuffle_write, self.memory_spilled, self.disk_spilled)
+
+
+def _failure_messages(event):
+    name = event["Event"]
+    if name == "SparkListenerTaskEnd":
+        reason = event.get("Task End Reason") or {}
+        return [reason.get("Description", "")]
+    if name == "SparkListenerStageCompleted":
+        return [(event.get("Stage Info") or {}).get("Failure Reason", "")]
+    if name == "SparkListenerJobEnd":
+        result = event.get("Job Result") or {}
+        return [(result.get("Exception") or {}).get("Message", "")]
+    return []
+
+
+def analyze_event_log(path):
+    """
+    Stream an event log into a RunProfile.
+    """
+    app_id = ""
+    properties = {}
+    stages = {}
+    executors = {}  # id -> [added ms, removed ms or None, cores, busy ms]
+    alive = peak_executors = 0
+    app_end = 0
+    failures = []
+
+    for event in iter_events(path, ADVISOR_EVENTS):
+        name = event["Event"]
+        for message in _failure_messages(event):
+            if message and _BROADCAST_FAILURE.search(message) and len(failures) < MAX_FAILURE_MESSAGES:
+                failures.append(message.strip().splitlines()[0])
+
+        if name == "SparkListenerTaskEnd":
+            info = event.get("Task Info") or {}
+            finish, launch = info.get("Finish Time", 0), info.get("Launch Time", 0)
+            executor = executors.get(info.get("Executor ID"))
+            if executor is not None:
+                executor[3] += max(finish - launch, 0)
+            app_end = max(app_end, finish)
+            if (event.get("Task End Reason") or {}).get("Reason", "Success") != "Success":
+                continue
+            totals = stages.setdefault(event.get("Stage ID"), _StageTotals())
+            duration = max(finish - launch, 0)
+            totals.durations[bisect.bisect_left(_DURATION_BINS_MS, duration)] += 1
+            totals.max_ms = max(totals.max_ms, duration)
+            metrics = event.get("Task Metrics") or {}
+            totals.input += (metrics.get("Input Metrics") or {}).get("Bytes Read", 0)
+            read = metrics.get("Shuffle Read Metrics") or {}
+            totals.shuffle_read += read.get("Remote Bytes Read", 0) + read.get("Local Bytes Read", 0)
+            totals.shuffle_write += (metrics.get("Shuffle Write Metrics") or {}).get("Shuffle Bytes Written", 0)
+            totals.memory_spilled += metrics.get("Memory Bytes Spilled", 0)
+            totals.disk_spilled += metrics.get("Disk Bytes Spilled", 0)
+        elif name == "SparkListenerStageCompleted":
+            info = event.get("Stage Info") or {}
+            stages.setdefault(info.get("Stage ID"), _StageTotals()).name = info.get("Stage Name", "")
+        elif name == "SparkListenerExecutorAdded":
+            cores = (event.get("Executor Info") or {}).get("Total Cores", 1)
+            executors[event.get("Executor ID")] = [event.get("Timestamp", 0), None, cores, 0]
+            alive += 1
+            peak_executors = max(peak_executors, alive)
+        elif name == "SparkListenerExecutorRemoved":
+            executor = executors.get(event.get("Executor ID"))
+            if executor is not None and executor[1] is None:
+                executor[1] = event.get("Timestamp", 0)
+                alive -= 1
+        elif name == "SparkListenerEnvironmentUpdate":
+            properties = dict(event.get("Spark Properties") or {})
+        elif name == "SparkListenerApplicationStart":
+            app_id = event.get("App ID", "")
+        elif name == "SparkListenerApplicationEnd":
+            app_end = max(app_end, event.get("Timestamp", 0))
+
+    core_ms = sum(((removed or app_end) - added) * cores for added, removed, cores, _ in executors.values())
+    busy_ms = sum(busy for *_, busy in executors.values())
+    return RunProfile(
+        app_id=app_id,
+        spark_properties=properties,
+        stages=tuple(totals.profile(stage_id) for stage_id, totals in sorted(stages.items(), key=lambda item: item[0] or 0)),
+        peak_executors=peak_executors,
+        executor_cores=max((cores for _, _, cores, _ in executors.values()), default=0),
+        executor_utilization=busy_ms / core_ms if core_ms > 0 else 1.0,
+        failures=tuple(failures),
+    )
+
+
+class Finding(NamedTuple):
+    kind: str  # skew, spill, oversized_partitions, undersized_partitions, broadcast_failure, idle_executors
+    message: str
+
+
+class Advice(NamedTuple):
+    """
+    Findings plus the changed inputs for ``generate_spark_code``:
+    ``spark_configs`` (the Recommendation with its configs replaced when one
+    was given, else (key, value) pairs), ``generate_options`` (keyword
+    arguments) and ``params`` (the saved parameters with updated tables).
+    ``config_changes`` maps each changed key to its (old, new) value.
+    """
+    findings: tuple[Finding, ...]
+    spark_configs: object
+    config_changes: dict
+    generate_options: dict
+    params: dict
+    parameter_changes: tuple[str, ...]
+
+    def render(self):
+        """
+        Text report: the findings, then the changes as a diff.
+        """
+        lines = ["Findings:"] + [f"- [{finding.kind}] {finding.message}" for finding in self.findings]
+        if not self.findings:
+            lines.append("- None, the run looks healthy")
+        if self.config_changes:
+            lines.append("Spark configs:")
+            for key, (old, new) in self.config_changes.items():
+                if old is not None:
+                    lines.append(f"-  {key} = {old}")
+                lines.append(f"+  {key} = {new}")
+        if self.generate_options:
+            lines.append("Generator options:")
+            lines.extend(f"   {key} = {value}" for key, value in self.generate_options.items())
+        if self.parameter_changes:
+            lines.append("Saved parameters:")
+            lines.extend(f"   {change}" for change in self.parameter_changes)
+        return "\n".join(lines)
+
+
+def _decoded(value):
+    if isinstance(value, str):
+        return json.loads(value) if value.strip() else []
+    return value or []
+
+
+def _skew_score(ratio, skew_threshold):
+    """
+    Table skew score for a max/median task ratio: just past the salting
+    threshold at SKEW_RATIO, one point more per doubling, at most 10.
+    """
+    return min(10, math.floor(skew_threshold) + 1 + max(0, math.floor(math.log2(ratio / SKEW_RATIO))))
+
+
+def advise(profile, params, spark_configs=None, broadcast_threshold_mb=DEFAULT_BROADCAST_THRESHOLD_MB,
+           shuffle_partition_mb=DEFAULT_SHUFFLE_PARTITION_MB, skew_threshold=DEFAULT_SKEW_THRESHOLD):
+    """
+    Turn a RunProfile (or the path of an event log) into Advice for the job's
+    saved ``params``. ``spark_configs`` (a Recommendation or (key, value)
+    pairs) and the generator options are the ones the run was generated with.
+    """
+    if isinstance(profile, str):
+        profile = analyze_event_log(profile)
+    params = copy.deepcopy(params)
+    tables = _decoded(params.get("tables"))
+    joins = _decoded(params.get("joins"))
+    transformations = _decoded(params.get("transformations"))
+    pairs = list(getattr(spark_configs, "spark_configs", spark_configs) or [])
+    current = dict(pairs)
+    total_cores = getattr(spark_configs, "total_cores", None) or (profile.peak_executors * profile.executor_cores) or None
+
+    findings = []
+    configs = {}
+    options = {}
+    parameter_changes = []
+
+    def current_value(key, default=None):
+        return current.get(key, profile.spark_properties.get(key, default))
+
+    # The same join order and plans as the generated job
+    joins, _ = plan_join_order(tables, joins)
+    broadcast_plan = plan_broadcast_joins(tables, joins, broadcast_threshold_mb)
+
+    # Skewed tasks: salt the biggest shuffle join that is not salted yet
+    skewed = [stage for stage in profile.stages
+              if stage.tasks >= MIN_SKEW_TASKS and stage.max_task_seconds >= MIN_SKEW_TASK_SECONDS
+              and stage.max_task_seconds >= SKEW_RATIO * stage.median_task_seconds]
+    if skewed:
+        worst = max(skewed, key=lambda stage: stage.max_task_seconds / max(stage.median_task_seconds, 1e-3))
+        ratio = worst.max_task_seconds / max(worst.median_task_seconds, 1e-3)
+        findings.append(Finding("skew", f"Stage {worst.stage_id} ({worst.name or 'unnamed'}): slowest task {worst.max_task_seconds:,.0f}s, "
+                                        f"{ratio:,.0f}x the median of {worst.median_task_seconds:,.1f}s"))
+        configs["spark.sql.adaptive.skewJoin.enabled"] = "true"
+        skew_plan = plan_skew_joins(tables, joins, broadcast_plan, skew_threshold, total_cores)
+        shuffle_plan = plan_shuffle_stages(tables, joins, transformations, broadcast_plan, skew_plan, total_cores)
+        candidates = [(stage["shuffled_mb"] if stage else 0, i) for i, (stage, salt) in enumerate(zip(shuffle_plan["joins"], skew_plan))
+                      if not broadcast_plan[i][0] and salt is None and joins[i]['type'] in SALTABLE_JOIN_TYPES]
+        if candidates:
+            # Salting needs a skew score on the join's larger side; a left join can only salt its left side
+            join = joins[max(candidates)[1]]
+            sizes = {table['alias']: table_size_mb(table) or 0 for table in tables}
+            aliases = [alias for alias in sizes if re.search(rf"\b{re.escape(alias)}\.", join['conditions'])
+                       and (join['type'] == "inner" or alias != join['right_table'])]
+            larger = max(aliases, key=lambda alias: sizes[alias], default=join['right_table'])
+            score = _skew_score(ratio, skew_threshold)
+            for table in tables:
+                if table['alias'] == larger and float(table.get('skew') or 0) < score:
+                    parameter_changes.append(f"tables[{larger}].skew: {table.get('skew')} -> {score} (salts the join with {join['right_table']})")
+                    table['skew'] = score
+
+    # Shuffle partition sizing from the measured bytes per shuffle-reading task
+    shuffle_stages = [stage for stage in profile.stages if stage.shuffle_read_bytes and stage.tasks]
+    spilled = [stage for stage in profile.stages if stage.disk_bytes_spilled]
+    oversized = [stage for stage in shuffle_stages if stage.shuffle_read_bytes / stage.tasks / 2 ** 20 > OVERSIZED_PARTITION_MB]
+    cores = total_cores or 1
+    undersized = [stage for stage in shuffle_stages
+                  if stage.shuffle_read_bytes / stage.tasks / 2 ** 20 < UNDERSIZED_PARTITION_MB and stage.tasks > 2 * cores]
+    if spilled:
+        total = sum(stage.disk_bytes_spilled for stage in spilled)
+        findings.append(Finding("spill", f"{total / 2 ** 30:,.1f} GB spilled to disk in stage(s) "
+                                         f"{', '.join(str(stage.stage_id) for stage in spilled)}"))
+    for stage in oversized:
+        findings.append(Finding("oversized_partitions", f"Stage {stage.stage_id} read {stage.shuffle_read_bytes / stage.tasks / 2 ** 20:,.0f} MB "
+                                                        f"of shuffle data per task over {stage.tasks} tasks"))
+    for stage in undersized:
+        findings.append(Finding("undersized_partitions", f"Stage {stage.stage_id} read {stage.shuffle_read_bytes / stage.tasks / 2 ** 20:,.1f} MB "
+                                                         f"of shuffle data per task over {stage.tasks} tasks"))
+    if shuffle_stages and (oversized or undersized or spilled):
+        # Scale the target by how far the measured partitions of the largest exchange were from it; spilling stages aim at half
+        largest = max(shuffle_stages, key=lambda stage: stage.shuffle_read_bytes)
+        measured_mb = max(largest.shuffle_read_bytes / largest.tasks / 2 ** 20, 1)
+        target_mb = shuffle_partition_mb / 2 if spilled else shuffle_partition_mb
+        new_mb = shuffle_partition_mb * target_mb / measured_mb
+        if spilled:
+            new_mb = min(new_mb, target_mb)
+        elif not oversized:
+            # Undersized only: AQE coalesces small partitions, so only grow them
+            new_mb = max(new_mb, shuffle_partition_mb)
+            configs["spark.sql.adaptive.coalescePartitions.enabled"] = "true"
+        new_mb = float(np.clip(round(new_mb), MIN_SHUFFLE_PARTITION_MB, MAX_SHUFFLE_PARTITION_MB))
+        if new_mb != shuffle_partition_mb:
+            options["shuffle_partition_mb"] = new_mb
+        configs["spark.sql.shuffle.partitions"] = str(shuffle_partition_count(largest.shuffle_read_bytes / 2 ** 20, target_mb, total_cores))
+
+    # Broadcast failures: stop broadcasting the largest table, or give the broadcast more time
+    if profile.failures:
+        findings.append(Finding("broadcast_failure", profile.failures[0]))
+        timed_out = [message for message in profile.failures if _BROADCAST_TIMEOUT.search(message)]
+        if timed_out:
+            timeout = int(str(current_value("spark.sql.broadcastTimeout", DEFAULT_BROADCAST_TIMEOUT)).rstrip("s"))
+            configs["spark.sql.broadcastTimeout"] = str(timeout * 2)
+        if len(timed_out) < len(profile.failures):
+            broadcast_sizes = sorted({table_size_mb(table) for table in tables for (use_broadcast, _), join in zip(broadcast_plan, joins)
+                                      if use_broadcast and join['right_table'] == table['alias']})
+            if broadcast_sizes:
+                # The second largest broadcast table's size keeps the smaller ones broadcast; the generator sets
+                # spark.sql.autoBroadcastJoinThreshold from the option
+                options["broadcast_threshold_mb"] = broadcast_sizes[-2] if len(broadcast_sizes) > 1 else 0.0
+            else:
+                threshold = int(str(current_value("spark.sql.autoBroadcastJoinThreshold", 10 * 1024 * 1024)).rstrip("b"))
+                configs["spark.sql.autoBroadcastJoinThreshold"] = str(threshold // 2) if threshold > 0 else "-1"
+
+    # Idle executors: cap dynamic allocation at what the tasks kept busy
+    if profile.peak_executors > 1 and profile.executor_utilization < IDLE_UTILIZATION:
+        findings.append(Finding("idle_executors", f"Executors were busy {profile.executor_utilization:.0%} of their core time "
+                                                  f"(peak {profile.peak_executors} executors)"))
+        max_executors = max(1, math.ceil(profile.peak_executors * profile.executor_utilization / TARGET_UTILIZATION))
+        configs["spark.dynamicAllocation.maxExecutors"] = str(max_executors)
+        configs["spark.dynamicAllocation.executorIdleTimeout"] = "60s"
+        if int(current.get("spark.executor.instances", 0)) > max_executors:
+            configs["spark.executor.instances"] = str(max_executors)
+            configs["spark.dynamicAllocation.initialExecutors"] = str(max_executors)
+        if int(current.get("spark.dynamicAllocation.minExecutors", 0)) > max_executors:
+            configs["spark.dynamicAllocation.minExecutors"] = str(max_executors)
+
+    config_changes = {key: (current_value(key), value) for key, value in configs.items() if current_value(key) != value}
+    new_pairs = tuple((key, configs.get(key, value)) for key, value in pairs) + tuple(
+        (key, value) for key, value in configs.items() if key not in current)
+    if hasattr(spark_configs, "_replace") and hasattr(spark_configs, "spark_configs"):
+        new_configs = spark_configs._replace(spark_configs=new_pairs)
+    else:
+        new_configs = new_pairs
+    if parameter_changes and tables:
+        params["tables"] = tables
+    return Advice(tuple(findings), new_configs, config_changes, options, params, tuple(parameter_changes))
@@ -1,7 +1,13 @@
+import asyncio
+import itertools
 import json
 import os
+import time
+from collections import deque
 from datetime import datetime
 
+import numpy as np
+
 def parse_list_input(input_str, default_value=1):
     try:
         return [float(x.strip()) for x in input_str.split(',') if x.strip()]
@@ -51,6 +57,56 @@ def load_parameters(filename):
     except FileNotFoundError:
         return None, None, None, None, None, None, None, None, None, f"File {filename} not found."
 
+def is_parameter_file(filename):
+    return filename.endswith('.json') and (filename.startswith('saved_parameters_') or filename.endswith('_job.json'))
+
 # Function to list saved parameter files
 def list_parameter_files():
-    return [f for f in os.listdir() if f.endswith('.json') and (f.startswith('saved_parameters_') or f.endswith('_job.json'))]
+    return [f for f in os.listdir() if is_parameter_file(f)]
+
+
+class LatestCallCoalescer:
+    """
+    Coalesce bursts of calls into one computation per key (e.g. per UI session).
+
+    Every call waits ``delay`` seconds; only the most recent call for a key then
+    runs ``func``, while the calls it superseded return ``superseded()`` (for
+    Gradio, ``gr.update()`` leaves the output untouched).
+    """
+
+    def __init__(self, func, delay=0.3, superseded=lambda: None, latency_window=1000):
+        self.func = func
+        self.delay = delay
+        self.superseded = superseded
+        self.calls = 0
+        self.coalesced = 0
+        self.computed = 0
+        self.latencies = deque(maxlen=latency_window)
+        self._latest = {}
+        self._sequence = itertools.count()
+
+    async def __call__(self, key, *args):
+        self.calls += 1
+        token = next(self._sequence)
+        self._latest[key] = token
+        await asyncio.sleep(self.delay)
+        if self._latest.get(key) != token:
+            self.coalesced += 1
+            return self.superseded()
+        del self._latest[key]
+
+        start = time.perf_counter()
+        result = self.func(*args)
+        self.computed += 1
+        self.latencies.append(time.perf_counter() - start)
+        return result
+
+    def stats(self):
+        latencies = np.asarray(self.latencies) * 1000
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "computed": self.computed,
+            "latency_ms_p50": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+            "latency_ms_p99": float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+        }
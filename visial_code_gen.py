@@ -3,6 +3,7 @@ import numpy as np
 import json
 import os
 import logging
+from datetime import datetime
 #from pyspark.sql.functions import expr
 import sys
 
@@ -12,26 +13,43 @@ parent_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.append(parent_dir)
 
 # Import custom modules
-from resource_recommender import determine_workload_type, recommend_resources
-from spark_code_generator import generate_spark_code
-from utils import parse_list_input, save_parameters, load_parameters, list_parameter_files
+from parameter_store import DEFAULT_PAGE_SIZE, ParameterStore
+from resource_recommender import determine_workload_type_cached, recommend_resources, workload_type_cache_info
+from spark_code_generator import (DEFAULT_BROADCAST_THRESHOLD_MB, DEFAULT_TARGET_FILE_SIZE_MB, DEFAULT_TRIGGER_INTERVAL, LOAD_MODES,
+                                  STORAGE_LEVELS, STREAM_SOURCES, STREAMING_MODES, generate_spark_code)
+from table_stats import DEFAULT_WAREHOUSE_PATH, collect_table_stats, fill_table_stats, render_table_stats, table_sizes_input
+from utils import LatestCallCoalescer, parse_list_input
 
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
 
-def update_workload_type(num_tables, table_sizes, join_complexities, transformation_complexities, data_skews):
+# Bursts of edits in the workload inputs are coalesced per session into one detection
+workload_type_coalescer = LatestCallCoalescer(determine_workload_type_cached, delay=0.3, superseded=gr.update)
+
+
+async def update_workload_type(num_tables, table_sizes, join_complexities, transformation_complexities, data_skews, recency, frequency, request: gr.Request):
     """
     Update the workload type based on input parameters.
     """
-    num_tables = int(num_tables)
-    table_sizes = parse_list_input(table_sizes)
-    join_complexities = parse_list_input(join_complexities)
-    transformation_complexities = parse_list_input(transformation_complexities)
-    data_skews = parse_list_input(data_skews)
-    
-    return determine_workload_type(num_tables, table_sizes, join_complexities, transformation_complexities, data_skews)
+    session = request.session_hash if request is not None else None
+    workload_type = await workload_type_coalescer(session, num_tables, table_sizes, join_complexities, transformation_complexities, data_skews, recency, frequency)
+    logging.debug("Workload type detection stats: %s", workload_type_stats())
+    return workload_type
+
+def workload_type_stats():
+    """
+    Cache hit rate and handler latency of the live workload type detection.
+    """
+    cache_info = workload_type_cache_info()
+    lookups = cache_info.hits + cache_info.misses
+    return {
+        "cache_hits": cache_info.hits,
+        "cache_misses": cache_info.misses,
+        "cache_hit_rate": cache_info.hits / lookups if lookups else 0.0,
+        **workload_type_coalescer.stats(),
+    }
 
 def update_tables(tables):
     """
@@ -42,20 +60,6 @@ def update_tables(tables):
     table_aliases = [table['alias'] for table in tables]
     return [gr.update(choices=table_aliases) for _ in range(8)]
 
-# Initialize join components
-join_components = []
-for i in range(4):
-    with gr.Row():
-        join_components.extend([
-            gr.Dropdown(label=f"Left Table/Subquery {i+1}", choices=[]),
-            gr.Dropdown(label=f"Join Type {i+1}", choices=['inner', 'left', 'right', 'full', 'subquery', 'self']),
-            gr.Dropdown(label=f"Right Table {i+1}", choices=[]),
-            gr.Textbox(label=f"Join Condition {i+1}", placeholder="e.g., table1.id == table2.id"),
-            gr.Textbox(label=f"Subquery {i+1}", placeholder="SELECT * FROM ..."),
-            gr.Textbox(label=f"Left Alias {i+1} (for self-join)", placeholder="t1"),
-            gr.Textbox(label=f"Right Alias {i+1} (for self-join)", placeholder="t2")
-        ])
-
 def update_joins(tables, joins):
     """
     Update join components based on the current tables and joins.
@@ -92,293 +96,458 @@ def update_joins(tables, joins):
 
     return join_components
 
-# Create the Gradio interface
-with gr.Blocks() as iface:
-    gr.Markdown("# Enhanced EMR Job Resource Recommender")
-    gr.Markdown("Enter your EMR job parameters to get comprehensive recommendations for cluster resources and configurations.")
+def fill_table_sizes(tables, table_sizes, data_skews=None):
+    """
+    Copy the recommender's comma-separated table sizes (GB) and data skews onto
+    the table specs that have no size or skew of their own, when there is exactly
+    one value per named table.
+    """
+    named_tables = [table for table in tables if table.get("name")]
+    for key, values in (("size_gb", table_sizes), ("skew", data_skews)):
+        values = parse_list_input(values or "")
+        if len(values) != len(named_tables):
+            continue
+        for table, value in zip(named_tables, values):
+            table.setdefault(key, value)
+    return tables
+
+
+def collect_table_sizes(tables, warehouse):
+    """
+    Fill the table specs' sizes and row counts from the Parquet/ORC metadata
+    under ``warehouse``, and the recommender's table count and sizes with them.
+    """
+    if isinstance(tables, str):
+        tables = json.loads(tables)
+    stats = collect_table_stats(tables, warehouse or DEFAULT_WAREHOUSE_PATH)
+    if not stats:
+        return tables, gr.update(), gr.update(), f"No Parquet or ORC data found for these tables under {warehouse}"
+    tables = fill_table_stats(tables, stats)
+    sizes = table_sizes_input(tables)
+    named = sum(1 for table in tables if table.get("name"))
+    return (tables, gr.update(value=sizes) if sizes else gr.update(), gr.update(value=min(20, named)),
+            render_table_stats(stats))
+
+
+def get_recommendations(num_tables, table_sizes, join_complexities, transformation_complexities,
+                        data_skews, use_spot_instances, sla_requirements,
+                        workload_type, enable_auto_termination, recency, frequency):
+    """
+    Recommend resources, returning the text report and the Recommendation kept in session state.
+    """
+    try:
+        recommendation = recommend_resources(num_tables, table_sizes, join_complexities, transformation_complexities,
+                                             data_skews, use_spot_instances, sla_requirements,
+                                             workload_type, enable_auto_termination, recency, frequency)
+    except ValueError as e:
+        return f"Error in input: {str(e)}. Please check your inputs and try again.", None
+    return recommendation.render(), recommendation
+
+
+def generate_code_with_recommendations(tables, joins, predicates, recommendation, output_table, output_schema, transformations, write_mode, partition_columns, partition_values,
+                                       table_sizes, data_skews, broadcast_threshold_mb, target_file_size_mb, max_records_per_file, production, storage_level,
+                                       load_mode="auto", merge_keys="", streaming="auto", trigger_interval=DEFAULT_TRIGGER_INTERVAL,
+                                       stream_source="table"):
+    """
+    Generate Spark code based on the provided parameters and recommendations.
+    """
+    if isinstance(tables, str):
+        tables = json.loads(tables)
+    tables = json.dumps(fill_table_sizes(tables, table_sizes, data_skews))
+    if not isinstance(joins, str):
+        joins = json.dumps(joins)
+    if not isinstance(transformations, str):
+        transformations = json.dumps(transformations)
+
+    # The Recommendation is passed through as is, its spark_configs are already key/value pairs
+    return generate_spark_code(tables, joins, predicates, recommendation, output_table, output_schema, transformations, write_mode, partition_columns, partition_values,
+                               broadcast_threshold_mb=broadcast_threshold_mb or DEFAULT_BROADCAST_THRESHOLD_MB,
+                               target_file_size_mb=target_file_size_mb or None,
+                               max_records_per_file=int(max_records_per_file) if max_records_per_file else None,
+                               production=production, storage_level=storage_level,
+                               incremental=LOAD_MODES.get(load_mode), merge_keys=merge_keys or None,
+                               streaming=STREAMING_MODES.get(streaming), trigger_interval=trigger_interval or None,
+                               stream_source=stream_source)
+
+
+def saved_job_choices(store, search="", page=1):
+    """
+    One page of saved job names for the load dropdown, optionally only the jobs
+    whose latest version reads a table or schema, or writes an output table,
+    matching ``search``.
+    """
+    offset = (max(1, int(page or 1)) - 1) * DEFAULT_PAGE_SIZE
+    if not search:
+        return store.list_jobs(offset, DEFAULT_PAGE_SIZE)
+    matches = []
+    for field in ("table", "schema", "output_table"):
+        matches.extend(name for name in store.search(**{field: search.strip()}, limit=offset + DEFAULT_PAGE_SIZE) if name not in matches)
+    return matches[offset:offset + DEFAULT_PAGE_SIZE]
+
+
+def create_interface(parameter_store=None, pool=None):
+    """
+    Build the Gradio UI. Only called when serving, so importing this module's
+    helpers (or using cli.py) does not pay for constructing the widgets.
+    Saved parameters go to ``parameter_store`` (default: ParameterStore()).
+    With a ``serving.WorkerPool``, recommendations and code generation run in
+    its workers instead of Gradio's thread pool.
+    """
+    parameter_store = parameter_store or ParameterStore()
+    recommend_handler, generate_handler = get_recommendations, generate_code_with_recommendations
+    if pool is not None:
+        recommend_handler, generate_handler = pool.wrap(get_recommendations), pool.wrap(generate_code_with_recommendations)
+    # Create the Gradio interface
+    with gr.Blocks() as iface:
+        gr.Markdown("# Enhanced EMR Job Resource Recommender")
+        gr.Markdown("Enter your EMR job parameters to get comprehensive recommendations for cluster resources and configurations.")
     
-    # Input components for job parameters
-    with gr.Row():
-        num_tables = gr.Slider(1, 20, step=1, value=1, label="Number of Tables")
-        table_sizes = gr.Textbox(label="Table Sizes (GB, comma-separated)", value="10", placeholder="e.g., 10,20,30")
+        # Input components for job parameters
+        with gr.Row():
+            num_tables = gr.Slider(1, 20, step=1, value=1, label="Number of Tables")
+            table_sizes = gr.Textbox(label="Table Sizes (GB, comma-separated)", value="10", placeholder="e.g., 10,20,30")
     
-    with gr.Row():
-        join_complexities = gr.Textbox(label="Join Complexities (1-10, comma-separated)", value="5", placeholder="e.g., 5,7,3")
-        transformation_complexities = gr.Textbox(label="Transformation Complexities (1-10, comma-separated)", value="5", placeholder="e.g., 4,6,8")
-        data_skews = gr.Textbox(label="Data Skews (1-10, comma-separated)", value="5", placeholder="e.g., 2,5,9")
+        with gr.Row():
+            join_complexities = gr.Textbox(label="Join Complexities (1-10, comma-separated)", value="5", placeholder="e.g., 5,7,3")
+            transformation_complexities = gr.Textbox(label="Transformation Complexities (1-10, comma-separated)", value="5", placeholder="e.g., 4,6,8")
+            data_skews = gr.Textbox(label="Data Skews (1-10, comma-separated)", value="5", placeholder="e.g., 2,5,9")
         
-    gr.Markdown("Data Skew Explanation: 1 = Evenly distributed, 10 = Highly skewed")
+        gr.Markdown("Data Skew Explanation: 1 = Evenly distributed, 10 = Highly skewed")
     
-    # Checkbox options for job configuration
-    with gr.Row():
-        use_spot_instances = gr.Checkbox(label="Use Spot Instances")
-        sla_requirements = gr.Checkbox(label="Strict SLA Requirements")
-        enable_auto_termination = gr.Checkbox(label="Enable Auto-termination")
+        # Checkbox options for job configuration
+        with gr.Row():
+            use_spot_instances = gr.Checkbox(label="Use Spot Instances")
+            sla_requirements = gr.Checkbox(label="Strict SLA Requirements")
+            enable_auto_termination = gr.Checkbox(label="Enable Auto-termination")
         
-    with gr.Row():
-        recency = gr.Slider(0, 10, step=1, value=5, label="Data Recency (0-10)")
-        frequency = gr.Slider(0, 10, step=1, value=5, label="Update Frequency (0-10)")
+        with gr.Row():
+            recency = gr.Slider(0, 10, step=1, value=5, label="Data Recency (0-10)")
+            frequency = gr.Slider(0, 10, step=1, value=5, label="Update Frequency (0-10)")
     
-    # Workload type selection
-    workload_type = gr.Radio(["General", "ML/High Memory", "Streaming/ELT", "Data Caching/Analysis"], value="General", label="Workload Type")
+        # Workload type selection
+        workload_type = gr.Radio(["General", "ML/High Memory", "Streaming/ELT", "Data Caching/Analysis"], value="General", label="Workload Type")
     
-    submit_button = gr.Button("Get Recommendations")
-    output = gr.Textbox(label="Recommendations")
+        submit_button = gr.Button("Get Recommendations")
+        output = gr.Textbox(label="Recommendations")
+        recommendation_state = gr.State()
 
-    # Spark Code Generation tab
-    with gr.Tab("Spark Code Generation"):
-        gr.Markdown("Define tables, joins, predicates, and transformations to generate complex Spark code")
+        # Spark Code Generation tab
+        with gr.Tab("Spark Code Generation"):
+            gr.Markdown("Define tables, joins, predicates, and transformations to generate complex Spark code")
         
-        # Table definition components
-        tables_json = gr.JSON(label="Tables", value=[{"name": "", "schema": "", "alias": "", "predicate": ""}])
+            # Table definition components
+            tables_json = gr.JSON(label="Tables", value=[{"name": "", "schema": "", "alias": "", "predicate": ""}])
         
-        with gr.Row():
-            add_table_name = gr.Textbox(label="Table Name")
-            add_table_schema = gr.Textbox(label="Schema")
-            add_table_alias = gr.Textbox(label="Alias")
-            add_table_predicate = gr.Textbox(label="Table Predicate")
-            add_table_button = gr.Button("Add Table")
+            with gr.Row():
+                add_table_name = gr.Textbox(label="Table Name")
+                add_table_schema = gr.Textbox(label="Schema")
+                add_table_alias = gr.Textbox(label="Alias")
+                add_table_predicate = gr.Textbox(label="Table Predicate")
+                add_table_size = gr.Textbox(label="Size (GB, optional)")
+                add_table_rows = gr.Textbox(label="Row Count (optional)")
+                add_table_watermark = gr.Textbox(label="Watermark Column (optional, for incremental loads)")
+                add_table_stream = gr.Checkbox(label="Stream (read with readStream in streaming jobs)")
+                add_table_button = gr.Button("Add Table")
+
+            with gr.Row():
+                warehouse_path = gr.Textbox(label="Warehouse Path (<schema>/<table> Parquet or ORC)", value=DEFAULT_WAREHOUSE_PATH)
+                collect_stats_button = gr.Button("Collect Table Stats")
+            table_stats_output = gr.Textbox(label="Table Stats")
         
-        # Join definition components
-        joins_json = gr.JSON(label="Joins", value=[])
+            # Join definition components
+            joins_json = gr.JSON(label="Joins", value=[])
         
-        join_components = []
-        for i in range(4):
-            with gr.Row():
-                if i == 0:
-                    join_components.extend([
-                        gr.Dropdown(label=f"Left Table/Subquery {i+1}", choices=[], interactive=True),
-                        gr.Dropdown(label=f"Join Type {i+1}", choices=['inner', 'left', 'right', 'full', 'subquery', 'self'], interactive=True),
-                        gr.Dropdown(label=f"Right Table {i+1}", choices=[], interactive=True),
-                        gr.Textbox(label=f"Join Condition {i+1}", placeholder="e.g., table1.id == table2.id"),
-                        gr.Textbox(label=f"Subquery {i+1}", placeholder="SELECT * FROM ..."),
-                        gr.Textbox(label=f"Left Alias {i+1} (for self-join)", placeholder="t1"),
-                        gr.Textbox(label=f"Right Alias {i+1} (for self-join)", placeholder="t2")
-                    ])
-                else:
-                    join_components.extend([
-                        gr.Dropdown(label=f"Left Table/Subquery {i+1}", choices=[], interactive=False),
-                        gr.Dropdown(label=f"Join Type {i+1}", choices=['inner', 'left', 'right', 'full', 'subquery', 'self'], interactive=False),
-                        gr.Dropdown(label=f"Right Table {i+1}", choices=[], interactive=False),
-                        gr.Textbox(label=f"Join Condition {i+1}", interactive=False),
-                        gr.Textbox(label=f"Subquery {i+1}", interactive=False),
-                        gr.Textbox(label=f"Left Alias {i+1} (for self-join)", interactive=False),
-                        gr.Textbox(label=f"Right Alias {i+1} (for self-join)", interactive=False)
-                    ])
+            join_components = []
+            for i in range(4):
+                with gr.Row():
+                    if i == 0:
+                        join_components.extend([
+                            gr.Dropdown(label=f"Left Table/Subquery {i+1}", choices=[], interactive=True),
+                            gr.Dropdown(label=f"Join Type {i+1}", choices=['inner', 'left', 'right', 'full', 'subquery', 'self'], interactive=True),
+                            gr.Dropdown(label=f"Right Table {i+1}", choices=[], interactive=True),
+                            gr.Textbox(label=f"Join Condition {i+1}", placeholder="e.g., table1.id == table2.id"),
+                            gr.Textbox(label=f"Subquery {i+1}", placeholder="SELECT * FROM ..."),
+                            gr.Textbox(label=f"Left Alias {i+1} (for self-join)", placeholder="t1"),
+                            gr.Textbox(label=f"Right Alias {i+1} (for self-join)", placeholder="t2")
+                        ])
+                    else:
+                        join_components.extend([
+                            gr.Dropdown(label=f"Left Table/Subquery {i+1}", choices=[], interactive=False),
+                            gr.Dropdown(label=f"Join Type {i+1}", choices=['inner', 'left', 'right', 'full', 'subquery', 'self'], interactive=False),
+                            gr.Dropdown(label=f"Right Table {i+1}", choices=[], interactive=False),
+                            gr.Textbox(label=f"Join Condition {i+1}", interactive=False),
+                            gr.Textbox(label=f"Subquery {i+1}", interactive=False),
+                            gr.Textbox(label=f"Left Alias {i+1} (for self-join)", interactive=False),
+                            gr.Textbox(label=f"Right Alias {i+1} (for self-join)", interactive=False)
+                        ])
                     
 
-        add_join_button = gr.Button("Add Join")
+            add_join_button = gr.Button("Add Join")
         
-        # Predicate and transformation components
-        predicates = gr.Textbox(label="Global Predicates", placeholder="e.g., column > 5 AND other_column != 'value'")
+            # Predicate and transformation components
+            predicates = gr.Textbox(label="Global Predicates", placeholder="e.g., column > 5 AND other_column != 'value'")
         
-        transformations_json = gr.JSON(label="Transformations", value=[])
+            transformations_json = gr.JSON(label="Transformations", value=[])
         
-        with gr.Row():
-            add_transformation_output = gr.Textbox(label="Output Column")
-            add_transformation_expression = gr.Textbox(label="Transformation Expression")
-            add_transformation_button = gr.Button("Add Transformation")
+            with gr.Row():
+                add_transformation_output = gr.Textbox(label="Output Column")
+                add_transformation_expression = gr.Textbox(label="Transformation Expression")
+                add_transformation_button = gr.Button("Add Transformation")
             
-        # Partition and output components
-        with gr.Row():
-            partition_columns = gr.Textbox(label="Partition Columns (comma-separated)")
-            partition_values = gr.Textbox(label="Partition Values (comma-separated)")
+            # Partition and output components
+            with gr.Row():
+                partition_columns = gr.Textbox(label="Partition Columns (comma-separated)")
+                partition_values = gr.Textbox(label="Partition Values (comma-separated)")
         
-        with gr.Row():
-            output_table = gr.Textbox(label="Output Table Name")
-            output_schema = gr.Textbox(label="Output Schema")
-            write_mode = gr.Dropdown(label="Write Mode", choices=["overwrite", "append"], value="overwrite")
+            with gr.Row():
+                output_table = gr.Textbox(label="Output Table Name")
+                output_schema = gr.Textbox(label="Output Schema")
+                write_mode = gr.Dropdown(label="Write Mode", choices=["overwrite", "append"], value="overwrite")
         
-        # Code generation and parameter management components
-        generate_code_button = gr.Button("Generate Spark Code")
-        spark_code_output = gr.Code(language="python", label="Generated Spark Code")
+            with gr.Row():
+                broadcast_threshold = gr.Number(label="Broadcast Threshold (MB)", value=DEFAULT_BROADCAST_THRESHOLD_MB)
+                target_file_size = gr.Slider(0, 1024, step=32, value=DEFAULT_TARGET_FILE_SIZE_MB, label="Target Output File Size (MB, 0 = off)")
+                max_records_per_file = gr.Number(label="Max Records per File (0 = auto)", value=0)
+
+            with gr.Row():
+                production_mode = gr.Checkbox(label="Production Mode (no debug actions, persist reused DataFrames)")
+                storage_level = gr.Dropdown(label="Storage Level", choices=list(STORAGE_LEVELS), value="MEMORY_AND_DISK")
+
+            with gr.Row():
+                load_mode = gr.Dropdown(label="Load Mode (auto = as recommended)", choices=list(LOAD_MODES), value="auto")
+                merge_keys = gr.Textbox(label="Merge Keys (comma-separated, upsert incremental loads)")
+
+            with gr.Row():
+                streaming = gr.Dropdown(label="Streaming (auto = for Streaming/ELT workloads)", choices=list(STREAMING_MODES), value="auto")
+                trigger_interval = gr.Textbox(label="Trigger Interval (empty = once over available data)", value=DEFAULT_TRIGGER_INTERVAL)
+                stream_source = gr.Dropdown(label="Stream Source", choices=list(STREAM_SOURCES), value="table")
+
+            # Code generation and parameter management components
+            generate_code_button = gr.Button("Generate Spark Code")
+            spark_code_output = gr.Code(language="python", label="Generated Spark Code")
         
-        with gr.Row():
-            job_name = gr.Textbox(label="Job Name (optional)")
-            save_button = gr.Button("Save Parameters")
-            load_dropdown = gr.Dropdown(label="Load Parameters", choices=list_parameter_files())
-            load_button = gr.Button("Load Selected Parameters")
-            status_message = gr.Textbox(label="Status")
+            with gr.Row():
+                job_name = gr.Textbox(label="Job Name (optional)")
+                save_button = gr.Button("Save Parameters")
+                load_dropdown = gr.Dropdown(label="Load Parameters", choices=saved_job_choices(parameter_store))
+                load_version = gr.Number(label="Version (0 = latest)", value=0, precision=0)
+                load_button = gr.Button("Load Selected Parameters")
+                status_message = gr.Textbox(label="Status")
 
-        with gr.Row():
-            clear_tables_button = gr.Button("Clear Tables")
-            clear_joins_button = gr.Button("Clear Joins")
-
-    # Dynamic update of workload type
-    num_tables.change(determine_workload_type, inputs=[num_tables, table_sizes, join_complexities, transformation_complexities, data_skews, recency, frequency], outputs=workload_type)
-    table_sizes.change(determine_workload_type, inputs=[num_tables, table_sizes, join_complexities, transformation_complexities, data_skews, recency, frequency], outputs=workload_type)
-    join_complexities.change(determine_workload_type, inputs=[num_tables, table_sizes, join_complexities, transformation_complexities, data_skews, recency, frequency], outputs=workload_type)
-    transformation_complexities.change(determine_workload_type, inputs=[num_tables, table_sizes, join_complexities, transformation_complexities, data_skews, recency, frequency], outputs=workload_type)
-    data_skews.change(determine_workload_type, inputs=[num_tables, table_sizes, join_complexities, transformation_complexities, data_skews, recency, frequency], outputs=workload_type)
-    recency.change(determine_workload_type, inputs=[num_tables, table_sizes, join_complexities, transformation_complexities, data_skews, recency, frequency], outputs=workload_type)
-    frequency.change(determine_workload_type, inputs=[num_tables, table_sizes, join_complexities, transformation_complexities, data_skews, recency, frequency], outputs=workload_type)
-
-
-    # Submit button action
-    submit_button.click(
-        recommend_resources,
-        inputs=[num_tables, table_sizes, join_complexities, transformation_complexities, 
-                data_skews, use_spot_instances, sla_requirements, 
-                workload_type, enable_auto_termination, recency, frequency],
-        outputs=output
-    )
-
-    # Add table button action
-    def add_table(tables, name, schema, alias, predicate):
-        """
-        Add a new table to the tables JSON.
-        """
-        if isinstance(tables, str):
-            tables = json.loads(tables)
-        tables.append({"name": name, "schema": schema, "alias": alias, "predicate": predicate})
-        return json.dumps(tables), "", "", "", ""
-
-    add_table_button.click(
-        add_table,
-        inputs=[tables_json, add_table_name, add_table_schema, add_table_alias, add_table_predicate],
-        outputs=[tables_json, add_table_name, add_table_schema, add_table_alias, add_table_predicate]
-    )
-
-    # Update dropdowns when tables are added
-    tables_json.change(
-        update_tables,
-        inputs=[tables_json],
-        outputs=[comp for comp in join_components if isinstance(comp, gr.Dropdown) and comp.label.startswith(("Left Table/Subquery", "Right Table"))] # Update all left and right table dropdowns
-    )
+            with gr.Row():
+                job_search = gr.Textbox(label="Search Saved Jobs (table, schema or output table)")
+                job_page = gr.Number(label="Page", value=1, precision=0)
+
+            with gr.Row():
+                clear_tables_button = gr.Button("Clear Tables")
+                clear_joins_button = gr.Button("Clear Joins")
+
+        # Dynamic update of workload type
+        workload_inputs = [num_tables, table_sizes, join_complexities, transformation_complexities, data_skews, recency, frequency]
+        for workload_input in workload_inputs:
+            workload_input.change(update_workload_type, inputs=workload_inputs, outputs=workload_type)
+
+
+        # Submit button action
+        submit_button.click(
+            recommend_handler,
+            inputs=[num_tables, table_sizes, join_complexities, transformation_complexities, 
+                    data_skews, use_spot_instances, sla_requirements, 
+                    workload_type, enable_auto_termination, recency, frequency],
+            outputs=[output, recommendation_state]
+        )
+
+        # Add table button action
+        def add_table(tables, name, schema, alias, predicate, size_gb, rows, watermark_column, stream):
+            """
+            Add a new table to the tables JSON.
+            """
+            if isinstance(tables, str):
+                tables = json.loads(tables)
+            table = {"name": name, "schema": schema, "alias": alias, "predicate": predicate}
+            if size_gb:
+                table["size_gb"] = float(size_gb)
+            if rows:
+                table["rows"] = int(float(rows))
+            if watermark_column:
+                table["watermark_column"] = watermark_column
+            if stream:
+                table["stream"] = True
+            tables.append(table)
+            return json.dumps(tables), "", "", "", "", "", "", "", False
+
+        add_table_button.click(
+            add_table,
+            inputs=[tables_json, add_table_name, add_table_schema, add_table_alias, add_table_predicate, add_table_size, add_table_rows, add_table_watermark,
+                    add_table_stream],
+            outputs=[tables_json, add_table_name, add_table_schema, add_table_alias, add_table_predicate, add_table_size, add_table_rows, add_table_watermark,
+                     add_table_stream]
+        )
+
+        collect_stats_button.click(
+            collect_table_sizes,
+            inputs=[tables_json, warehouse_path],
+            outputs=[tables_json, table_sizes, num_tables, table_stats_output]
+        )
+
+        # Update dropdowns when tables are added
+        tables_json.change(
+            update_tables,
+            inputs=[tables_json],
+            outputs=[comp for comp in join_components if isinstance(comp, gr.Dropdown) and comp.label.startswith(("Left Table/Subquery", "Right Table"))] # Update all left and right table dropdowns
+        )
     
-    joins_json.change(
-        update_joins,
-        inputs=[tables_json, joins_json],
-        outputs=join_components
-    )
-
-    # Add join button action
-    def add_join(joins, *join_inputs):
-        """
-        Add a new join to the joins JSON.
-        """
-        if isinstance(joins, str):
-            joins = json.loads(joins)
-        new_join = {
-            "left_table": join_inputs[0],
-            "type": join_inputs[1],
-            "right_table": join_inputs[2],
-            "conditions": join_inputs[3]
-        }
-        if new_join not in joins:
-            joins.append(new_join)
-        return json.dumps(joins)
-
-    add_join_button.click(
-        add_join,
-        inputs=[joins_json] + join_components[:4],  # Only use the first set of join inputs
-        outputs=[joins_json]
-    )
+        joins_json.change(
+            update_joins,
+            inputs=[tables_json, joins_json],
+            outputs=join_components
+        )
+
+        # Add join button action
+        def add_join(joins, *join_inputs):
+            """
+            Add a new join to the joins JSON.
+            """
+            if isinstance(joins, str):
+                joins = json.loads(joins)
+            new_join = {
+                "left_table": join_inputs[0],
+                "type": join_inputs[1],
+                "right_table": join_inputs[2],
+                "conditions": join_inputs[3]
+            }
+            if new_join not in joins:
+                joins.append(new_join)
+            return json.dumps(joins)
+
+        add_join_button.click(
+            add_join,
+            inputs=[joins_json] + join_components[:4],  # Only use the first set of join inputs
+            outputs=[joins_json]
+        )
     
-    # Add transformation button action
-    def add_transformation(transformations, output_column, expression):
-        """
-        Add a new transformation to the transformations JSON.
-        """
-        if isinstance(transformations, str):
-            transformations = json.loads(transformations)
-        transformations.append({"output_column": output_column, "expression": expression})
-        return json.dumps(transformations), "", ""
-
-    add_transformation_button.click(
-        add_transformation,
-        inputs=[transformations_json, add_transformation_output, add_transformation_expression],
-        outputs=[transformations_json, add_transformation_output, add_transformation_expression]
-    )
-
-    # Generate code button action
+        # Add transformation button action
+        def add_transformation(transformations, output_column, expression):
+            """
+            Add a new transformation to the transformations JSON.
+            """
+            if isinstance(transformations, str):
+                transformations = json.loads(transformations)
+            transformations.append({"output_column": output_column, "expression": expression})
+            return json.dumps(transformations), "", ""
+
+        add_transformation_button.click(
+            add_transformation,
+            inputs=[transformations_json, add_transformation_output, add_transformation_expression],
+            outputs=[transformations_json, add_transformation_output, add_transformation_expression]
+        )
+
+        # Generate code button action
+        generate_code_button.click(
+            generate_handler,
+            inputs=[tables_json, joins_json, predicates, recommendation_state, output_table, output_schema, transformations_json, write_mode, partition_columns, partition_values,
+                    table_sizes, data_skews, broadcast_threshold, target_file_size, max_records_per_file, production_mode, storage_level,
+                    load_mode, merge_keys, streaming, trigger_interval, stream_source],
+            outputs=[spark_code_output]
+        )
     
-    def generate_code_with_recommendations(tables, joins, predicates, recommendations, output_table, output_schema, transformations, write_mode, partition_columns, partition_values):
-        """
-        Generate Spark code based on the provided parameters and recommendations.
-        """
-        logging.debug(f"generate_code_with_recommendations inputs: tables={tables}, joins={joins}, predicates={predicates}, recommendations={recommendations}")
-        
-        if isinstance(tables, str):
-            tables = json.loads(tables)
-        if isinstance(joins, str):
-            joins = json.loads(joins)
-        if isinstance(transformations, str):
-            transformations = json.loads(transformations)
-        
-        # Handle recommendations parsing
-        if isinstance(recommendations, str):
+        def save_job(tables, joins, predicates, output_table, output_schema, transformations, job_name, write_mode, partition_columns, partition_values, search, page):
+            """
+            Save the parameters as the next version of the job and refresh the job list.
+            """
+            job_name = job_name or f"saved_parameters_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            params = {
+                "tables": tables,
+                "joins": joins,
+                "predicates": predicates,
+                "transformations": transformations,
+                "output_table": output_table,
+                "output_schema": output_schema,
+                "write_mode": write_mode,
+                "partition_columns": partition_columns,
+                "partition_values": partition_values
+            }
+            version, created = parameter_store.save(job_name, params)
+            status = f"Parameters saved as {job_name} version {version}" if created else f"{job_name} version {version} already has these parameters"
+            return status, gr.update(choices=saved_job_choices(parameter_store, search, page))
+
+        def load_job(job_name, version):
+            """
+            Load a saved job (latest version unless one is given) into the editors.
+            """
             try:
-                recommendations = json.loads(recommendations)
-            except json.JSONDecodeError:
-                # If recommendations is not valid JSON, extract spark configs
-                spark_configs = []
-                for line in recommendations.split('\n'):
-                    if line.strip().startswith('spark.'):
-                        spark_configs.append(line.strip())
-                recommendations = {"spark_configs": spark_configs}
-
-        spark_configs = "\n".join([f"spark = spark.config('{config.split('=')[0].strip()}', '{config.split('=')[1].strip()}')" for config in recommendations.get("spark_configs", [])])
-        return generate_spark_code(json.dumps(tables), json.dumps(joins), predicates, spark_configs, output_table, output_schema, json.dumps(transformations), write_mode, partition_columns, partition_values)
-
-    generate_code_button.click(
-        generate_code_with_recommendations,
-        inputs=[tables_json, joins_json, predicates, output, output_table, output_schema, transformations_json, write_mode, partition_columns, partition_values],
-        outputs=[spark_code_output]
-    )
+                params = parameter_store.load(job_name, int(version) if version else None)
+            except KeyError:
+                return [gr.update()] * 9 + [f"{job_name} not found."]
+            return (
+                params["tables"],
+                params["joins"],
+                params["predicates"],
+                params["transformations"],
+                params["output_table"],
+                params["output_schema"],
+                params["write_mode"],
+                params["partition_columns"],
+                params["partition_values"],
+                f"Parameters loaded from {job_name}" + (f" version {int(version)}" if version else ""),
+            )
+
+        save_button.click(
+            save_job,
+            inputs=[tables_json, joins_json, predicates, output_table,  output_schema, transformations_json, job_name, write_mode, partition_columns, partition_values,
+                    job_search, job_page],
+            outputs=[status_message, load_dropdown]
+        )
+
+        load_event = load_button.click(
+            load_job,
+            inputs=[load_dropdown, load_version],
+            outputs=[tables_json, joins_json, predicates, transformations_json, output_table, output_schema, write_mode, partition_columns, partition_values, status_message]
+        )
+
+        # Search and page through the saved jobs
+        for job_list_input in (job_search, job_page):
+            job_list_input.change(lambda search, page: gr.update(choices=saved_job_choices(parameter_store, search, page)),
+                                  inputs=[job_search, job_page], outputs=[load_dropdown])
+
+        def clear_tables():
+            """
+            Clear all tables from the tables JSON.
+            """
+            return json.dumps([])
+
+        clear_tables_button.click(
+            clear_tables,
+            outputs=[tables_json]
+        )
+
+        def clear_joins():
+            """
+            Clear all joins from the joins JSON.
+            """
+            return json.dumps([])
+
+        clear_joins_button.click(
+            clear_joins,
+            outputs=[joins_json]
+        )
     
-    # Add new button actions
-    save_button.click(
-        save_parameters,
-        inputs=[tables_json, joins_json, predicates, output_table,  output_schema, transformations_json, job_name, write_mode, partition_columns, partition_values],
-        outputs=[status_message]
-    )
-
-    load_button.click(
-        load_parameters,
-        inputs=[load_dropdown],
-        outputs=[tables_json, joins_json, predicates, transformations_json, output_table, output_schema, status_message, write_mode, partition_columns, partition_values]
-    )
-    
-    # Update the list of saved parameter files
-    save_button.click(lambda: gr.update(choices=list_parameter_files()), outputs=[load_dropdown])
-
-    def clear_tables():
-        """
-        Clear all tables from the tables JSON.
-        """
-        return json.dumps([])
-
-    clear_tables_button.click(
-        clear_tables,
-        outputs=[tables_json]
-    )
-
-    def clear_joins():
-        """
-        Clear all joins from the joins JSON.
-        """
-        return json.dumps([])
-
-    clear_joins_button.click(
-        clear_joins,
-        outputs=[joins_json]
-    )
-    
-    # Update dropdowns when parameters are loaded
-    load_button.click(
-        update_tables,
-        inputs=[tables_json],
-        outputs=[comp for comp in join_components if isinstance(comp, gr.Dropdown) and comp.label.startswith(("Left Table/Subquery", "Right Table"))]
-    )
+        # Update dropdowns once the parameters are loaded
+        load_event.then(
+            update_tables,
+            inputs=[tables_json],
+            outputs=[comp for comp in join_components if isinstance(comp, gr.Dropdown) and comp.label.startswith(("Left Table/Subquery", "Right Table"))]
+        )
+
+        load_event.then(
+            update_joins,
+            inputs=[tables_json, joins_json],
+            outputs=join_components
+        )
 
-    load_button.click(
-        update_joins,
-        inputs=[tables_json, joins_json],
-        outputs=join_components
-    )
+    return iface
 
 
 # Launch the application
 if __name__ == "__main__":
-    iface.launch()
+    create_interface().launch()
@@ -0,0 +1,181 @@
+"""
+Offline calibration of the workload scoring rules from Spark event logs.
+
+    python -m cli calibrate --jobs runs.csv --output workload_model.json
+
+``runs.csv`` (or a JSON list) has the recommender inputs of past runs plus an
+``event_log`` column with the path of each run's event log, relative to the
+jobs file. Each log is summarized by ``spark_event_log`` and the run is
+labelled with the workload type its resource usage points to, unless the row
+already carries a ``workload_type``. The rules' weights and thresholds are then
+fitted to those labels by coordinate descent, starting from the current model,
+and the result is saved as the next version of the model file.
+"""
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from resource_recommender import _column, _columns, _job_stats, workload_features
+from spark_event_log import summarize_event_logs
+from workload_model import (
+    DEFAULT_MODEL_PATH,
+    FEATURES,
+    WORKLOAD_TYPES,
+    decide,
+    load_workload_model,
+    save_workload_model,
+)
+
+# Usage thresholds for labelling a run from its event log
+MEMORY_HEAVY_TASK_GB = 2.0  # Peak execution memory of the largest task
+SPILL_HEAVY_RATIO = 0.25  # Disk spill per input byte
+CPU_BOUND_SHARE = 0.6  # Executor CPU time per run time
+IO_BOUND_SHARE = 0.4
+SHUFFLE_HEAVY_RATIO = 1.5  # Shuffle read + write per input byte
+SHUFFLE_LIGHT_RATIO = 0.5
+
+# Candidate rule weights and General margins tried by the fit
+WEIGHT_CHOICES = (0, 1, 2, 3)
+MARGIN_CHOICES = (0, 1, 2, 3, 4)
+
+# Candidate thresholds are these quantiles of each feature over the training runs
+THRESHOLD_QUANTILES = np.linspace(0.05, 0.95, 19)
+
+MAX_PASSES = 5
+
+
+def usage_labels(usage):
+    """
+    Workload type per run from a DataFrame of ``spark_event_log.ResourceUsage``
+    rows: memory-heavy compute is ML/High Memory, heavy shuffling or spilling
+    without much CPU is Data Caching/Analysis, I/O-bound runs with little
+    shuffle are Streaming/ELT and everything else is General.
+    """
+    input_bytes = np.maximum(usage["input_bytes"].to_numpy(dtype=float), 1)
+    run_time = np.maximum(usage["executor_run_time"].to_numpy(dtype=float), 1e-9)
+    cpu_share = usage["executor_cpu_time"].to_numpy(dtype=float) / run_time
+    spill_ratio = usage["disk_bytes_spilled"].to_numpy(dtype=float) / input_bytes
+    shuffle_ratio = (usage["shuffle_read_bytes"].to_numpy(dtype=float) + usage["shuffle_write_bytes"].to_numpy(dtype=float)) / input_bytes
+    memory_heavy = (usage["peak_execution_memory"].to_numpy(dtype=float) / 1024 ** 3 >= MEMORY_HEAVY_TASK_GB) | (spill_ratio >= SPILL_HEAVY_RATIO)
+
+    labels = np.full(len(usage), "General", dtype=object)
+    labels[(cpu_share <= IO_BOUND_SHARE) & (shuffle_ratio <= SHUFFLE_LIGHT_RATIO)] = "Streaming/ELT"
+    labels[(shuffle_ratio >= SHUFFLE_HEAVY_RATIO) | (memory_heavy & (cpu_share < CPU_BOUND_SHARE))] = "Data Caching/Analysis"
+    labels[memory_heavy & (cpu_share >= CPU_BOUND_SHARE)] = "ML/High Memory"
+    return labels
+
+
+def _accuracy(scores, margin, labels):
+    return float((decide(scores, margin) == labels).mean())
+
+
+def fit_workload_model(features, labels, model=None):
+    """
+    Fit the weights and thresholds of ``model``'s rules (the current model by
+    default) to ``labels`` (WORKLOAD_TYPES indices). Each pass tries every
+    rule's weight and every one of its bounds at the candidate thresholds,
+    keeping a change only when it improves training accuracy; the General
+    margin is refitted after each pass.
+
+    Returns ``(model, accuracy)``; the model's metadata is left to the caller.
+    """
+    model = model or load_workload_model()
+    labels = np.asarray(labels)
+    rules = list(model.rules)
+    margin = model.margin
+    workload_columns = np.array([WORKLOAD_TYPES.index(rule.workload) for rule in rules])
+    candidates = {name: np.unique(np.quantile(features[name], THRESHOLD_QUANTILES)) for name in FEATURES}
+
+    matches = np.column_stack([rule.matches(features[rule.feature]) for rule in rules]).astype(float)
+    weights = np.array([rule.weight for rule in rules], dtype=float)
+    one_hot = np.eye(len(WORKLOAD_TYPES))[workload_columns]
+    scores = (matches * weights) @ one_hot
+    best = _accuracy(scores, margin, labels)
+
+    for _ in range(MAX_PASSES):
+        improved = False
+        for i, rule in enumerate(rules):
+            # Scores without this rule, then every variant of it added back
+            others = scores - np.outer(matches[:, i] * weights[i], one_hot[i])
+            variants = [(rule._replace(weight=weight), matches[:, i]) for weight in WEIGHT_CHOICES]
+            for bound in ("above", "at_least", "at_most"):
+                if getattr(rule, bound) is None:
+                    continue
+                for threshold in candidates[rule.feature]:
+                    variant = rule._replace(**{bound: float(threshold)})
+                    variants.append((variant, variant.matches(features[rule.feature]).astype(float)))
+            for variant, matched in variants:
+                trial = others + np.outer(matched * variant.weight, one_hot[i])
+                accuracy = _accuracy(trial, margin, labels)
+                if accuracy > best:
+                    best, improved = accuracy, True
+                    rules[i], matches[:, i], weights[i], rule = variant, matched, variant.weight, variant
+                    scores = trial
+        for choice in MARGIN_CHOICES:
+            accuracy = _accuracy(scores, choice, labels)
+            if accuracy > best:
+                best, margin, improved = accuracy, float(choice), True
+        if not improved:
+            break
+
+    return model._replace(rules=tuple(rules), margin=margin), best
+
+
+def _next_version(path):
+    """
+    One more than the version of the model file at ``path``, or 1.
+    """
+    try:
+        return str(int(load_workload_model(path).version) + 1)
+    except ValueError:
+        return "1"
+
+
+def calibrate(jobs, base_dir=".", output=DEFAULT_MODEL_PATH, workers=None):
+    """
+    Summarize the event logs of ``jobs`` (a DataFrame of recommender inputs
+    plus ``event_log``), fit the scoring rules to the usage labels and save
+    the model to ``output``. Returns ``(model, report)`` where the report
+    counts the runs per label and compares the old and new training accuracy.
+    Raises ValueError if there are no runs.
+    """
+    if len(jobs) == 0:
+        raise ValueError("No runs to calibrate on")
+    if "event_log" not in jobs:
+        raise ValueError("The jobs need an event_log column")
+    paths = [os.path.join(base_dir, path) for path in jobs["event_log"]]
+    usage = pd.DataFrame([usage._asdict() for usage in summarize_event_logs(paths, workers)])
+
+    labels = usage_labels(usage)
+    if "workload_type" in jobs:
+        assigned = jobs["workload_type"].to_numpy(dtype=object)
+        labels = np.where(pd.isna(assigned) | (assigned == ""), labels, assigned)
+    unknown = set(labels) - set(WORKLOAD_TYPES)
+    if unknown:
+        raise ValueError(f"Unknown workload types: {sorted(unknown)}")
+    label_indices = np.array([WORKLOAD_TYPES.index(label) for label in labels])
+
+    columns, num_rows = _columns(jobs.drop(columns=["event_log", "workload_type"], errors="ignore"))
+    num_tables, stats = _job_stats(columns, num_rows)
+    features = workload_features(num_tables, stats, _column(columns, "recency", num_rows, 5),
+                                 _column(columns, "frequency", num_rows, 5))
+
+    current = load_workload_model(output)
+    baseline = float((current.predict_indices(features) == label_indices).mean())
+    fitted, accuracy = fit_workload_model(features, label_indices, current)
+    model = fitted._replace(version=_next_version(output), metadata={
+        "fitted_at": datetime.now().isoformat(timespec="seconds"),
+        "based_on": current.version,
+        "training_runs": int(num_rows),
+        "training_accuracy": round(accuracy, 4),
+        "previous_accuracy": round(baseline, 4),
+    })
+    save_workload_model(model, output)
+    report = {
+        "labels": pd.Series(labels).value_counts().to_dict(),
+        "previous_accuracy": baseline,
+        "training_accuracy": accuracy,
+    }
+    return model, report
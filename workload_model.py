@@ -0,0 +1,184 @@
+"""
+Workload type scoring as a table of rules, and the versioned model file that
+holds them.
+
+Every rule adds its weight to one workload type's score when a job feature
+falls in the rule's range. The highest score wins, unless it leads the
+runner-up by no more than the model's margin, in which case the job is
+General. The hand-tuned rules below are used until ``python -m cli calibrate``
+fits new weights and thresholds from event logs and writes them to
+``workload_model.json`` (or ``WORKLOAD_MODEL_PATH``).
+"""
+from __future__ import annotations
+
+import functools
+import json
+import os
+from typing import NamedTuple
+
+import numpy as np
+
+DEFAULT_MODEL_PATH = os.environ.get(
+    "WORKLOAD_MODEL_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "workload_model.json"))
+
+WORKLOAD_TYPES = ["General", "ML/High Memory", "Streaming/ELT", "Data Caching/Analysis"]
+
+# Job features the rules can test; list columns contribute their mean, max and variance
+FEATURES = (
+    "num_tables",
+    "table_sizes.mean", "table_sizes.max", "table_sizes.var",
+    "join_complexities.mean", "join_complexities.max",
+    "transformation_complexities.mean", "transformation_complexities.max",
+    "data_skews.mean", "data_skews.max",
+    "recency", "frequency",
+)
+
+
+class Rule(NamedTuple):
+    """
+    Add ``weight`` to ``workload``'s score when ``feature`` is above ``above``,
+    at least ``at_least`` and at most ``at_most`` (unset bounds always hold).
+    """
+    workload: str
+    weight: float
+    feature: str
+    above: float | None = None
+    at_least: float | None = None
+    at_most: float | None = None
+
+    def matches(self, values):
+        matched = np.ones(len(values), dtype=bool)
+        if self.above is not None:
+            matched &= values > self.above
+        if self.at_least is not None:
+            matched &= values >= self.at_least
+        if self.at_most is not None:
+            matched &= values <= self.at_most
+        return matched
+
+
+# The recommender's original hand-tuned rules
+DEFAULT_RULES = (
+    # Number of tables
+    Rule("ML/High Memory", 2, "num_tables", at_most=5),
+    Rule("General", 1, "num_tables", at_most=5),
+    Rule("General", 2, "num_tables", above=5, at_most=15),
+    Rule("Data Caching/Analysis", 1, "num_tables", above=5, at_most=15),
+    Rule("Data Caching/Analysis", 1, "num_tables", above=15),
+    Rule("Streaming/ELT", 2, "num_tables", above=15),
+    # Data sizes (GB)
+    Rule("ML/High Memory", 2, "table_sizes.mean", above=500),
+    Rule("Data Caching/Analysis", 2, "table_sizes.mean", above=100, at_most=500),
+    Rule("Streaming/ELT", 1, "table_sizes.mean", at_most=100),
+    Rule("General", 1, "table_sizes.mean", at_most=100),
+    Rule("ML/High Memory", 1, "table_sizes.max", above=1000),
+    Rule("Data Caching/Analysis", 2, "table_sizes.var", above=10000),
+    # Join complexity
+    Rule("Data Caching/Analysis", 2, "join_complexities.mean", above=7),
+    Rule("General", 1, "join_complexities.mean", at_least=4, at_most=7),
+    Rule("Streaming/ELT", 1, "join_complexities.mean", at_least=4, at_most=7),
+    Rule("Data Caching/Analysis", 1, "join_complexities.max", above=8),
+    # Transformation complexity
+    Rule("ML/High Memory", 2, "transformation_complexities.mean", above=7),
+    Rule("Streaming/ELT", 2, "transformation_complexities.mean", at_least=4, at_most=7),
+    Rule("ML/High Memory", 1, "transformation_complexities.max", above=8),
+    # Data skew
+    Rule("Data Caching/Analysis", 2, "data_skews.mean", above=7),
+    Rule("Streaming/ELT", 1, "data_skews.mean", at_least=4, at_most=7),
+    Rule("Data Caching/Analysis", 1, "data_skews.max", above=8),
+    # Recency and frequency
+    Rule("Streaming/ELT", 2, "recency", above=7),
+    Rule("Data Caching/Analysis", 1, "recency", at_least=4, at_most=7),
+    Rule("Streaming/ELT", 2, "frequency", above=7),
+    Rule("Data Caching/Analysis", 1, "frequency", at_least=4, at_most=7),
+)
+
+# A winning score this close to the runner-up falls back to General
+DEFAULT_MARGIN = 2
+
+
+class WorkloadModel(NamedTuple):
+    """
+    Scoring rules plus the model file's ``version`` and fitting metadata
+    (training runs, accuracy, fit date).
+    """
+    version: str
+    rules: tuple[Rule, ...]
+    margin: float
+    metadata: dict
+
+    def scores(self, features):
+        """
+        (job, workload) score matrix, columns in WORKLOAD_TYPES order.
+        ``features`` maps each name in FEATURES to an array.
+        """
+        # All rules at once: a (job, rule) match matrix times a (rule, workload) weight matrix
+        names = sorted({rule.feature for rule in self.rules})
+        values = np.column_stack([np.asarray(features[name], dtype=float) for name in names])
+        values = values[:, [names.index(rule.feature) for rule in self.rules]]
+        above, at_least, at_most = np.array([
+            (-np.inf if rule.above is None else rule.above, -np.inf if rule.at_least is None else rule.at_least,
+             np.inf if rule.at_most is None else rule.at_most)
+            for rule in self.rules], dtype=float).T
+        matched = (values > above) & (values >= at_least) & (values <= at_most)
+        weights = np.zeros((len(self.rules), len(WORKLOAD_TYPES)))
+        weights[np.arange(len(self.rules)), [WORKLOAD_TYPES.index(rule.workload) for rule in self.rules]] = [rule.weight for rule in self.rules]
+        return matched @ weights
+
+    def predict_indices(self, features):
+        return decide(self.scores(features), self.margin)
+
+    def predict(self, features):
+        return np.asarray(WORKLOAD_TYPES, dtype=object)[self.predict_indices(features)]
+
+    def to_dict(self):
+        rules = [{key: value for key, value in rule._asdict().items() if value is not None} for rule in self.rules]
+        return {"version": self.version, "margin": self.margin, "rules": rules, **self.metadata}
+
+
+DEFAULT_MODEL = WorkloadModel("hand-tuned", DEFAULT_RULES, DEFAULT_MARGIN, {})
+
+
+def decide(scores, margin):
+    """
+    Index into WORKLOAD_TYPES of the highest score per row (first one on ties),
+    or General when it leads the runner-up by ``margin`` or less.
+    """
+    best = np.argmax(scores, axis=1)
+    ranked = np.sort(scores, axis=1)
+    return np.where(ranked[:, -1] - ranked[:, -2] <= margin, 0, best)
+
+
+def model_from_dict(data):
+    """
+    Build a WorkloadModel from a decoded model file. Raises ValueError if it
+    is malformed.
+    """
+    try:
+        rules = tuple(Rule(**rule) for rule in data["rules"])
+        metadata = {key: value for key, value in data.items() if key not in ("version", "margin", "rules")}
+        model = WorkloadModel(str(data["version"]), rules, float(data["margin"]), metadata)
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Invalid workload model: {e!r}")
+    for rule in model.rules:
+        if rule.workload not in WORKLOAD_TYPES or rule.feature not in FEATURES:
+            raise ValueError(f"Invalid workload model rule: {rule}")
+    return model
+
+
+@functools.lru_cache(maxsize=8)
+def load_workload_model(path=DEFAULT_MODEL_PATH):
+    """
+    The model file at ``path``, read once per path, or the hand-tuned rules
+    when there is no file. Raises ValueError if it is malformed.
+    """
+    if not os.path.exists(path):
+        return DEFAULT_MODEL
+    with open(path, "r") as f:
+        return model_from_dict(json.load(f))
+
+
+def save_workload_model(model, path=DEFAULT_MODEL_PATH):
+    with open(path, "w") as f:
+        json.dump(model.to_dict(), f, indent=2)
+    load_workload_model.cache_clear()